@@ -0,0 +1,461 @@
+"""Scrape the metadata of GitHub repositories using concurrent requests.
+
+This is an asynchronous alternative to //datasets/github/scrape_repos:scraper,
+which produces the same repository metafiles. The pages of search results for
+a query are fetched concurrently, within a request budget which is derived from
+the rate limit headers of the GitHub API responses. Progress through each query
+is recorded in a cursor file, so that an interrupted scrape resumes from where
+it stopped.
+"""
+import asyncio
+import os
+
+import aiohttp
+import humanize
+import math
+import pathlib
+import time
+import typing
+from absl import app
+from absl import flags
+from absl import logging
+from phd.lib.labm8 import labdate
+from phd.lib.labm8 import pbutil
+
+from datasets.github.scrape_repos import scraper
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string(
+    'github_api_url', 'https://api.github.com',
+    'The root URL of the GitHub API.')
+flags.DEFINE_integer(
+    'scraper_concurrency', 4,
+    'The maximum number of concurrent requests to the GitHub API.')
+
+# The number of search results requested per page. This is the maximum
+# permitted by the GitHub API.
+SEARCH_RESULTS_PER_PAGE = 100
+
+# GitHub only returns the first 1000 results of a search query.
+MAX_SEARCH_RESULTS = 1000
+
+# The number of seconds to wait past a rate limit reset time before making
+# requests, to allow for clock skew.
+RATE_LIMIT_RESET_SLACK_SECONDS = 1
+
+# The number of times to retry requests which fail with server errors.
+MAX_RETRIES = 5
+
+
+class GitHubApiError(Exception):
+  """Raised if a GitHub API request fails."""
+
+  def __init__(self, status: int, message: str):
+    super(GitHubApiError, self).__init__(f'HTTP {status}: {message}')
+    self.status = status
+
+
+class RateLimitBudget(object):
+  """A token bucket which spreads a rate limit over its window.
+
+  GitHub rate limits permit a number of requests until a reset time, which are
+  reported in the X-RateLimit-Remaining and X-RateLimit-Reset headers of every
+  response. Rather than spending the remaining requests in a burst and then
+  stalling until the reset time, tokens are refilled at the rate which spreads
+  the remaining requests evenly over the rest of the window, and at most burst
+  tokens may accumulate. Until a response has reported the rate limit, requests
+  are limited only by the burst size.
+  """
+
+  def __init__(self, burst: int,
+               clock: typing.Callable[[], float] = time.time,
+               sleep: typing.Callable[[float],
+                                      typing.Awaitable] = asyncio.sleep):
+    """Instantiate a budget.
+
+    Args:
+      burst: The maximum number of tokens.
+      clock: A function which returns the current time in seconds since the
+        epoch.
+      sleep: A coroutine function which sleeps for a number of seconds.
+    """
+    self.burst = burst
+    # The number of requests remaining until the reset time, or None if not
+    # known.
+    self.remaining: typing.Optional[int] = None
+    self.reset_time: typing.Optional[float] = None
+    # The time until which all requests are paused.
+    self.retry_time = 0.0
+    self._clock = clock
+    self._sleep = sleep
+    self._tokens = float(burst)
+    self._refill_time = clock()
+    # Created on first use, so that the lock belongs to the running event loop.
+    self._lock: typing.Optional[asyncio.Lock] = None
+
+  def Update(self, headers: typing.Mapping[str, str]) -> None:
+    """Update the budget from the rate limit headers of a response.
+
+    Args:
+      headers: The response headers.
+    """
+    try:
+      remaining = int(headers['X-RateLimit-Remaining'])
+      reset_time = float(headers['X-RateLimit-Reset'])
+    except (KeyError, ValueError):
+      return
+    if self.reset_time is None or reset_time > self.reset_time:
+      self.remaining = remaining
+      self.reset_time = reset_time
+    elif reset_time == self.reset_time:
+      # Responses may arrive out of order, so the lowest count within a window
+      # is the most recent.
+      self.remaining = min(self.remaining, remaining)
+
+  def Backoff(self, seconds: float) -> None:
+    """Pause all requests for a number of seconds.
+
+    Args:
+      seconds: The number of seconds to pause for.
+    """
+    self.retry_time = max(self.retry_time, self._clock() + seconds)
+
+  async def Acquire(self) -> None:
+    """Wait until a request may be made, and spend a token."""
+    if self._lock is None:
+      self._lock = asyncio.Lock()
+    async with self._lock:
+      delay = self._Refill()
+      while delay > 0:
+        logging.debug('Waiting %.1f seconds for GitHub rate limit', delay)
+        await self._sleep(delay)
+        delay = self._Refill()
+      self._tokens -= 1
+      if self.remaining is not None:
+        self.remaining -= 1
+
+  def _Refill(self) -> float:
+    """Refill the bucket, and return the number of seconds until a token."""
+    now = self._clock()
+    if now < self.retry_time:
+      return self.retry_time - now
+    if self.reset_time is not None and now >= self.reset_time:
+      # The limit has reset, and is unknown until the next response.
+      self.remaining = None
+      self.reset_time = None
+    if self.remaining is None:
+      self._tokens = float(self.burst)
+      self._refill_time = now
+      return 0
+    if self.remaining <= 0:
+      return self.reset_time - now + RATE_LIMIT_RESET_SLACK_SECONDS
+    rate = self.remaining / (self.reset_time - now)
+    self._tokens = min(self.burst,
+                       self._tokens + (now - self._refill_time) * rate)
+    self._refill_time = now
+    if self._tokens >= 1:
+      return 0
+    return (1 - self._tokens) / rate
+
+
+class GitHubApiClient(object):
+  """An asynchronous client for the GitHub REST API."""
+
+  def __init__(self, session: aiohttp.ClientSession, api_url: str,
+               burst: int):
+    """Instantiate a client.
+
+    Args:
+      session: The HTTP session to make requests with.
+      api_url: The root URL of the GitHub API.
+      burst: The maximum number of requests to make in a burst.
+    """
+    self.session = session
+    self.api_url = api_url.rstrip('/')
+    # Search requests have a separate, lower, rate limit than other requests.
+    self.budgets = {
+      'search': RateLimitBudget(burst),
+      'core': RateLimitBudget(burst),
+    }
+
+  async def Get(self, path: str, params: typing.Optional[
+    typing.Dict[str, typing.Any]] = None) -> typing.Dict[str, typing.Any]:
+    """Make a GET request.
+
+    Requests which exceed a rate limit are retried once the limit allows.
+    Requests which fail with a server error are retried up to MAX_RETRIES
+    times, with exponential backoff.
+
+    Args:
+      path: The API path, e.g. '/search/repositories'.
+      params: The query parameters.
+
+    Returns:
+      The decoded JSON response.
+
+    Raises:
+      GitHubApiError: If the request fails.
+    """
+    budget = self.budgets['search' if path.startswith('/search/') else 'core']
+    num_retries = 0
+    while True:
+      await budget.Acquire()
+      async with self.session.get(self.api_url + path,
+                                  params=params) as response:
+        budget.Update(response.headers)
+        if response.status == 200:
+          return await response.json()
+        message = await response.text()
+      if response.status in {403, 429}:
+        if 'Retry-After' in response.headers:
+          # A secondary rate limit.
+          budget.Backoff(float(response.headers['Retry-After']))
+          continue
+        if response.headers.get('X-RateLimit-Remaining') == '0':
+          continue
+      if response.status >= 500 and num_retries < MAX_RETRIES:
+        logging.debug('Retrying %s on HTTP %d', path, response.status)
+        budget.Backoff(2 ** num_retries)
+        num_retries += 1
+        continue
+      raise GitHubApiError(response.status, message)
+
+
+def GetRepositoryMetadata(
+    item: typing.Dict[str, typing.Any]) -> scrape_repos_pb2.GitHubRepoMetadata:
+  """Get the metadata of a GitHub repository.
+
+  Args:
+    item: A repository, as returned by the GitHub API.
+
+  Returns:
+    A GitHubRepoMetadata instance.
+  """
+  return scrape_repos_pb2.GitHubRepoMetadata(
+      scraped_utc_epoch_ms=labdate.MillisecondsTimestamp(
+          labdate.GetUtcMillisecondsNow()),
+      owner=item['owner']['login'],
+      name=item['name'],
+      num_watchers=item['watchers_count'],
+      num_forks=item['forks_count'],
+      num_stars=item['stargazers_count'],
+      clone_from_url=item['clone_url'],
+  )
+
+
+def GetCursorPath(language: scrape_repos_pb2.LanguageToClone) -> pathlib.Path:
+  """Return the path of the cursor file for a language."""
+  return pathlib.Path(language.destination_directory + '.scrape_cursor.pbtxt')
+
+
+def ReadCursor(path: pathlib.Path) -> scrape_repos_pb2.LanguageScrapeCursor:
+  """Read a cursor file, or return an empty cursor if there is none."""
+  cursor = scrape_repos_pb2.LanguageScrapeCursor()
+  if pbutil.ProtoIsReadable(path, cursor):
+    pbutil.FromFile(path, cursor)
+  return cursor
+
+
+def WriteCursor(cursor: scrape_repos_pb2.LanguageScrapeCursor,
+                path: pathlib.Path) -> None:
+  """Atomically write a cursor file."""
+  tmp_path = path.parent / f'.{path.name}.tmp'
+  pbutil.ToFile(cursor, tmp_path, assume_filename=path)
+  os.replace(tmp_path, path)
+
+
+class QueryScraper(object):
+  """Scrape repository metadata from the results of a GitHub search query.
+
+  The first page of results is fetched to determine the number of pages, and
+  the remaining pages are then fetched concurrently. The cursor is advanced as
+  each contiguous run of pages is processed.
+  """
+
+  def __init__(self, client: GitHubApiClient,
+               language: scrape_repos_pb2.LanguageToClone,
+               query: scrape_repos_pb2.GitHubRepositoryQuery,
+               cursor: scrape_repos_pb2.GitHubRepositoryQueryCursor,
+               save_cursor: typing.Callable[[], None],
+               concurrency: int):
+    """Instantiate a QueryScraper.
+
+    Args:
+      client: The GitHub API client.
+      language: The language to scrape.
+      query: The query to run.
+      cursor: The progress through the query, which is updated in place.
+      save_cursor: A callback which persists the cursor.
+      concurrency: The maximum number of pages to fetch concurrently.
+    """
+    self.client = client
+    self.repo_query = query
+    self.destination_directory = pathlib.Path(language.destination_directory)
+    self.cursor = cursor
+    self.save_cursor = save_cursor
+    self.max_results = min(query.max_results, MAX_SEARCH_RESULTS)
+    self._semaphore = asyncio.Semaphore(concurrency)
+    # A map of processed pages ahead of the cursor to their result counts.
+    self._processed_pages: typing.Dict[int, int] = {}
+
+  async def Run(self) -> None:
+    """Scrape the query."""
+    if self.cursor.done:
+      return
+    self.destination_directory.mkdir(parents=True, exist_ok=True)
+    total_count = await self.ProcessPage(self.cursor.next_page)
+    num_pages = math.ceil(
+        min(total_count, self.max_results) / SEARCH_RESULTS_PER_PAGE)
+    await asyncio.gather(*[
+      self.ProcessPage(page)
+      for page in range(self.cursor.next_page, num_pages + 1)])
+    self.cursor.done = True
+    self.save_cursor()
+
+  async def ProcessPage(self, page: int) -> int:
+    """Fetch a page of results and write the metafiles of its repositories.
+
+    Args:
+      page: The page number.
+
+    Returns:
+      The total number of results of the query, as reported by the page.
+    """
+    async with self._semaphore:
+      logging.debug('Requesting page %d of %s', page, self.repo_query.string)
+      try:
+        results = await self.client.Get('/search/repositories', {
+          'q': self.repo_query.string,
+          'page': str(page),
+          'per_page': str(SEARCH_RESULTS_PER_PAGE),
+        })
+      except GitHubApiError as e:
+        if e.status != 422:
+          raise
+        # GitHub refuses to return pages beyond the first 1000 results of a
+        # query, or when the query is invalid.
+        logging.warning("Page %d of query '%s' failed: %s", page,
+                        self.repo_query.string, e)
+        results = {'total_count': 0, 'items': []}
+    num_remaining = self.max_results - (page - 1) * SEARCH_RESULTS_PER_PAGE
+    repos = results['items'][:max(num_remaining, 0)]
+    self.MakeRepositoryMetas(repos)
+    self._processed_pages[page] = len(repos)
+    self._AdvanceCursor()
+    return results['total_count']
+
+  def MakeRepositoryMetas(
+      self, repos: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Make meta files for a list of repositories.
+
+    Args:
+      repos: A list of repositories, as returned by the GitHub API.
+    """
+    for repo in repos:
+      concat_name = '_'.join([repo['owner']['login'], repo['name']])
+      meta_path = self.destination_directory / f'{concat_name}.pbtxt'
+      if not pbutil.ProtoIsReadable(meta_path,
+                                    scrape_repos_pb2.GitHubRepoMetadata()):
+        meta = GetRepositoryMetadata(repo)
+        logging.debug('%s', meta)
+        pbutil.ToFile(meta, meta_path)
+
+  def _AdvanceCursor(self) -> None:
+    """Move the cursor past the contiguous run of processed pages."""
+    if self.cursor.next_page not in self._processed_pages:
+      return
+    while self.cursor.next_page in self._processed_pages:
+      self.cursor.num_results += self._processed_pages.pop(
+          self.cursor.next_page)
+      self.cursor.next_page += 1
+    self.save_cursor()
+
+
+async def ScrapeLanguage(client: GitHubApiClient,
+                         language: scrape_repos_pb2.LanguageToClone,
+                         concurrency: int) -> None:
+  """Scrape the queries of a language, resuming from its cursor file.
+
+  Args:
+    client: The GitHub API client.
+    language: The language to scrape.
+    concurrency: The maximum number of pages to fetch concurrently.
+  """
+  cursor_path = GetCursorPath(language)
+  cursor_path.parent.mkdir(parents=True, exist_ok=True)
+  cursor = ReadCursor(cursor_path)
+  query_cursors = {c.query: c for c in cursor.query}
+  for query in language.query:
+    if query.string not in query_cursors:
+      query_cursors[query.string] = cursor.query.add(query=query.string)
+    query_cursor = query_cursors[query.string]
+    if query_cursor.done:
+      logging.info("Skipping scraped query '%s'", query.string)
+      continue
+    logging.info("Scraping query '%s' from page %d ...", query.string,
+                 query_cursor.next_page)
+    await QueryScraper(client, language, query, query_cursor,
+                       lambda: WriteCursor(cursor, cursor_path),
+                       concurrency).Run()
+    logging.info("Processed %s results of query '%s'",
+                 humanize.intcomma(query_cursor.num_results), query.string)
+
+
+async def ScrapeLanguages(clone_list: scrape_repos_pb2.LanguageCloneList,
+                          credentials: scrape_repos_pb2.GitHubCredentials,
+                          api_url: str, concurrency: int) -> None:
+  """Scrape the queries of all languages in a clone list.
+
+  Args:
+    clone_list: The languages to scrape.
+    credentials: The GitHub credentials to authenticate with.
+    api_url: The root URL of the GitHub API.
+    concurrency: The maximum number of concurrent requests.
+  """
+  headers = {'Accept': 'application/vnd.github.v3+json'}
+  auth = None
+  if credentials.HasField('token'):
+    headers['Authorization'] = f'token {credentials.token}'
+  elif credentials.HasField('username'):
+    auth = aiohttp.BasicAuth(credentials.username, credentials.password)
+  async with aiohttp.ClientSession(auth=auth, headers=headers) as session:
+    client = GitHubApiClient(session, api_url, concurrency)
+    for language in clone_list.language:
+      logging.info('Scraping %s repos using %s queries ...',
+                   language.language, humanize.intcomma(len(language.query)))
+      await ScrapeLanguage(client, language, concurrency)
+
+
+def main(argv) -> None:
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  clone_list_path = pathlib.Path(FLAGS.clone_list or "")
+  if not clone_list_path.is_file():
+    raise app.UsageError('--clone_list is not a file.')
+
+  clone_list = pbutil.FromFile(clone_list_path,
+                               scrape_repos_pb2.LanguageCloneList())
+  credentials = scraper.ReadGitHubCredentials(
+      pathlib.Path(FLAGS.github_credentials_path).expanduser())
+
+  loop = asyncio.new_event_loop()
+  try:
+    loop.run_until_complete(ScrapeLanguages(
+        clone_list, credentials, FLAGS.github_api_url,
+        FLAGS.scraper_concurrency))
+  finally:
+    loop.close()
+
+  logging.info('Finished scraping. Indexed repository counts:')
+  for language in clone_list.language:
+    logging.info('  %s: %s', language.language,
+                 humanize.intcomma(scraper.GetNumberOfRepoMetas(language)))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,268 @@
+"""Unit tests for //datasets/github/scrape_repos:async_scraper."""
+import asyncio
+
+import aiohttp
+import pathlib
+import pytest
+import sys
+import tempfile
+import time
+import typing
+from absl import app
+from aiohttp import test_utils
+from aiohttp import web
+from phd.lib.labm8 import pbutil
+
+from datasets.github.scrape_repos import async_scraper
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+# Test fixtures.
+
+@pytest.fixture(scope='function')
+def tempdir() -> pathlib.Path:
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    yield pathlib.Path(d)
+
+
+class FakeGitHub(object):
+  """A fake GitHub API server, which serves repository search results."""
+
+  def __init__(self, num_repos: int, num_rate_limited_responses: int = 0):
+    """Instantiate a fake server.
+
+    Args:
+      num_repos: The number of results of every search query.
+      num_rate_limited_responses: The number of requests to reject with a rate
+        limit error before serving results.
+    """
+    self.num_repos = num_repos
+    self.num_rate_limited_responses = num_rate_limited_responses
+    self.requested_pages: typing.List[int] = []
+    self.num_in_flight = 0
+    self.max_in_flight = 0
+
+  def MakeApp(self) -> web.Application:
+    """Make a server application, which must be run in a single event loop."""
+    application = web.Application()
+    application.router.add_get('/search/repositories', self.SearchRepositories)
+    return application
+
+  async def SearchRepositories(self, request: web.Request) -> web.Response:
+    page = int(request.query['page'])
+    per_page = int(request.query['per_page'])
+    self.requested_pages.append(page)
+    self.num_in_flight += 1
+    self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+    await asyncio.sleep(.01)
+    self.num_in_flight -= 1
+    if self.num_rate_limited_responses:
+      self.num_rate_limited_responses -= 1
+      return web.json_response({'message': 'API rate limit exceeded'},
+                               status=403, headers={
+          'X-RateLimit-Remaining': '0',
+          'X-RateLimit-Reset': str(time.time() + .1),
+        })
+    items = [{
+      'owner': {'login': 'owner'},
+      'name': f'repo{i}',
+      'watchers_count': i,
+      'forks_count': i,
+      'stargazers_count': i,
+      'clone_url': f'https://github.com/owner/repo{i}.git',
+    } for i in range((page - 1) * per_page,
+                     min(page * per_page, self.num_repos))]
+    return web.json_response({'total_count': self.num_repos, 'items': items})
+
+
+def _Language(tempdir: pathlib.Path,
+              max_results: int = 1000) -> scrape_repos_pb2.LanguageToClone:
+  return scrape_repos_pb2.LanguageToClone(
+      language='java',
+      query=[scrape_repos_pb2.GitHubRepositoryQuery(
+          string='language:java', max_results=max_results)],
+      destination_directory=str(tempdir / 'java'))
+
+
+def _Scrape(fake: FakeGitHub, language: scrape_repos_pb2.LanguageToClone,
+            concurrency: int = 4) -> None:
+  """Scrape a language from a fake server."""
+
+  async def _Run():
+    async with test_utils.TestServer(fake.MakeApp()) as server:
+      async with aiohttp.ClientSession() as session:
+        client = async_scraper.GitHubApiClient(
+            session, str(server.make_url('')), concurrency)
+        await async_scraper.ScrapeLanguage(client, language, concurrency)
+
+  loop = asyncio.new_event_loop()
+  try:
+    loop.run_until_complete(_Run())
+  finally:
+    loop.close()
+
+
+def _NumMetas(language: scrape_repos_pb2.LanguageToClone) -> int:
+  return len(list(
+      pathlib.Path(language.destination_directory).glob('*.pbtxt')))
+
+
+class FakeClock(object):
+  """A clock which advances only when slept on."""
+
+  def __init__(self):
+    self.now = 1000.0
+    self.sleeps = []
+
+  def __call__(self) -> float:
+    return self.now
+
+  async def Sleep(self, seconds: float) -> None:
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+def _Acquire(budget: async_scraper.RateLimitBudget, n: int = 1) -> None:
+  loop = asyncio.new_event_loop()
+  try:
+    for _ in range(n):
+      loop.run_until_complete(budget.Acquire())
+  finally:
+    loop.close()
+
+
+# RateLimitBudget tests.
+
+def test_RateLimitBudget_unknown_limit():
+  """Test that requests are not delayed before the rate limit is known."""
+  clock = FakeClock()
+  budget = async_scraper.RateLimitBudget(2, clock=clock, sleep=clock.Sleep)
+  _Acquire(budget, 10)
+  assert not clock.sleeps
+
+
+def test_RateLimitBudget_spreads_remaining_requests():
+  """Test that remaining requests are spread over the rate limit window."""
+  clock = FakeClock()
+  budget = async_scraper.RateLimitBudget(1, clock=clock, sleep=clock.Sleep)
+  budget.Update({'X-RateLimit-Remaining': '10',
+                 'X-RateLimit-Reset': str(clock.now + 100)})
+  _Acquire(budget, 3)
+  # The first token is available immediately, and then the 9 remaining
+  # requests are spread over the 100 seconds until the reset.
+  assert clock.sleeps == pytest.approx([100 / 9, 100 / 9])
+  assert budget.remaining == 7
+
+
+def test_RateLimitBudget_exhausted():
+  """Test that an exhausted budget waits until the reset time."""
+  clock = FakeClock()
+  budget = async_scraper.RateLimitBudget(4, clock=clock, sleep=clock.Sleep)
+  budget.Update({'X-RateLimit-Remaining': '0',
+                 'X-RateLimit-Reset': str(clock.now + 30)})
+  _Acquire(budget)
+  assert clock.now == 1030 + async_scraper.RATE_LIMIT_RESET_SLACK_SECONDS
+  assert budget.remaining is None
+
+
+def test_RateLimitBudget_Update_out_of_order():
+  """Test that the lowest remaining count within a window is kept."""
+  budget = async_scraper.RateLimitBudget(4)
+  budget.Update({'X-RateLimit-Remaining': '10', 'X-RateLimit-Reset': '2000'})
+  budget.Update({'X-RateLimit-Remaining': '12', 'X-RateLimit-Reset': '2000'})
+  assert budget.remaining == 10
+  # Responses from an earlier window are ignored.
+  budget.Update({'X-RateLimit-Remaining': '3', 'X-RateLimit-Reset': '1000'})
+  assert budget.remaining == 10
+  budget.Update({'X-RateLimit-Remaining': '30', 'X-RateLimit-Reset': '3000'})
+  assert budget.remaining == 30
+
+
+def test_RateLimitBudget_Backoff():
+  """Test that requests are paused after a backoff."""
+  clock = FakeClock()
+  budget = async_scraper.RateLimitBudget(4, clock=clock, sleep=clock.Sleep)
+  budget.Backoff(60)
+  _Acquire(budget)
+  assert clock.sleeps == [60]
+
+
+# ScrapeLanguage tests.
+
+def test_ScrapeLanguage_writes_metas(tempdir: pathlib.Path):
+  """Test that a metafile is written for each search result."""
+  fake = FakeGitHub(250)
+  language = _Language(tempdir)
+  _Scrape(fake, language)
+  assert sorted(fake.requested_pages) == [1, 2, 3]
+  assert _NumMetas(language) == 250
+  meta = pbutil.FromFile(tempdir / 'java' / 'owner_repo7.pbtxt',
+                         scrape_repos_pb2.GitHubRepoMetadata())
+  assert meta.name == 'repo7'
+  assert meta.num_stars == 7
+  assert meta.clone_from_url == 'https://github.com/owner/repo7.git'
+
+
+def test_ScrapeLanguage_max_results(tempdir: pathlib.Path):
+  """Test that only max_results results are processed."""
+  fake = FakeGitHub(1000)
+  language = _Language(tempdir, max_results=150)
+  _Scrape(fake, language)
+  assert sorted(fake.requested_pages) == [1, 2]
+  assert _NumMetas(language) == 150
+
+
+def test_ScrapeLanguage_concurrent_pages(tempdir: pathlib.Path):
+  """Test that pages are fetched concurrently."""
+  fake = FakeGitHub(1000)
+  _Scrape(fake, _Language(tempdir), concurrency=4)
+  assert len(fake.requested_pages) == 10
+  assert fake.max_in_flight == 4
+
+
+def test_ScrapeLanguage_cursor(tempdir: pathlib.Path):
+  """Test that the cursor is saved, and a finished query is not repeated."""
+  fake = FakeGitHub(250)
+  language = _Language(tempdir)
+  _Scrape(fake, language)
+  cursor = pbutil.FromFile(async_scraper.GetCursorPath(language),
+                           scrape_repos_pb2.LanguageScrapeCursor())
+  assert cursor.query[0].query == 'language:java'
+  assert cursor.query[0].next_page == 4
+  assert cursor.query[0].num_results == 250
+  assert cursor.query[0].done
+  _Scrape(fake, language)
+  assert len(fake.requested_pages) == 3
+
+
+def test_ScrapeLanguage_resume(tempdir: pathlib.Path):
+  """Test that an interrupted scrape resumes from the cursor."""
+  fake = FakeGitHub(250)
+  language = _Language(tempdir)
+  async_scraper.WriteCursor(scrape_repos_pb2.LanguageScrapeCursor(query=[
+    scrape_repos_pb2.GitHubRepositoryQueryCursor(
+        query='language:java', next_page=3, num_results=200),
+  ]), async_scraper.GetCursorPath(language))
+  _Scrape(fake, language)
+  assert fake.requested_pages == [3]
+  assert _NumMetas(language) == 50
+
+
+def test_ScrapeLanguage_rate_limited(tempdir: pathlib.Path):
+  """Test that rate limited requests are retried."""
+  fake = FakeGitHub(50, num_rate_limited_responses=1)
+  language = _Language(tempdir)
+  _Scrape(fake, language)
+  assert fake.requested_pages == [1, 1]
+  assert _NumMetas(language) == 50
+
+
+def main(argv):
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  app.run(main)
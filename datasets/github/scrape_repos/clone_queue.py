@@ -0,0 +1,118 @@
+"""This file defines a persistent queue of repositories to clone."""
+import datetime
+import enum
+
+import pathlib
+import sqlalchemy as sql
+import typing
+from absl import flags
+from phd.lib.labm8 import sqlutil
+from sqlalchemy.ext import declarative
+
+
+FLAGS = flags.FLAGS
+
+Base = declarative.declarative_base()
+
+
+class CloneStatus(enum.Enum):
+  """The status of a clone job."""
+  PENDING = 0
+  DONE = 1
+  FAILED = 2
+
+
+class CloneJob(Base):
+  """A repository to clone, and the record of cloning it."""
+  __tablename__ = 'clone_jobs'
+
+  id: int = sql.Column(sql.Integer, primary_key=True)
+  # The path of the repository's GitHubRepoMetadata file.
+  metafile: str = sql.Column(sql.String(1024), nullable=False, unique=True)
+  status: CloneStatus = sql.Column(sql.Enum(CloneStatus), nullable=False,
+                                   default=CloneStatus.PENDING)
+  num_attempts: int = sql.Column(sql.Integer, nullable=False, default=0)
+  # The error of the most recent failed attempt.
+  error: str = sql.Column(sql.UnicodeText(), nullable=True)
+  # The wall time of the successful clone, and the size of the cloned .git
+  # directory. These are null for repositories which were already cloned.
+  clone_seconds: float = sql.Column(sql.Float, nullable=True)
+  clone_bytes: int = sql.Column(sql.BigInteger, nullable=True)
+  date_added: datetime.datetime = sql.Column(sql.DateTime, nullable=False,
+                                             default=datetime.datetime.utcnow)
+  date_cloned: datetime.datetime = sql.Column(sql.DateTime, nullable=True)
+
+
+class CloneQueue(sqlutil.Database):
+  """A queue of repositories to clone, which persists across runs.
+
+  Jobs are dequeued in the order that they were enqueued. A job which fails is
+  returned to the queue until it has been attempted max_attempts times.
+  """
+
+  def __init__(self, path: pathlib.Path, max_attempts: int = 3):
+    super(CloneQueue, self).__init__(path, Base)
+    self.max_attempts = max_attempts
+
+  def Enqueue(self, metafiles: typing.List[pathlib.Path]) -> int:
+    """Add repositories to the queue.
+
+    Args:
+      metafiles: The metafiles of the repositories. Metafiles which have
+        already been enqueued are ignored.
+
+    Returns:
+      The number of repositories added.
+    """
+    with self.Session(commit=True) as session:
+      existing = {row.metafile for row in session.query(CloneJob.metafile)}
+      new_metafiles = [str(p) for p in metafiles if str(p) not in existing]
+      session.add_all([CloneJob(metafile=p) for p in new_metafiles])
+    return len(new_metafiles)
+
+  def GetPending(self) -> typing.List[pathlib.Path]:
+    """Return the metafiles of repositories which are waiting to be cloned."""
+    with self.Session() as session:
+      return [pathlib.Path(row.metafile) for row in
+              session.query(CloneJob.metafile).filter(
+                  CloneJob.status == CloneStatus.PENDING).order_by(CloneJob.id)]
+
+  def RecordResult(self, session: sqlutil.Database.session_t,
+                   metafile: pathlib.Path,
+                   clone_seconds: typing.Optional[float],
+                   clone_bytes: typing.Optional[int],
+                   error: typing.Optional[str]) -> CloneStatus:
+    """Record an attempt to clone a repository.
+
+    Args:
+      session: A database session.
+      metafile: The metafile of the repository.
+      clone_seconds: The number of seconds taken to clone the repository, or
+        None if it was not cloned.
+      clone_bytes: The size of the cloned repository, or None.
+      error: The error message if cloning failed, else None.
+
+    Returns:
+      The status of the job. A failed job remains PENDING until it has been
+      attempted max_attempts times.
+    """
+    job = session.query(CloneJob).filter(
+        CloneJob.metafile == str(metafile)).one()
+    job.num_attempts += 1
+    if error is None:
+      job.status = CloneStatus.DONE
+      job.clone_seconds = clone_seconds
+      job.clone_bytes = clone_bytes
+      job.date_cloned = datetime.datetime.utcnow()
+    else:
+      job.error = error
+      if job.num_attempts >= self.max_attempts:
+        job.status = CloneStatus.FAILED
+    return job.status
+
+  def GetCounts(self) -> typing.Dict[CloneStatus, int]:
+    """Return the number of jobs of each status."""
+    with self.Session() as session:
+      counts = dict(session.query(CloneJob.status, sql.func.count(
+          CloneJob.id)).group_by(CloneJob.status))
+    return {status: counts.get(status, 0) for status in CloneStatus}
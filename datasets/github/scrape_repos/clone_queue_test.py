@@ -0,0 +1,99 @@
+"""Unit tests for //datasets/github/scrape_repos/clone_queue.py."""
+import pathlib
+import pytest
+import sys
+import tempfile
+import typing
+from absl import app
+from absl import flags
+
+from datasets.github.scrape_repos import clone_queue
+
+
+FLAGS = flags.FLAGS
+
+
+# Test fixtures.
+
+@pytest.fixture(scope='function')
+def queue() -> clone_queue.CloneQueue:
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    yield clone_queue.CloneQueue(pathlib.Path(d) / 'queue.db', max_attempts=2)
+
+
+def _Job(queue: clone_queue.CloneQueue,
+         metafile: pathlib.Path) -> clone_queue.CloneJob:
+  with queue.Session() as session:
+    job = session.query(clone_queue.CloneJob).filter(
+        clone_queue.CloneJob.metafile == str(metafile)).one()
+    session.expunge(job)
+    return job
+
+
+def test_CloneQueue_Enqueue(queue: clone_queue.CloneQueue):
+  """Test that repositories are enqueued once, in order."""
+  assert queue.Enqueue([pathlib.Path('b'), pathlib.Path('a')]) == 2
+  assert queue.Enqueue([pathlib.Path('a'), pathlib.Path('c')]) == 1
+  assert queue.GetPending() == [
+    pathlib.Path('b'), pathlib.Path('a'), pathlib.Path('c')]
+
+
+def test_CloneQueue_RecordResult_success(queue: clone_queue.CloneQueue):
+  """Test that a successful clone is recorded."""
+  queue.Enqueue([pathlib.Path('a'), pathlib.Path('b')])
+  with queue.Session(commit=True) as session:
+    assert queue.RecordResult(session, pathlib.Path('a'), 1.5, 1024,
+                              None) == clone_queue.CloneStatus.DONE
+  assert queue.GetPending() == [pathlib.Path('b')]
+  job = _Job(queue, pathlib.Path('a'))
+  assert job.status == clone_queue.CloneStatus.DONE
+  assert job.num_attempts == 1
+  assert job.clone_seconds == 1.5
+  assert job.clone_bytes == 1024
+  assert job.date_cloned
+
+
+def test_CloneQueue_RecordResult_failure(queue: clone_queue.CloneQueue):
+  """Test that failed clones are retried up to max_attempts times."""
+  queue.Enqueue([pathlib.Path('a')])
+  with queue.Session(commit=True) as session:
+    assert queue.RecordResult(session, pathlib.Path('a'), None, None,
+                              'error 1') == clone_queue.CloneStatus.PENDING
+  assert queue.GetPending() == [pathlib.Path('a')]
+  with queue.Session(commit=True) as session:
+    assert queue.RecordResult(session, pathlib.Path('a'), None, None,
+                              'error 2') == clone_queue.CloneStatus.FAILED
+  assert queue.GetPending() == []
+  job = _Job(queue, pathlib.Path('a'))
+  assert job.status == clone_queue.CloneStatus.FAILED
+  assert job.num_attempts == 2
+  assert job.error == 'error 2'
+
+
+def test_CloneQueue_GetCounts(queue: clone_queue.CloneQueue):
+  """Test counting jobs by status."""
+  assert queue.GetCounts() == {
+    clone_queue.CloneStatus.PENDING: 0,
+    clone_queue.CloneStatus.DONE: 0,
+    clone_queue.CloneStatus.FAILED: 0,
+  }
+  queue.Enqueue([pathlib.Path('a'), pathlib.Path('b')])
+  with queue.Session(commit=True) as session:
+    queue.RecordResult(session, pathlib.Path('a'), 1, 1, None)
+  assert queue.GetCounts() == {
+    clone_queue.CloneStatus.PENDING: 1,
+    clone_queue.CloneStatus.DONE: 1,
+    clone_queue.CloneStatus.FAILED: 0,
+  }
+
+
+def main(argv: typing.List[str]):
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError("Unknown arguments: '{}'.".format(' '.join(argv[1:])))
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  flags.FLAGS(['argv[0]', '-v=1'])
+  app.run(main)
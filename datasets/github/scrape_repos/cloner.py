@@ -1,12 +1,23 @@
 """Clone GitHub repositories.
 
 This looks for repo meta files and clones any which have not been cloned.
+
+With --shallow_clone, only the most recent commit of each repository's default
+branch is cloned. Repositories are cloned from a persistent queue, which
+records the time taken and bytes cloned for each repository, using a number of
+concurrent clones which adapts to the measured throughput.
 """
+import collections
+import concurrent.futures
+import functools
 import multiprocessing
+import os
 import pathlib
 import random
+import re
 import subprocess
 import threading
+import time
 import typing
 
 import humanize
@@ -15,6 +26,7 @@ from absl import app
 from absl import flags
 from absl import logging
 
+from datasets.github.scrape_repos import clone_queue
 from datasets.github.scrape_repos.proto import scrape_repos_pb2
 from phd.lib.labm8 import fs
 from phd.lib.labm8 import pbutil
@@ -28,43 +40,171 @@ flags.DEFINE_integer('repository_clone_timeout_minutes', 30,
                      'repository before '
                      'quitting and moving on to the next repository.')
 flags.DEFINE_integer('num_cloner_threads', 4,
-                     'The number of cloner threads to spawn.')
+                     'The number of cloner threads to spawn. With '
+                     '--shallow_clone, this is the initial number of '
+                     'concurrent clones.')
+flags.DEFINE_boolean('shallow_clone', False,
+                     'Make shallow, single branch clones from a persistent '
+                     'queue, adapting the number of concurrent clones to the '
+                     'measured throughput.')
+flags.DEFINE_boolean('sparse_checkout', False,
+                     'With --shallow_clone, check out only the files which '
+                     'match the source_code_pattern of the language\'s '
+                     'importers. Files needed by preprocessors, such as '
+                     'headers to inline, must also be matched.')
+flags.DEFINE_integer('max_cloner_threads', 32,
+                     'With --shallow_clone, the maximum number of concurrent '
+                     'clones.')
+flags.DEFINE_float('clone_bandwidth_limit_mbps', 0,
+                   'With --shallow_clone, reduce the number of concurrent '
+                   'clones when their throughput exceeds this many megabits '
+                   'per second. If zero, throughput is not limited.')
+flags.DEFINE_integer('max_clone_attempts', 3,
+                     'With --shallow_clone, the number of times to attempt to '
+                     'clone a repository before giving up.')
+
+# The return code of timeout(1) when the command times out.
+TIMEOUT_RETURNCODE = 124
+
+# The number of seconds between adjustments to the number of concurrent
+# clones.
+CONCURRENCY_UPDATE_INTERVAL_SECONDS = 30
+
+CloneResult = collections.namedtuple(
+    'CloneResult', ['clone_seconds', 'clone_bytes', 'error', 'timed_out'])
 
 
-def CloneFromMetafile(metafile: pathlib.Path) -> None:
+def CloneFromMetafile(metafile: pathlib.Path, shallow: bool = False,
+                      sparse_checkout_patterns: typing.Optional[
+                        typing.List[str]] = None) -> CloneResult:
+  """Clone the repository of a metafile.
+
+  Args:
+    metafile: The path of a GitHubRepoMetadata file.
+    shallow: If true, clone only the most recent commit of the default branch
+      of the repository and its submodules.
+    sparse_checkout_patterns: If provided, check out only the files whose
+      repo-relative paths match one of these regular expressions. The contents
+      of other files are not fetched, if the server supports partial clones.
+      Submodules are not cloned.
+
+  Returns:
+    A CloneResult. If the repository was already cloned, clone_seconds and
+    clone_bytes are None.
+  """
   meta = pbutil.FromFile(metafile, scrape_repos_pb2.GitHubRepoMetadata())
   if not meta.owner and meta.name:
     logging.error('Metafile missing owner and name fields %s', metafile)
-    return
+    return CloneResult(None, None, 'Metafile missing owner and name fields',
+                       False)
   clone_dir = metafile.parent / f'{meta.owner}_{meta.name}'
   logging.debug('%s', meta)
   if (clone_dir / '.git').is_dir():
-    return
+    return CloneResult(None, None, None, False)
 
   # Remove anything left over from a previous attempt.
   subprocess.check_call(['rm', '-rf', str(clone_dir)])
 
-  cmd = ['timeout', f'{FLAGS.repository_clone_timeout_minutes}m',
-         '/usr/bin/git', 'clone', meta.clone_from_url, str(clone_dir)]
-  logging.debug('$ %s', ' '.join(cmd))
+  start_time = time.time()
+  cmd = ['/usr/bin/git', 'clone', meta.clone_from_url, str(clone_dir)]
+  if shallow:
+    cmd += ['--depth', '1', '--single-branch']
 
-  # Try to checkout the repository and submodules.
-  p = subprocess.Popen(cmd + ['--recursive'], stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE, universal_newlines=True)
-  _, stderr = p.communicate()
-  if p.returncode and 'submodule' in stderr:
-    # Remove anything left over from a previous attempt.
-    subprocess.check_call(['rm', '-rf', str(clone_dir)])
-    # Try again, but this time without cloning submodules.
-    p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                         universal_newlines=True)
-    _, stderr = p.communicate()
+  if sparse_checkout_patterns is not None:
+    returncode, stderr = _RunWithTimeout(
+        cmd + ['--no-checkout', '--filter=blob:none'])
+    if not returncode:
+      returncode, stderr = SparseCheckout(clone_dir, sparse_checkout_patterns)
+  else:
+    # Try to checkout the repository and submodules.
+    submodule_args = ['--recursive']
+    if shallow:
+      submodule_args.append('--shallow-submodules')
+    returncode, stderr = _RunWithTimeout(cmd + submodule_args)
+    if returncode and 'submodule' in stderr:
+      # Remove anything left over from a previous attempt.
+      subprocess.check_call(['rm', '-rf', str(clone_dir)])
+      # Try again, but this time without cloning submodules.
+      returncode, stderr = _RunWithTimeout(cmd)
 
-  if p.returncode:
+  if returncode:
     # Give up.
     logging.warning('\nClone failed %s:\n%s', meta.clone_from_url, stderr)
     # Remove anything left over.
     subprocess.check_call(['rm', '-rf', str(clone_dir)])
+    return CloneResult(None, None, stderr or f'git exited with {returncode}',
+                       returncode == TIMEOUT_RETURNCODE)
+  return CloneResult(time.time() - start_time,
+                     GetDirectorySize(clone_dir / '.git'), None, False)
+
+
+def SparseCheckout(clone_dir: pathlib.Path,
+                   patterns: typing.List[str]) -> typing.Tuple[int, str]:
+  """Check out the files of a repository which match a list of patterns.
+
+  Args:
+    clone_dir: A repository which was cloned without a checkout.
+    patterns: Regular expressions which match the entire repo-relative path of
+      the files to check out. The start of line character '^' is permitted.
+
+  Returns:
+    The return code and stderr of the checkout.
+  """
+  regexes = [re.compile(p[1:] if p.startswith('^') else p) for p in patterns]
+  p = subprocess.Popen(
+      ['/usr/bin/git', '-C', str(clone_dir), 'ls-tree', '-r', '-z',
+       '--name-only', 'HEAD'], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+      universal_newlines=True)
+  stdout, stderr = p.communicate()
+  if p.returncode:
+    return p.returncode, stderr
+  relpaths = [path for path in stdout.split('\0') if path and '\n' not in path
+              and any(regex.fullmatch(path) for regex in regexes)]
+  if not relpaths:
+    logging.debug('No files to check out in %s', clone_dir)
+    return 0, ''
+  (clone_dir / '.git' / 'info').mkdir(exist_ok=True)
+  with open(clone_dir / '.git' / 'info' / 'sparse-checkout', 'w') as f:
+    for relpath in relpaths:
+      f.write(SparseCheckoutPattern(relpath) + '\n')
+  subprocess.check_call(['/usr/bin/git', '-C', str(clone_dir), 'config',
+                         'core.sparseCheckout', 'true'])
+  # Files are fetched on checkout from a partial clone, so this is subject to
+  # the clone timeout.
+  return _RunWithTimeout(
+      ['/usr/bin/git', '-C', str(clone_dir), 'read-tree', '-mu', 'HEAD'])
+
+
+def SparseCheckoutPattern(relpath: str) -> str:
+  """Return a sparse checkout pattern which matches only the given path."""
+  pattern = re.sub(r'([\\*?\[])', r'\\\1', relpath)
+  stripped = pattern.rstrip(' ')
+  # Trailing spaces are ignored unless escaped.
+  pattern = stripped + '\\ ' * (len(pattern) - len(stripped))
+  return '/' + pattern
+
+
+def GetDirectorySize(path: pathlib.Path) -> int:
+  """Return the total size of the files in a directory, in bytes."""
+  size = 0
+  for root, _, files in os.walk(path):
+    for file in files:
+      size += os.lstat(os.path.join(root, file)).st_size
+  return size
+
+
+def _RunWithTimeout(cmd: typing.List[str]) -> typing.Tuple[int, str]:
+  """Run a command with the repository clone timeout.
+
+  Returns:
+    The return code and stderr of the command.
+  """
+  cmd = ['timeout', f'{FLAGS.repository_clone_timeout_minutes}m'] + cmd
+  logging.debug('$ %s', ' '.join(cmd))
+  p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                       universal_newlines=True)
+  _, stderr = p.communicate()
+  return p.returncode, stderr
 
 
 def IsRepoMetaFile(f: str):
@@ -88,6 +228,163 @@ class AsyncWorker(threading.Thread):
       self.i += 1
 
 
+class ConcurrencyController(object):
+  """Adapt the number of concurrent clones to their measured throughput.
+
+  The throughput of an interval is the number of bytes cloned by the clones
+  which completed during it. The number of concurrent clones is stepped by one
+  in the same direction while throughput improves, and in the opposite
+  direction when throughput falls. If clones time out, or the bandwidth limit
+  is exceeded, the number of concurrent clones is halved.
+  """
+
+  # The relative change in throughput which is treated as noise.
+  TOLERANCE = .1
+
+  def __init__(self, concurrency: int, max_concurrency: int,
+               bandwidth_limit: typing.Optional[float] = None):
+    """Instantiate a controller.
+
+    Args:
+      concurrency: The initial number of concurrent clones.
+      max_concurrency: The maximum number of concurrent clones.
+      bandwidth_limit: The maximum throughput, in bytes per second, if any.
+    """
+    self.max_concurrency = max_concurrency
+    self.concurrency = min(max(concurrency, 1), max_concurrency)
+    self.bandwidth_limit = bandwidth_limit
+    self.throughput: typing.Optional[float] = None
+    self._direction = 1
+    self._num_bytes = 0
+    self._num_clones = 0
+    self._num_timeouts = 0
+
+  def Record(self, result: CloneResult) -> None:
+    """Record the result of a clone."""
+    if result.timed_out:
+      self._num_timeouts += 1
+    elif result.clone_bytes is not None:
+      self._num_bytes += result.clone_bytes
+      self._num_clones += 1
+
+  def Update(self, elapsed_seconds: float) -> int:
+    """Adjust the number of concurrent clones at the end of an interval.
+
+    Args:
+      elapsed_seconds: The duration of the interval.
+
+    Returns:
+      The new number of concurrent clones.
+    """
+    throughput = self._num_bytes / elapsed_seconds
+    if self._num_timeouts or (self.bandwidth_limit and
+                              throughput > self.bandwidth_limit):
+      self._direction = -1
+      self.concurrency = max(self.concurrency // 2, 1)
+    elif not self._num_clones:
+      # Nothing was cloned, so there is nothing to compare.
+      pass
+    elif self.throughput is None:
+      self.concurrency += self._direction
+    elif throughput > self.throughput * (1 + self.TOLERANCE):
+      self.concurrency += self._direction
+    elif throughput < self.throughput * (1 - self.TOLERANCE):
+      self._direction = -self._direction
+      self.concurrency += self._direction
+    self.concurrency = min(max(self.concurrency, 1), self.max_concurrency)
+    if self._num_clones:
+      self.throughput = throughput
+    self._num_bytes = 0
+    self._num_clones = 0
+    self._num_timeouts = 0
+    return self.concurrency
+
+
+def CloneFromQueue(
+    queue: clone_queue.CloneQueue,
+    clone: typing.Callable[[pathlib.Path], CloneResult],
+    controller: ConcurrencyController,
+    update_interval_seconds: float = CONCURRENCY_UPDATE_INTERVAL_SECONDS
+) -> None:
+  """Clone the pending repositories of a queue.
+
+  A repository which fails to clone is returned to the end of the queue, until
+  it has been attempted the maximum number of times that the queue allows.
+
+  Args:
+    queue: The queue of repositories to clone.
+    clone: A function which clones the repository of a metafile.
+    controller: Determines the number of concurrent clones.
+    update_interval_seconds: The number of seconds between updates to the
+      number of concurrent clones.
+  """
+  pending = collections.deque(queue.GetPending())
+  logging.info('Cloning %s repos from GitHub ...',
+               humanize.intcomma(len(pending)))
+  in_flight = {}
+  last_update_time = time.time()
+  with concurrent.futures.ThreadPoolExecutor(
+      controller.max_concurrency) as executor:
+    while pending or in_flight:
+      while pending and len(in_flight) < controller.concurrency:
+        metafile = pending.popleft()
+        in_flight[executor.submit(clone, metafile)] = metafile
+      done, _ = concurrent.futures.wait(
+          in_flight, timeout=update_interval_seconds,
+          return_when=concurrent.futures.FIRST_COMPLETED)
+      with queue.Session(commit=True) as session:
+        for future in done:
+          result = future.result()
+          metafile = in_flight.pop(future)
+          status = queue.RecordResult(session, metafile, result.clone_seconds,
+                                      result.clone_bytes, result.error)
+          if status == clone_queue.CloneStatus.PENDING:
+            pending.append(metafile)
+          controller.Record(result)
+      elapsed_seconds = time.time() - last_update_time
+      if elapsed_seconds >= update_interval_seconds:
+        controller.Update(elapsed_seconds)
+        last_update_time = time.time()
+        logging.info('%s repos remaining. Cloning %s/s with %d concurrent '
+                     'clones', humanize.intcomma(len(pending) + len(in_flight)),
+                     humanize.naturalsize(controller.throughput or 0),
+                     controller.concurrency)
+
+
+def ShallowCloneLanguage(language: scrape_repos_pb2.LanguageToClone) -> None:
+  """Shallow clone the repositories of a language from its clone queue.
+
+  Args:
+    language: The language to clone.
+  """
+  directory = pathlib.Path(language.destination_directory)
+  if not directory.is_dir():
+    return
+  queue = clone_queue.CloneQueue(
+      pathlib.Path(language.destination_directory + '.clone_queue.db'),
+      max_attempts=FLAGS.max_clone_attempts)
+  meta_files = [pathlib.Path(directory / f) for f in directory.iterdir() if
+                IsRepoMetaFile(f)]
+  random.shuffle(meta_files)
+  queue.Enqueue(meta_files)
+
+  sparse_checkout_patterns = None
+  if FLAGS.sparse_checkout:
+    sparse_checkout_patterns = [
+      importer.source_code_pattern for importer in language.importer]
+  bandwidth_limit = FLAGS.clone_bandwidth_limit_mbps * 1e6 / 8 or None
+  controller = ConcurrencyController(FLAGS.num_cloner_threads,
+                                     FLAGS.max_cloner_threads, bandwidth_limit)
+  CloneFromQueue(queue, functools.partial(
+      CloneFromMetafile, shallow=True,
+      sparse_checkout_patterns=sparse_checkout_patterns), controller)
+  counts = queue.GetCounts()
+  logging.info('%s repos: %s cloned, %s failed, %s pending', language.language,
+               humanize.intcomma(counts[clone_queue.CloneStatus.DONE]),
+               humanize.intcomma(counts[clone_queue.CloneStatus.FAILED]),
+               humanize.intcomma(counts[clone_queue.CloneStatus.PENDING]))
+
+
 def main(argv) -> None:
   """Main entry point."""
   if len(argv) > 1:
@@ -99,6 +396,11 @@ def main(argv) -> None:
   clone_list = pbutil.FromFile(clone_list_path,
                                scrape_repos_pb2.LanguageCloneList())
 
+  if FLAGS.shallow_clone:
+    for language in clone_list.language:
+      ShallowCloneLanguage(language)
+    return
+
   meta_files = []
   for language in clone_list.language:
     directory = pathlib.Path(language.destination_directory)
@@ -0,0 +1,241 @@
+"""Unit tests for //datasets/github/scrape_repos:cloner."""
+import pathlib
+import pytest
+import subprocess
+import sys
+import tempfile
+import typing
+from absl import app
+from absl import flags
+from phd.lib.labm8 import pbutil
+
+from datasets.github.scrape_repos import clone_queue
+from datasets.github.scrape_repos import cloner
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+FLAGS = flags.FLAGS
+
+
+# Test fixtures.
+
+@pytest.fixture(scope='function')
+def tempdir() -> pathlib.Path:
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    yield pathlib.Path(d)
+
+
+def _Git(*args: str) -> str:
+  return subprocess.check_output(
+      ['/usr/bin/git', '-c', 'user.name=test', '-c', 'user.email=test@test',
+       *args], universal_newlines=True, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture(scope='function')
+def remote(tempdir: pathlib.Path) -> str:
+  """A test fixture which yields the URL of a bare repo with two commits."""
+  work = tempdir / 'work'
+  (work / 'src').mkdir(parents=True)
+  _Git('init', str(work))
+  (work / 'src' / 'A.java').write_text('class A {}')
+  (work / 'README.md').write_text('Hello, world!')
+  _Git('-C', str(work), 'add', '.')
+  _Git('-C', str(work), 'commit', '-m', 'First commit')
+  (work / 'src' / 'B*.java').write_text('class B {}')
+  _Git('-C', str(work), 'add', '.')
+  _Git('-C', str(work), 'commit', '-m', 'Second commit')
+  _Git('clone', '--bare', str(work), str(tempdir / 'remote.git'))
+  # Shallow clones and partial clones are only made over a transport, so the
+  # remote must be a file:// URL rather than a path.
+  yield f'file://{tempdir}/remote.git'
+
+
+def _Metafile(tempdir: pathlib.Path, url: str,
+              name: str = 'Bar') -> pathlib.Path:
+  (tempdir / 'java').mkdir(exist_ok=True)
+  path = tempdir / 'java' / f'Foo_{name}.pbtxt'
+  pbutil.ToFile(scrape_repos_pb2.GitHubRepoMetadata(
+      owner='Foo', name=name, clone_from_url=url), path)
+  return path
+
+
+def _NumCommits(clone_dir: pathlib.Path) -> int:
+  return int(_Git('-C', str(clone_dir), 'rev-list', '--count', 'HEAD'))
+
+
+def _Files(clone_dir: pathlib.Path) -> typing.Set[str]:
+  return {str(p.relative_to(clone_dir)) for p in clone_dir.glob('**/*')
+          if p.is_file() and '.git' not in p.relative_to(clone_dir).parts}
+
+
+# CloneFromMetafile() tests.
+
+def test_CloneFromMetafile_full(tempdir: pathlib.Path, remote: str):
+  """Test that a full clone has the complete history."""
+  result = cloner.CloneFromMetafile(_Metafile(tempdir, remote))
+  assert result.error is None
+  assert result.clone_seconds > 0
+  assert result.clone_bytes > 0
+  assert _NumCommits(tempdir / 'java' / 'Foo_Bar') == 2
+  assert _Files(tempdir / 'java' / 'Foo_Bar') == {
+    'README.md', 'src/A.java', 'src/B*.java'}
+
+
+def test_CloneFromMetafile_shallow(tempdir: pathlib.Path, remote: str):
+  """Test that a shallow clone has only the most recent commit."""
+  result = cloner.CloneFromMetafile(_Metafile(tempdir, remote), shallow=True)
+  assert result.error is None
+  assert _NumCommits(tempdir / 'java' / 'Foo_Bar') == 1
+  assert _Files(tempdir / 'java' / 'Foo_Bar') == {
+    'README.md', 'src/A.java', 'src/B*.java'}
+
+
+def test_CloneFromMetafile_sparse_checkout(tempdir: pathlib.Path, remote: str):
+  """Test that a sparse checkout contains only the matching files."""
+  result = cloner.CloneFromMetafile(
+      _Metafile(tempdir, remote), shallow=True,
+      sparse_checkout_patterns=['^src/A\\.java', '.*\\*\\.java'])
+  assert result.error is None
+  assert (tempdir / 'java' / 'Foo_Bar' / '.git').is_dir()
+  assert _Files(tempdir / 'java' / 'Foo_Bar') == {'src/A.java', 'src/B*.java'}
+
+
+def test_CloneFromMetafile_sparse_checkout_no_matches(tempdir: pathlib.Path,
+                                                      remote: str):
+  """Test that a sparse checkout with no matching files is empty."""
+  result = cloner.CloneFromMetafile(
+      _Metafile(tempdir, remote), shallow=True,
+      sparse_checkout_patterns=['.*\\.c'])
+  assert result.error is None
+  assert (tempdir / 'java' / 'Foo_Bar' / '.git').is_dir()
+  assert not _Files(tempdir / 'java' / 'Foo_Bar')
+
+
+def test_CloneFromMetafile_already_cloned(tempdir: pathlib.Path, remote: str):
+  """Test that a cloned repository is not cloned again."""
+  metafile = _Metafile(tempdir, remote)
+  cloner.CloneFromMetafile(metafile, shallow=True)
+  assert cloner.CloneFromMetafile(metafile, shallow=True) == (
+    cloner.CloneResult(None, None, None, False))
+
+
+def test_CloneFromMetafile_failure(tempdir: pathlib.Path):
+  """Test that a failed clone is removed."""
+  result = cloner.CloneFromMetafile(
+      _Metafile(tempdir, f'file://{tempdir}/not_a_repo.git'), shallow=True)
+  assert result.error
+  assert not result.timed_out
+  assert not (tempdir / 'java' / 'Foo_Bar').exists()
+
+
+# SparseCheckoutPattern() tests.
+
+def test_SparseCheckoutPattern():
+  assert cloner.SparseCheckoutPattern('src/A.java') == '/src/A.java'
+  assert cloner.SparseCheckoutPattern('!a b#') == '/!a b#'
+  assert cloner.SparseCheckoutPattern('a*?[b].c') == '/a\\*\\?\\[b].c'
+  assert cloner.SparseCheckoutPattern('a  ') == '/a\\ \\ '
+
+
+# ConcurrencyController tests.
+
+def _CloneResult(clone_bytes: int) -> cloner.CloneResult:
+  return cloner.CloneResult(1, clone_bytes, None, False)
+
+
+def test_ConcurrencyController_hill_climbing():
+  """Test that concurrency is increased while throughput improves."""
+  controller = cloner.ConcurrencyController(4, 32)
+  controller.Record(_CloneResult(100))
+  assert controller.Update(1) == 5
+  controller.Record(_CloneResult(200))
+  assert controller.Update(1) == 6
+  # Throughput within the tolerance is unchanged.
+  controller.Record(_CloneResult(205))
+  assert controller.Update(1) == 6
+  # Throughput fell, so reverse direction.
+  controller.Record(_CloneResult(100))
+  assert controller.Update(1) == 5
+  controller.Record(_CloneResult(150))
+  assert controller.Update(1) == 4
+
+
+def test_ConcurrencyController_no_clones():
+  """Test that concurrency is unchanged if no clones completed."""
+  controller = cloner.ConcurrencyController(4, 32)
+  controller.Record(cloner.CloneResult(None, None, None, False))
+  assert controller.Update(1) == 4
+  assert controller.throughput is None
+
+
+def test_ConcurrencyController_timeouts():
+  """Test that concurrency is halved when clones time out."""
+  controller = cloner.ConcurrencyController(8, 32)
+  controller.Record(_CloneResult(100))
+  controller.Record(cloner.CloneResult(None, None, 'timeout', True))
+  assert controller.Update(1) == 4
+
+
+def test_ConcurrencyController_bandwidth_limit():
+  """Test that concurrency is halved when the bandwidth limit is exceeded."""
+  controller = cloner.ConcurrencyController(8, 32, bandwidth_limit=100)
+  controller.Record(_CloneResult(200))
+  assert controller.Update(1) == 4
+  # Throughput then falls, so concurrency is increased again.
+  controller.Record(_CloneResult(50))
+  assert controller.Update(1) == 5
+
+
+def test_ConcurrencyController_bounds():
+  """Test that concurrency stays within its bounds."""
+  controller = cloner.ConcurrencyController(2, 2)
+  controller.Record(_CloneResult(100))
+  assert controller.Update(1) == 2
+  controller = cloner.ConcurrencyController(1, 2)
+  controller.Record(cloner.CloneResult(None, None, 'timeout', True))
+  assert controller.Update(1) == 1
+
+
+# CloneFromQueue() tests.
+
+def test_CloneFromQueue(tempdir: pathlib.Path, remote: str):
+  """Test that repositories are cloned, and failures retried, in one run."""
+  queue = clone_queue.CloneQueue(tempdir / 'queue.db', max_attempts=2)
+  good = _Metafile(tempdir, remote, name='Good')
+  bad = _Metafile(tempdir, f'file://{tempdir}/not_a_repo.git', name='Bad')
+  queue.Enqueue([good, bad])
+  controller = cloner.ConcurrencyController(2, 4)
+
+  def Clone(metafile: pathlib.Path) -> cloner.CloneResult:
+    return cloner.CloneFromMetafile(metafile, shallow=True)
+
+  cloner.CloneFromQueue(queue, Clone, controller)
+  assert (tempdir / 'java' / 'Foo_Good' / '.git').is_dir()
+  assert queue.GetPending() == []
+  with queue.Session() as session:
+    job = session.query(clone_queue.CloneJob).filter(
+        clone_queue.CloneJob.metafile == str(good)).one()
+    assert job.status == clone_queue.CloneStatus.DONE
+    assert job.clone_seconds > 0
+    assert job.clone_bytes > 0
+    job = session.query(clone_queue.CloneJob).filter(
+        clone_queue.CloneJob.metafile == str(bad)).one()
+    assert job.status == clone_queue.CloneStatus.FAILED
+    assert job.num_attempts == 2
+  assert queue.GetCounts() == {
+    clone_queue.CloneStatus.PENDING: 0,
+    clone_queue.CloneStatus.DONE: 1,
+    clone_queue.CloneStatus.FAILED: 1,
+  }
+
+
+def main(argv: typing.List[str]):
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError("Unknown arguments: '{}'.".format(' '.join(argv[1:])))
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  flags.FLAGS(['argv[0]', '-v=1'])
+  app.run(main)
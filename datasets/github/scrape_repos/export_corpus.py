@@ -4,6 +4,7 @@ import os
 import binascii
 import humanize
 import pathlib
+import typing
 from absl import app
 from absl import flags
 from absl import logging
@@ -11,6 +12,7 @@ from phd.lib.labm8 import pbutil
 from sqlalchemy import orm
 
 from datasets.github.scrape_repos import contentfiles
+from datasets.github.scrape_repos import packed_index
 from datasets.github.scrape_repos.proto import scrape_repos_pb2
 
 
@@ -37,20 +39,31 @@ def ExportDatabase(session: orm.session.Session,
 
 def ExportIndex(index_path: pathlib.Path, export_path: pathlib.Path) -> None:
   """Export the contents of an index directory to a directory."""
-  contentfile = scrape_repos_pb2.ContentFile()
   for subdir, dirs, files in os.walk(index_path):
-    for file in files:
-      if file.endswith('.pbtxt'):
-        try:
-          pbutil.FromFile(pathlib.Path(os.path.join(subdir, file)), contentfile)
-          sha256 = binascii.hexlify(contentfile.sha256).decode('utf-8')
-          out_path = export_path / (sha256 + '.txt')
-          if not out_path.is_file():
-            with open(out_path, 'w') as f:
-              f.write(contentfile.text)
-              logging.debug(out_path)
-        except pbutil.DecodeError:
-          pass
+    if packed_index.SEGMENT_NAME in files:
+      contentfiles = packed_index.ReadContentFiles(
+          pathlib.Path(subdir) / packed_index.SEGMENT_NAME)
+    else:
+      contentfiles = _ReadLegacyContentFiles(pathlib.Path(subdir), files)
+    for contentfile in contentfiles:
+      sha256 = binascii.hexlify(contentfile.sha256).decode('utf-8')
+      out_path = export_path / (sha256 + '.txt')
+      if not out_path.is_file():
+        with open(out_path, 'w') as f:
+          f.write(contentfile.text)
+          logging.debug(out_path)
+
+
+def _ReadLegacyContentFiles(
+    subdir: pathlib.Path,
+    files: typing.List[str]) -> typing.Iterator[scrape_repos_pb2.ContentFile]:
+  """Read the text format content files of an unmigrated index directory."""
+  for file in files:
+    if file.endswith('.pbtxt'):
+      try:
+        yield pbutil.FromFile(subdir / file, scrape_repos_pb2.ContentFile())
+      except pbutil.DecodeError:
+        pass
 
 
 def main(argv):
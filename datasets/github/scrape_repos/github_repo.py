@@ -1,7 +1,6 @@
 """This file defines the GitHubRepo class."""
 import multiprocessing
 
-import binascii
 import collections
 import hashlib
 import humanize
@@ -13,6 +12,7 @@ from absl import flags
 from absl import logging
 from phd.lib.labm8 import pbutil
 
+from datasets.github.scrape_repos import packed_index
 from datasets.github.scrape_repos.preprocessors import preprocessors
 from datasets.github.scrape_repos.preprocessors import public
 from datasets.github.scrape_repos.proto import scrape_repos_pb2
@@ -68,13 +68,16 @@ class GitHubRepo(object):
     """Index the repo."""
     if self.IsCloned() and not self.IsIndexed():
       self.index_dir.mkdir(parents=True, exist_ok=True)
-      for indexer in indexers:
-        self._IndexPattern(indexer, pool, i)
+      with packed_index.PackedIndexWriter(
+          packed_index.SegmentPath(self.index_dir)) as writer:
+        for indexer in indexers:
+          self._IndexPattern(indexer, pool, writer, i)
       (self.index_dir / 'DONE.txt').touch()
     return self
 
   def _IndexPattern(self, indexer: scrape_repos_pb2.ContentFilesImporterConfig,
                     pool: multiprocessing.Pool,
+                    writer: packed_index.PackedIndexWriter,
                     i: IndexProgress) -> 'GitHubRepo':
     """Index the repo."""
     pattern = indexer.source_code_pattern
@@ -95,48 +98,67 @@ class GitHubRepo(object):
     else:
       logging.info("Importing %s files from %s ...",
                    humanize.intcomma(len(paths)), self.name)
-    all_files_relpaths = public.GetAllFilesRelativePaths(self.clone_dir)
-    jobs = (
-      scrape_repos_pb2.ImportWorker(
-          clone_from_url=self.meta.clone_from_url,
-          clone_dir=str(self.clone_dir),
-          abspath=p,
-          all_files_relpaths=all_files_relpaths,
-          preprocessors=indexer.preprocessor,
-          index_dir=str(self.index_dir),
-      ) for p in paths
-    )
-    progress_bar = progressbar.ProgressBar(max_value=len(paths))
-    for _ in progress_bar(pool.imap_unordered(IndexContentFiles, jobs)):
-      pass
+    # The file list is written once per repo and read once by each worker,
+    # rather than being copied into every job.
+    with public.AllFilesRelativePathsFile(
+        self.clone_dir) as all_files_relpaths_path:
+      jobs = (
+        scrape_repos_pb2.ImportWorker(
+            clone_from_url=self.meta.clone_from_url,
+            clone_dir=str(self.clone_dir),
+            abspath=p,
+            all_files_relpaths_path=str(all_files_relpaths_path),
+            preprocessors=indexer.preprocessor,
+        ) for p in paths
+      )
+      progress_bar = progressbar.ProgressBar(max_value=len(paths))
+      for contentfiles in progress_bar(
+          pool.imap_unordered(IndexContentFiles, jobs)):
+        for contentfile in contentfiles:
+          writer.Write(contentfile)
 
   def ContentFiles(self) -> typing.Iterable[scrape_repos_pb2.ContentFile]:
     """Return an iterator over all contentfiles in the repo."""
-    if self.IsIndexed():
-      return (pbutil.FromFile(f, scrape_repos_pb2.ContentFile())
-              for f in self.index_dir.iterdir() if f.name != 'DONE.txt')
-    else:
+    if not self.IsIndexed():
       return []
+    segment_path = packed_index.SegmentPath(self.index_dir)
+    if segment_path.is_file():
+      return packed_index.ReadContentFiles(segment_path)
+    # An index which has not been migrated to the packed format.
+    return (pbutil.FromFile(f, scrape_repos_pb2.ContentFile())
+            for f in packed_index.LegacyContentFilePaths(self.index_dir))
+
 
+def IndexContentFiles(job: scrape_repos_pb2.ImportWorker
+                      ) -> typing.List[scrape_repos_pb2.ContentFile]:
+  """Index content files.
 
-def IndexContentFiles(job: scrape_repos_pb2.ImportWorker) -> None:
-  """Index content files."""
+  Args:
+    job: The file to index.
+
+  Returns:
+    The content files produced by preprocessing the file.
+  """
+  contentfiles = []
   relpath = job.abspath[len(str(job.clone_dir)) + 1:]
   try:
+    if job.HasField('all_files_relpaths_path'):
+      all_files_relpaths = public.ReadAllFilesRelativePaths(
+          pathlib.Path(job.all_files_relpaths_path))
+    else:
+      all_files_relpaths = list(job.all_files_relpaths)
     texts = preprocessors.Preprocess(pathlib.Path(job.clone_dir), relpath,
-                                     job.all_files_relpaths, job.preprocessors)
+                                     all_files_relpaths, job.preprocessors)
     for i, text in enumerate(texts):
       sha256 = hashlib.sha256(text.encode('utf-8'))
-      proto = scrape_repos_pb2.ContentFile(
+      contentfiles.append(scrape_repos_pb2.ContentFile(
           clone_from_url=job.clone_from_url,
           relpath=relpath,
           artifact_index=i,
           sha256=sha256.digest(),
           charcount=len(text),
           linecount=len(text.split('\n')),
-          text=text)
-      path = pathlib.Path(job.index_dir) / (
-          binascii.hexlify(proto.sha256).decode('utf-8') + '.pbtxt')
-      pbutil.ToFile(proto, path)
+          text=text))
   except UnicodeDecodeError:
     logging.warning('Failed to decode %s', relpath)
+  return contentfiles
@@ -60,6 +60,16 @@ def test_GitHubRepo_IsIndexed(test_repo: github_repo.GitHubRepo):
   assert test_repo.IsIndexed()
 
 
+def test_GitHubRepo_ContentFiles_legacy_index(
+    test_repo: github_repo.GitHubRepo):
+  """Test that an index of text format content files is read."""
+  test_repo.index_dir.mkdir(parents=True)
+  pbutil.ToFile(scrape_repos_pb2.ContentFile(text='Hello, world!'),
+                test_repo.index_dir / 'a.pbtxt')
+  (test_repo.index_dir / 'DONE.txt').touch()
+  assert [cf.text for cf in test_repo.ContentFiles()] == ['Hello, world!']
+
+
 def test_GitHubRepo_Index_not_cloned(test_repo: github_repo.GitHubRepo):
   """Indexing a repo which is not cloned does nothing."""
   fs.rm(test_repo.clone_dir)
@@ -104,7 +114,7 @@ public class B {
   assert test_repo.index_dir.is_dir()
 
   assert (test_repo.index_dir / 'DONE.txt').is_file()
-  assert len(list(test_repo.index_dir.iterdir())) == 3
+  assert len(list(test_repo.index_dir.iterdir())) == 2
   contentfiles = list(test_repo.ContentFiles())
   assert len(contentfiles) == 2
 
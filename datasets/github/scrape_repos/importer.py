@@ -54,8 +54,13 @@ def ImportWorker(
   relpath = job.abspath[len(str(job.clone_dir)) + 1:]
   outputs: typing.List[contentfiles.ContentFile] = []
   try:
+    if job.HasField('all_files_relpaths_path'):
+      all_files_relpaths = public.ReadAllFilesRelativePaths(
+          pathlib.Path(job.all_files_relpaths_path))
+    else:
+      all_files_relpaths = list(job.all_files_relpaths)
     texts = preprocessors.Preprocess(pathlib.Path(job.clone_dir), relpath,
-                                     job.all_files_relpaths, job.preprocessors)
+                                     all_files_relpaths, job.preprocessors)
     for i, text in enumerate(texts):
       sha256 = hashlib.sha256(text.encode('utf-8'))
       outputs.append(contentfiles.ContentFile(
@@ -85,38 +90,40 @@ def ImportRepo(session: orm.session.Session,
   repo = contentfiles.GitHubRepository.GetOrAdd(session, meta)
   repo.language = language.language
 
-  for importer in language.importer:
-    if not importer.source_code_pattern:
-      logging.error('No source_code_pattern specified! Stopping now.')
-      return
-
-    pat = importer.source_code_pattern
-    pat = f'{clone_dir}/{pat[1:]}' if pat[0] == '^' else f'{clone_dir}/{pat}'
-    cmd = ['find', str(clone_dir), '-type', 'f', '-regex', pat, '-not',
-           '-path', '*/.git/*']
-    logging.debug('$ %s', ' '.join(cmd))
-    paths = subprocess.check_output(
-        cmd, universal_newlines=True).rstrip().split('\n')
-    if len(paths) == 1 and not paths[0]:
-      logging.debug('No files to import from %s', clone_dir)
-      return
-    logging.info("Importing %s '%s' files from %s ...",
-                 humanize.intcomma(len(paths)),
-                 importer.source_code_pattern, clone_dir)
-    all_files_relpaths = public.GetAllFilesRelativePaths(clone_dir)
-    jobs = [
-      scrape_repos_pb2.ImportWorker(
-          clone_from_url=meta.clone_from_url,
-          clone_dir=str(clone_dir),
-          abspath=p,
-          all_files_relpaths=all_files_relpaths,
-          preprocessors=importer.preprocessor,
-      ) for p in paths
-    ]
-    bar = progressbar.ProgressBar(max_value=len(jobs))
-    for outputs in bar(pool.imap_unordered(ImportWorker, jobs)):
-      for output in outputs:
-        session.add(output)
+  # The file list is written once per repo and read once by each worker,
+  # rather than being copied into every job.
+  with public.AllFilesRelativePathsFile(clone_dir) as all_files_relpaths_path:
+    for importer in language.importer:
+      if not importer.source_code_pattern:
+        logging.error('No source_code_pattern specified! Stopping now.')
+        return
+
+      pat = importer.source_code_pattern
+      pat = f'{clone_dir}/{pat[1:]}' if pat[0] == '^' else f'{clone_dir}/{pat}'
+      cmd = ['find', str(clone_dir), '-type', 'f', '-regex', pat, '-not',
+             '-path', '*/.git/*']
+      logging.debug('$ %s', ' '.join(cmd))
+      paths = subprocess.check_output(
+          cmd, universal_newlines=True).rstrip().split('\n')
+      if len(paths) == 1 and not paths[0]:
+        logging.debug('No files to import from %s', clone_dir)
+        return
+      logging.info("Importing %s '%s' files from %s ...",
+                   humanize.intcomma(len(paths)),
+                   importer.source_code_pattern, clone_dir)
+      jobs = [
+        scrape_repos_pb2.ImportWorker(
+            clone_from_url=meta.clone_from_url,
+            clone_dir=str(clone_dir),
+            abspath=p,
+            all_files_relpaths_path=str(all_files_relpaths_path),
+            preprocessors=importer.preprocessor,
+        ) for p in paths
+      ]
+      bar = progressbar.ProgressBar(max_value=len(jobs))
+      for outputs in bar(pool.imap_unordered(ImportWorker, jobs)):
+        for output in outputs:
+          session.add(output)
 
 
 def ImportFromLanguage(db: contentfiles.ContentFiles,
@@ -93,7 +93,7 @@ public class B {
 
   test_repo = github_repo.GitHubRepo(tempdir / 'src' / 'Owner_Name.pbtxt')
   assert (test_repo.index_dir / 'DONE.txt').is_file()
-  assert len(list(test_repo.index_dir.iterdir())) == 3
+  assert len(list(test_repo.index_dir.iterdir())) == 2
   contentfiles = list(test_repo.ContentFiles())
   assert len(contentfiles) == 2
   assert set([cf.text for cf in contentfiles]) == {
@@ -0,0 +1,97 @@
+"""Migrate content file indexes to the packed index format.
+
+Indexes produced before the packed index format store one text format
+ContentFile proto per content file. This tool packs the content files of each
+repo index into a single segment, and removes the text format protos. Repos
+which have already been migrated are skipped, so the migration may be
+interrupted and resumed.
+"""
+import humanize
+import pathlib
+import progressbar
+from absl import app
+from absl import flags
+from absl import logging
+from phd.lib.labm8 import pbutil
+
+from datasets.github.scrape_repos import packed_index
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('clone_list', None,
+                    'The path to a LanguageCloneList file.')
+
+
+def MigrateIndexDir(index_dir: pathlib.Path) -> int:
+  """Pack the text format content files of a repo index into a segment.
+
+  If the index directory already contains a segment, its content files are
+  carried over into the new segment.
+
+  Args:
+    index_dir: The index directory of a repo.
+
+  Returns:
+    The number of text format content files which were migrated.
+  """
+  paths = packed_index.LegacyContentFilePaths(index_dir)
+  if not paths:
+    return 0
+  segment_path = packed_index.SegmentPath(index_dir)
+  existing = (packed_index.ReadContentFiles(segment_path)
+              if segment_path.is_file() else [])
+  with packed_index.PackedIndexWriter(segment_path) as writer:
+    for contentfile in existing:
+      writer.Write(contentfile)
+    for path in paths:
+      try:
+        writer.Write(pbutil.FromFile(path, scrape_repos_pb2.ContentFile()))
+      except pbutil.DecodeError as e:
+        logging.warning("Skipping unreadable content file '%s': %s", path, e)
+  # The text format protos are removed only once the segment is in place.
+  for path in paths:
+    path.unlink()
+  return len(paths)
+
+
+def MigrateIndex(index_path: pathlib.Path) -> int:
+  """Migrate the repo indexes of a language.
+
+  Args:
+    index_path: The directory containing the index directories of repos.
+
+  Returns:
+    The number of text format content files which were migrated.
+  """
+  index_dirs = [p for p in index_path.iterdir() if p.is_dir()]
+  logging.info('Migrating %s repo indexes in %s ...',
+               humanize.intcomma(len(index_dirs)), index_path)
+  num_migrated = 0
+  for index_dir in progressbar.ProgressBar()(index_dirs):
+    num_migrated += MigrateIndexDir(index_dir)
+  return num_migrated
+
+
+def main(argv):
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError("Unknown arguments '{}'".format(', '.join(argv[1:])))
+
+  clone_list_path = pathlib.Path(FLAGS.clone_list or '')
+  if not clone_list_path.is_file():
+    raise app.UsageError('--clone_list is not a file.')
+  clone_list = pbutil.FromFile(clone_list_path,
+                               scrape_repos_pb2.LanguageCloneList())
+
+  for language in clone_list.language:
+    index_path = pathlib.Path(language.destination_directory + '.index')
+    if index_path.is_dir():
+      num_migrated = MigrateIndex(index_path)
+      logging.info('Migrated %s %s content files',
+                   humanize.intcomma(num_migrated), language.language)
+
+
+if __name__ == '__main__':
+  app.run(main)
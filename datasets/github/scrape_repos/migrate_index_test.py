@@ -0,0 +1,105 @@
+"""Unit tests for //datasets/github/scrape_repos/migrate_index.py."""
+import hashlib
+
+import pathlib
+import pytest
+import sys
+import tempfile
+import typing
+from absl import app
+from absl import flags
+from phd.lib.labm8 import pbutil
+
+from datasets.github.scrape_repos import migrate_index
+from datasets.github.scrape_repos import packed_index
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+FLAGS = flags.FLAGS
+
+
+# Test fixtures.
+
+@pytest.fixture(scope='function')
+def tempdir() -> pathlib.Path:
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    yield pathlib.Path(d)
+
+
+def _ContentFile(text: str) -> scrape_repos_pb2.ContentFile:
+  return scrape_repos_pb2.ContentFile(
+      relpath='src/A.java',
+      sha256=hashlib.sha256(text.encode('utf-8')).digest(),
+      text=text)
+
+
+def _WriteLegacyContentFile(index_dir: pathlib.Path, text: str) -> None:
+  contentfile = _ContentFile(text)
+  pbutil.ToFile(contentfile, index_dir / (
+      hashlib.sha256(text.encode('utf-8')).hexdigest() + '.pbtxt'))
+
+
+def _Texts(index_dir: pathlib.Path) -> typing.Set[str]:
+  return {cf.text for cf in packed_index.ReadContentFiles(
+      packed_index.SegmentPath(index_dir))}
+
+
+def test_MigrateIndexDir(tempdir: pathlib.Path):
+  """Test that text format content files are packed into a segment."""
+  _WriteLegacyContentFile(tempdir, 'a')
+  _WriteLegacyContentFile(tempdir, 'b')
+  (tempdir / 'DONE.txt').touch()
+  assert migrate_index.MigrateIndexDir(tempdir) == 2
+  assert {p.name for p in tempdir.iterdir()} == {
+    'DONE.txt', packed_index.SEGMENT_NAME}
+  assert _Texts(tempdir) == {'a', 'b'}
+  # Migrated indexes are skipped.
+  assert migrate_index.MigrateIndexDir(tempdir) == 0
+
+
+def test_MigrateIndexDir_existing_segment(tempdir: pathlib.Path):
+  """Test that the content files of an existing segment are kept."""
+  with packed_index.PackedIndexWriter(
+      packed_index.SegmentPath(tempdir)) as writer:
+    writer.Write(_ContentFile('a'))
+  _WriteLegacyContentFile(tempdir, 'a')
+  _WriteLegacyContentFile(tempdir, 'b')
+  assert migrate_index.MigrateIndexDir(tempdir) == 2
+  assert [p.name for p in tempdir.iterdir()] == [packed_index.SEGMENT_NAME]
+  assert _Texts(tempdir) == {'a', 'b'}
+  with packed_index.PackedIndexReader(
+      packed_index.SegmentPath(tempdir)) as reader:
+    assert len(reader) == 2
+
+
+def test_MigrateIndexDir_unreadable_file(tempdir: pathlib.Path):
+  """Test that unreadable text format content files are skipped."""
+  _WriteLegacyContentFile(tempdir, 'a')
+  with open(tempdir / 'bad.pbtxt', 'w') as f:
+    f.write('not a proto')
+  assert migrate_index.MigrateIndexDir(tempdir) == 2
+  assert _Texts(tempdir) == {'a'}
+
+
+def test_MigrateIndex(tempdir: pathlib.Path):
+  """Test that the index directory of each repo is migrated."""
+  (tempdir / 'Foo_Bar').mkdir()
+  (tempdir / 'Foo_Baz').mkdir()
+  _WriteLegacyContentFile(tempdir / 'Foo_Bar', 'a')
+  _WriteLegacyContentFile(tempdir / 'Foo_Baz', 'b')
+  _WriteLegacyContentFile(tempdir / 'Foo_Baz', 'c')
+  assert migrate_index.MigrateIndex(tempdir) == 3
+  assert _Texts(tempdir / 'Foo_Bar') == {'a'}
+  assert _Texts(tempdir / 'Foo_Baz') == {'b', 'c'}
+
+
+def main(argv: typing.List[str]):
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError("Unknown arguments: '{}'.".format(' '.join(argv[1:])))
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  flags.FLAGS(['argv[0]', '-v=1'])
+  app.run(main)
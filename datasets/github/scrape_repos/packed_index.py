@@ -0,0 +1,249 @@
+"""A packed index format for the content files of a repo.
+
+The content files of a repo are stored in a single segment file, rather than
+one text format proto per content file. A segment has the layout:
+
+    MAGIC                   8 bytes.
+    Records                 A varint length, followed by a binary ContentFile.
+    Footer                  A binary ContentFileIndex.
+    Footer offset           8 bytes, little endian.
+    MAGIC                   8 bytes.
+
+Records are only ever appended, and the footer is written when the writer is
+closed. Segments are written to a temporary file which is renamed into place
+once complete, so a segment is never observed partially written.
+"""
+import os
+
+import pathlib
+import struct
+import typing
+from absl import logging
+from google.protobuf.internal import decoder
+from google.protobuf.internal import encoder
+
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+# The name of the segment file in a repo's index directory.
+SEGMENT_NAME = 'contentfiles.pack'
+
+MAGIC = b'CFPACK01'
+
+# The footer offset and MAGIC which end a segment.
+_TRAILER = struct.Struct('<Q8s')
+
+# The maximum length of a varint encoded 64 bit integer.
+_MAX_VARINT_SIZE = 10
+
+
+class CorruptSegmentError(ValueError):
+  """Raised if a segment cannot be read."""
+  pass
+
+
+def SegmentPath(index_dir: pathlib.Path) -> pathlib.Path:
+  """Return the path of the segment file for a repo index directory."""
+  return index_dir / SEGMENT_NAME
+
+
+def LegacyContentFilePaths(
+    index_dir: pathlib.Path) -> typing.List[pathlib.Path]:
+  """Return the paths of text format content files in an index directory.
+
+  These are produced by indexers which pre-date the packed index format.
+  """
+  return sorted(path for path in index_dir.iterdir() if path.suffix == '.pbtxt')
+
+
+class PackedIndexWriter(object):
+  """Write content files to a segment.
+
+  Content files with the same sha256 as a previously written content file are
+  skipped. Use as a context manager, or call Close() to finish the segment:
+
+      with PackedIndexWriter(path) as writer:
+        writer.Write(contentfile)
+  """
+
+  def __init__(self, path: pathlib.Path):
+    """Instantiate a writer.
+
+    Args:
+      path: The path of the segment to write. An existing segment at this path
+        is replaced when the writer is closed.
+    """
+    self.path = path
+    self._tmp_path = path.parent / f'.{path.name}.tmp'
+    self._file = open(self._tmp_path, 'wb')
+    self._file.write(MAGIC)
+    self._offset = len(MAGIC)
+    self._footer = scrape_repos_pb2.ContentFileIndex()
+    self._sha256s: typing.Set[bytes] = set()
+
+  def __len__(self) -> int:
+    return len(self._footer.entry)
+
+  def Write(self, contentfile: scrape_repos_pb2.ContentFile) -> bool:
+    """Append a content file to the segment.
+
+    Args:
+      contentfile: The content file to write.
+
+    Returns:
+      True if the content file was written, else False if a content file with
+      the same sha256 has already been written.
+    """
+    if contentfile.sha256 in self._sha256s:
+      return False
+    data = contentfile.SerializeToString()
+    record = encoder._VarintBytes(len(data)) + data
+    self._file.write(record)
+    self._footer.entry.add(sha256=contentfile.sha256, offset=self._offset)
+    self._sha256s.add(contentfile.sha256)
+    self._offset += len(record)
+    return True
+
+  def Close(self) -> None:
+    """Write the footer and move the segment into place."""
+    self._file.write(self._footer.SerializeToString())
+    self._file.write(_TRAILER.pack(self._offset, MAGIC))
+    self._file.close()
+    os.replace(self._tmp_path, self.path)
+
+  def Abort(self) -> None:
+    """Discard the segment."""
+    self._file.close()
+    self._tmp_path.unlink()
+
+  def __enter__(self) -> 'PackedIndexWriter':
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    if exc_type is None:
+      self.Close()
+    else:
+      self.Abort()
+
+
+class PackedIndexReader(object):
+  """Read the content files of a segment.
+
+  Iterating over the reader streams the content files in the order that they
+  were written. Individual content files can be looked up by sha256 using the
+  footer.
+  """
+
+  def __init__(self, path: pathlib.Path):
+    """Open a segment.
+
+    Args:
+      path: The path of the segment.
+
+    Raises:
+      CorruptSegmentError: If the segment is truncated or is not a segment.
+    """
+    self.path = path
+    self._file = open(path, 'rb')
+    try:
+      self._footer_offset, self.footer = self._ReadFooter()
+    except Exception:
+      self._file.close()
+      raise
+    self._offsets: typing.Optional[typing.Dict[bytes, int]] = None
+
+  def __len__(self) -> int:
+    return len(self.footer.entry)
+
+  def __contains__(self, sha256: bytes) -> bool:
+    return sha256 in self._GetOffsets()
+
+  def __iter__(self) -> typing.Iterator[scrape_repos_pb2.ContentFile]:
+    self._file.seek(len(MAGIC))
+    offset = len(MAGIC)
+    while offset < self._footer_offset:
+      size, data = self._ReadRecord()
+      offset += size
+      contentfile = scrape_repos_pb2.ContentFile()
+      contentfile.ParseFromString(data)
+      yield contentfile
+
+  def Get(self, sha256: bytes) -> scrape_repos_pb2.ContentFile:
+    """Read a content file by sha256.
+
+    Args:
+      sha256: The sha256 of the content file.
+
+    Returns:
+      A ContentFile message.
+
+    Raises:
+      KeyError: If the segment does not contain the content file.
+    """
+    self._file.seek(self._GetOffsets()[sha256])
+    _, data = self._ReadRecord()
+    contentfile = scrape_repos_pb2.ContentFile()
+    contentfile.ParseFromString(data)
+    return contentfile
+
+  def Close(self) -> None:
+    self._file.close()
+
+  def __enter__(self) -> 'PackedIndexReader':
+    return self
+
+  def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+    self.Close()
+
+  def _GetOffsets(self) -> typing.Dict[bytes, int]:
+    if self._offsets is None:
+      self._offsets = {e.sha256: e.offset for e in self.footer.entry}
+    return self._offsets
+
+  def _ReadFooter(self) -> typing.Tuple[int, scrape_repos_pb2.ContentFileIndex]:
+    size = self._file.seek(0, os.SEEK_END)
+    if size < len(MAGIC) + _TRAILER.size:
+      raise CorruptSegmentError(f"Segment is truncated: '{self.path}'")
+    self._file.seek(0)
+    if self._file.read(len(MAGIC)) != MAGIC:
+      raise CorruptSegmentError(f"File is not a segment: '{self.path}'")
+    self._file.seek(size - _TRAILER.size)
+    footer_offset, magic = _TRAILER.unpack(self._file.read(_TRAILER.size))
+    footer_size = size - _TRAILER.size - footer_offset
+    if magic != MAGIC or footer_offset < len(MAGIC) or footer_size < 0:
+      raise CorruptSegmentError(f"Segment is truncated: '{self.path}'")
+    self._file.seek(footer_offset)
+    footer = scrape_repos_pb2.ContentFileIndex()
+    try:
+      footer.ParseFromString(self._file.read(footer_size))
+    except decoder._DecodeError:
+      raise CorruptSegmentError(f"Segment footer is corrupt: '{self.path}'")
+    return footer_offset, footer
+
+  def _ReadRecord(self) -> typing.Tuple[int, bytes]:
+    """Read the record at the current position, returning its size and data."""
+    header = self._file.read(_MAX_VARINT_SIZE)
+    try:
+      length, header_size = decoder._DecodeVarint(header, 0)
+    except (IndexError, decoder._DecodeError):
+      raise CorruptSegmentError(f"Segment is truncated: '{self.path}'")
+    self._file.seek(header_size - len(header), os.SEEK_CUR)
+    data = self._file.read(length)
+    if len(data) != length:
+      raise CorruptSegmentError(f"Segment is truncated: '{self.path}'")
+    return header_size + length, data
+
+
+def ReadContentFiles(
+    path: pathlib.Path) -> typing.Iterator[scrape_repos_pb2.ContentFile]:
+  """Stream the content files of a segment.
+
+  Args:
+    path: The path of the segment.
+
+  Returns:
+    An iterator of ContentFile messages.
+  """
+  with PackedIndexReader(path) as reader:
+    logging.debug('Reading %d content files from %s', len(reader), path)
+    yield from reader
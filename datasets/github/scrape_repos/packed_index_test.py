@@ -0,0 +1,129 @@
+"""Unit tests for //datasets/github/scrape_repos/packed_index.py."""
+import hashlib
+
+import pathlib
+import pytest
+import sys
+import tempfile
+import typing
+from absl import app
+from absl import flags
+
+from datasets.github.scrape_repos import packed_index
+from datasets.github.scrape_repos.proto import scrape_repos_pb2
+
+
+FLAGS = flags.FLAGS
+
+
+# Test fixtures.
+
+@pytest.fixture(scope='function')
+def tempdir() -> pathlib.Path:
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    yield pathlib.Path(d)
+
+
+def _ContentFile(text: str) -> scrape_repos_pb2.ContentFile:
+  return scrape_repos_pb2.ContentFile(
+      clone_from_url='https://github.com/Foo/Bar.git',
+      relpath='src/A.java',
+      sha256=hashlib.sha256(text.encode('utf-8')).digest(),
+      charcount=len(text),
+      text=text)
+
+
+def _WriteSegment(path: pathlib.Path, texts: typing.List[str]) -> None:
+  with packed_index.PackedIndexWriter(path) as writer:
+    for text in texts:
+      writer.Write(_ContentFile(text))
+
+
+# PackedIndexWriter tests.
+
+def test_PackedIndexWriter_empty_segment(tempdir: pathlib.Path):
+  """Test that an empty segment can be read."""
+  _WriteSegment(tempdir / 'a.pack', [])
+  with packed_index.PackedIndexReader(tempdir / 'a.pack') as reader:
+    assert len(reader) == 0
+    assert not list(reader)
+
+
+def test_PackedIndexWriter_skips_duplicates(tempdir: pathlib.Path):
+  """Test that content files with the same sha256 are written once."""
+  with packed_index.PackedIndexWriter(tempdir / 'a.pack') as writer:
+    assert writer.Write(_ContentFile('a'))
+    assert writer.Write(_ContentFile('b'))
+    assert not writer.Write(_ContentFile('a'))
+    assert len(writer) == 2
+  assert [cf.text for cf in packed_index.ReadContentFiles(
+      tempdir / 'a.pack')] == ['a', 'b']
+
+
+def test_PackedIndexWriter_exception(tempdir: pathlib.Path):
+  """Test that a segment is not written if writing fails."""
+  _WriteSegment(tempdir / 'a.pack', ['a'])
+  with pytest.raises(ValueError):
+    with packed_index.PackedIndexWriter(tempdir / 'a.pack') as writer:
+      writer.Write(_ContentFile('b'))
+      raise ValueError
+  # The existing segment is untouched.
+  assert [p.name for p in tempdir.iterdir()] == ['a.pack']
+  assert [cf.text for cf in packed_index.ReadContentFiles(
+      tempdir / 'a.pack')] == ['a']
+
+
+# PackedIndexReader tests.
+
+def test_PackedIndexReader_iter(tempdir: pathlib.Path):
+  """Test that content files are streamed in the order they were written."""
+  texts = ['a' * i for i in range(1, 300)]
+  _WriteSegment(tempdir / 'a.pack', texts)
+  with packed_index.PackedIndexReader(tempdir / 'a.pack') as reader:
+    assert len(reader) == len(texts)
+    contentfiles = list(reader)
+  assert [cf.text for cf in contentfiles] == texts
+  assert contentfiles[0] == _ContentFile('a')
+
+
+def test_PackedIndexReader_Get(tempdir: pathlib.Path):
+  """Test looking up content files by sha256."""
+  _WriteSegment(tempdir / 'a.pack', ['a', 'b', 'c'])
+  with packed_index.PackedIndexReader(tempdir / 'a.pack') as reader:
+    assert reader.Get(_ContentFile('b').sha256).text == 'b'
+    assert reader.Get(_ContentFile('a').sha256).text == 'a'
+    assert _ContentFile('c').sha256 in reader
+    assert _ContentFile('d').sha256 not in reader
+    with pytest.raises(KeyError):
+      reader.Get(_ContentFile('d').sha256)
+
+
+def test_PackedIndexReader_truncated(tempdir: pathlib.Path):
+  """Test that a truncated segment raises an error."""
+  _WriteSegment(tempdir / 'a.pack', ['a', 'b'])
+  with open(tempdir / 'a.pack', 'rb') as f:
+    data = f.read()
+  with open(tempdir / 'a.pack', 'wb') as f:
+    f.write(data[:-4])
+  with pytest.raises(packed_index.CorruptSegmentError):
+    packed_index.PackedIndexReader(tempdir / 'a.pack')
+
+
+def test_PackedIndexReader_not_a_segment(tempdir: pathlib.Path):
+  """Test that a file which is not a segment raises an error."""
+  with open(tempdir / 'a.pack', 'w') as f:
+    f.write('Hello, world! This is not a segment.')
+  with pytest.raises(packed_index.CorruptSegmentError):
+    packed_index.PackedIndexReader(tempdir / 'a.pack')
+
+
+def main(argv: typing.List[str]):
+  """Main entry point."""
+  if len(argv) > 1:
+    raise app.UsageError("Unknown arguments: '{}'.".format(' '.join(argv[1:])))
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  flags.FLAGS(['argv[0]', '-v=1'])
+  app.run(main)
@@ -1,5 +1,7 @@
 """Preprocessors to inline includes."""
+import bisect
 import collections
+import functools
 import pathlib
 import re
 import sys
@@ -106,15 +108,17 @@ def _InlineCSyntax(import_root: pathlib.Path, file_relpath: str,
     else:
       return []
 
+  include_index = GetIncludeIndex(all_file_relpaths)
   return InlineHeaders(
       import_root, file_relpath, text,
-      inline_candidate_relpaths=set(all_file_relpaths),
+      inline_candidate_relpaths=include_index.relpaths,
       already_inlined_relpaths=set(),
       blacklist=blacklist,
       find_includes=FindIncludes,
       format_include=lambda line: f'#include "{line}"',
       format_line_comment=lambda line: f'// [InlineHeaders] {line}',
-      discard_unmatched_headers=discard_unknown)
+      discard_unmatched_headers=discard_unknown,
+      include_index=include_index)
 
 
 def InlineHeaders(import_root: pathlib.Path,
@@ -126,7 +130,8 @@ def InlineHeaders(import_root: pathlib.Path,
                   find_includes: typing.Callable[[str], typing.List[str]],
                   format_include: typing.Callable[[str], str],
                   format_line_comment: typing.Callable[[str], str],
-                  discard_unmatched_headers: bool) -> str:
+                  discard_unmatched_headers: bool,
+                  include_index: typing.Optional['IncludeIndex'] = None) -> str:
   """Recursively inline included files and return the inlined text.
 
   Args:
@@ -134,9 +139,11 @@ def InlineHeaders(import_root: pathlib.Path,
     file_relpath: The path of the file to process, relative to import_root.
     text: The text of the target file to inline the headers of.
     inline_candidate_relpaths: Paths to all files which are candidates for
-      inlining, relative to import_root.
+      inlining, relative to import_root. This is not modified, so the same set
+      may be shared by every file of a repo.
     already_inlined_relpaths: Paths to files which have already been inlined.
       Files are never inlined twice. Duplicate inlines are always discarded.
+      Inlined files are added to this set.
     blacklist: A set of files to exclude from inlining.
     find_includes: A callback which searches a line of code and returns
       zero or more paths included by it.
@@ -150,12 +157,13 @@ def InlineHeaders(import_root: pathlib.Path,
       the contents of the line.
     discard_unmatched_headers: If True, included paths which cannot be resolved
       are discarded.
+    include_index: An index of inline_candidate_relpaths, or of a superset of
+      them, used to resolve includes without scanning every candidate.
 
   Returns:
     The path with as many included files inlined as possible.
   """
   logging.debug('Inlining: %s.', file_relpath)
-  inline_candidate_relpaths.remove(file_relpath)
   already_inlined_relpaths.add(file_relpath)
   output = []
 
@@ -183,7 +191,9 @@ def InlineHeaders(import_root: pathlib.Path,
         continue
 
       candidate_match = FindCandidateInclude(
-          include, file_relpath, inline_candidate_relpaths)
+          include, file_relpath, inline_candidate_relpaths,
+          include_index=include_index,
+          excluded_relpaths=already_inlined_relpaths)
       if candidate_match.confidence:
         output.append(format_line_comment(
             f"Found candidate include for: "
@@ -195,7 +205,7 @@ def InlineHeaders(import_root: pathlib.Path,
             import_root, candidate_match.path, candidate_text,
             inline_candidate_relpaths,
             already_inlined_relpaths, blacklist, find_includes, format_include,
-            format_line_comment, discard_unmatched_headers))
+            format_line_comment, discard_unmatched_headers, include_index))
         continue
 
       # No match found :(
@@ -210,6 +220,70 @@ def InlineHeaders(import_root: pathlib.Path,
   return '\n'.join(output)
 
 
+class IncludeIndex(object):
+  """An index of file paths, for resolving included files.
+
+  The paths are stored reversed and in sorted order, so that the paths which end
+  with a given string form a contiguous range which is found by binary search,
+  rather than by scanning every path.
+  """
+
+  def __init__(self, relpaths: typing.Iterable[str]):
+    """Instantiate an include index.
+
+    Args:
+      relpaths: The paths to index.
+    """
+    self.relpaths = frozenset(relpaths)
+    self._reversed_relpaths = sorted(x[::-1] for x in self.relpaths)
+    self._paths_ending_with: typing.Dict[str, typing.List[str]] = {}
+
+  def PathsEndingWith(self, suffix: str) -> typing.List[str]:
+    """Return the indexed paths which end with a string.
+
+    Args:
+      suffix: The string to match.
+
+    Returns:
+      A sorted list of paths.
+    """
+    if suffix not in self._paths_ending_with:
+      reversed_suffix = suffix[::-1]
+      i = bisect.bisect_left(self._reversed_relpaths, reversed_suffix)
+      paths = []
+      while (i < len(self._reversed_relpaths) and
+             self._reversed_relpaths[i].startswith(reversed_suffix)):
+        paths.append(self._reversed_relpaths[i][::-1])
+        i += 1
+      self._paths_ending_with[suffix] = sorted(paths)
+    return self._paths_ending_with[suffix]
+
+
+# The most recently built include index, and the file list it was built from.
+# The file list of a repo is shared by all of its files, so a single entry
+# suffices.
+_include_index_cache = (None, None)
+
+
+def GetIncludeIndex(all_file_relpaths: typing.List[str]) -> IncludeIndex:
+  """Get the include index of a file list.
+
+  The index is rebuilt only when called with a different file list object, so
+  the file list must not be modified after first use.
+
+  Args:
+    all_file_relpaths: A list of paths.
+
+  Returns:
+    An IncludeIndex of the paths.
+  """
+  global _include_index_cache
+  if _include_index_cache[0] is not all_file_relpaths:
+    _include_index_cache = (all_file_relpaths,
+                            IncludeIndex(all_file_relpaths))
+  return _include_index_cache[1]
+
+
 FuzzyIncludeMatch = collections.namedtuple(
     'FuzzyIncludeMatch', ['path', 'confidence'])
 
@@ -217,7 +291,10 @@ FuzzyIncludeMatch = collections.namedtuple(
 def FindCandidateInclude(
     include_match: str, current_file_relpath: str,
     candidate_relpaths: typing.Set[str],
-    exact_matches_only: bool = False) -> FuzzyIncludeMatch:
+    exact_matches_only: bool = False,
+    include_index: typing.Optional[IncludeIndex] = None,
+    excluded_relpaths: typing.Optional[typing.Set[str]] = None
+) -> FuzzyIncludeMatch:
   """Find and return the most likely included file.
 
   Args:
@@ -225,6 +302,10 @@ def FindCandidateInclude(
     current_file_relpath: The path of the file we're currently processing.
     candidate_relpaths: The set of files to consider for matching.
     exact_matches_only: If True, do no fuzzy matching of possible candidates.
+    include_index: An index of candidate_relpaths, or of a superset of them.
+      If not provided, every candidate is scanned.
+    excluded_relpaths: Members of candidate_relpaths which are not to be
+      considered.
 
   Returns:
     A FuzzyIncludeMatch instance. If no suitable candidate was found, the path
@@ -233,24 +314,44 @@ def FindCandidateInclude(
     is an integer between between 0 and 100, where 100 indicates a perfect
     match.
   """
-  if include_match in candidate_relpaths:
+  excluded_relpaths = excluded_relpaths or set()
+
+  def IsCandidate(relpath: str) -> bool:
+    return relpath in candidate_relpaths and relpath not in excluded_relpaths
+
+  if IsCandidate(include_match):
     return FuzzyIncludeMatch(include_match, 100)
+  if exact_matches_only:
+    return FuzzyIncludeMatch('', 0)
 
-  # A list of files with the same basename as include match's basename
-  candidate_matches = [
-    x for x in candidate_relpaths if x.endswith(include_match)]
-  if candidate_matches and not exact_matches_only:
-    # Fuzzy match to find the most likely include.
-    choices = (
-        process.extract(include_match, candidate_matches) +
-        process.extract(pathlib.Path(current_file_relpath).name,
-                        candidate_matches)
-    )
-    return FuzzyIncludeMatch(*max(choices, key=lambda x: x[1]))
+  # The candidates whose paths end with the include path.
+  if include_index:
+    candidate_matches = [x for x in include_index.PathsEndingWith(include_match)
+                         if IsCandidate(x)]
+  else:
+    candidate_matches = sorted(
+        x for x in candidate_relpaths
+        if x.endswith(include_match) and x not in excluded_relpaths)
+  if candidate_matches:
+    return _FuzzyMatchInclude(include_match,
+                              pathlib.Path(current_file_relpath).name,
+                              tuple(candidate_matches))
   else:
     return FuzzyIncludeMatch('', 0)
 
 
+@functools.lru_cache(maxsize=4096)
+def _FuzzyMatchInclude(include_match: str, current_file_name: str,
+                       candidate_matches: typing.Tuple[str, ...]
+                       ) -> FuzzyIncludeMatch:
+  """Fuzzy match to find the most likely include. Memoized."""
+  choices = (
+      process.extract(include_match, candidate_matches) +
+      process.extract(current_file_name, candidate_matches)
+  )
+  return FuzzyIncludeMatch(*max(choices, key=lambda x: x[1]))
+
+
 def GetLibCxxHeaders() -> typing.Set[str]:
   """Enumerate the set of headers in the libcxx standard lib."""
   return CXX_HEADERS
@@ -131,6 +131,20 @@ int main(int argc, char** argv) { return 0; }
   ])
 
 
+def test_CxxHeaders_shared_file_list(tempdir: pathlib.Path):
+  """CxxHeaders() inlines a header into every file of a repo which includes it."""
+  src = '#include "foo.h"'
+  MakeFile(tempdir, 'a.c', src)
+  MakeFile(tempdir, 'b.c', src)
+  MakeFile(tempdir, 'foo.h', '#define FOO')
+  relpaths = ['a.c', 'b.c', 'foo.h']
+  expected = ["""\
+// [InlineHeaders] Found candidate include for: 'foo.h' -> 'foo.h' (100% confidence).
+#define FOO"""]
+  assert inliners.CxxHeaders(tempdir, 'a.c', src, relpaths) == expected
+  assert inliners.CxxHeaders(tempdir, 'b.c', src, relpaths) == expected
+
+
 # CxxHeadersDiscardUnknown() tests.
 
 
@@ -149,6 +163,65 @@ int main(int argc, char** argv) { return 0; }
 """]
 
 
+# IncludeIndex tests.
+
+def test_IncludeIndex_PathsEndingWith():
+  """Test that paths are matched by suffix."""
+  index = inliners.IncludeIndex(['a/foo.h', 'b/foo.h', 'b/xfoo.h', 'foo.c'])
+  assert index.PathsEndingWith('foo.h') == ['a/foo.h', 'b/foo.h', 'b/xfoo.h']
+  assert index.PathsEndingWith('b/foo.h') == ['b/foo.h']
+  assert index.PathsEndingWith('bar.h') == []
+
+
+def test_GetIncludeIndex_reused():
+  """Test that the index of a file list is built once."""
+  relpaths = ['a/foo.h']
+  assert inliners.GetIncludeIndex(relpaths) is inliners.GetIncludeIndex(
+      relpaths)
+  assert inliners.GetIncludeIndex(relpaths) is not inliners.GetIncludeIndex(
+      ['a/foo.h'])
+
+
+# FindCandidateInclude() tests.
+
+def test_FindCandidateInclude_include_index():
+  """Test that an include index produces the same matches as a scan."""
+  relpaths = ['src/proj/src.c', 'src/proj/foo/foo.h', 'bar/foo/proj/foo/foo.h',
+              'foo.h']
+  index = inliners.IncludeIndex(relpaths)
+  for include in ['foo.h', 'proj/foo/foo.h', 'bar.h']:
+    candidates = set(relpaths) - {'foo.h'}
+    assert inliners.FindCandidateInclude(
+        include, 'src/proj/src.c', candidates, include_index=index) == (
+             inliners.FindCandidateInclude(include, 'src/proj/src.c',
+                                           candidates))
+
+
+def test_FindCandidateInclude_exact_matches_only():
+  """Test that no fuzzy match is made when exact matches are requested."""
+  assert inliners.FindCandidateInclude(
+      'foo.h', 'a.c', {'a/foo.h'}, exact_matches_only=True) == ('', 0)
+  assert inliners.FindCandidateInclude(
+      'a/foo.h', 'a.c', {'a/foo.h'}, exact_matches_only=True) == ('a/foo.h',
+                                                                   100)
+
+
+def test_FindCandidateInclude_excluded_relpaths():
+  """Test that excluded candidates are not matched."""
+  relpaths = {'a/foo.h', 'b/foo.h'}
+  index = inliners.IncludeIndex(relpaths)
+  for include_index in [None, index]:
+    assert inliners.FindCandidateInclude(
+        'foo.h', 'a.c', relpaths, include_index=include_index,
+        excluded_relpaths={'a/foo.h'}) == ('b/foo.h', 95)
+    assert inliners.FindCandidateInclude(
+        'a/foo.h', 'a.c', relpaths, include_index=include_index,
+        excluded_relpaths={'a/foo.h'}) == ('', 0)
+    assert inliners.FindCandidateInclude(
+        'foo.h', 'a.c', relpaths, include_index=include_index,
+        excluded_relpaths=relpaths) == ('', 0)
+
+
 # GetLibCxxHeaders() tests.
 
 def test_GetLibCxxHeaders():
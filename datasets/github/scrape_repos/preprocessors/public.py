@@ -1,6 +1,9 @@
 """This file defines the decorator for marking a dataset preprocessor."""
+import contextlib
+import os
 import pathlib
 import subprocess
+import tempfile
 import typing
 
 from absl import flags
@@ -79,3 +82,56 @@ def GetAllFilesRelativePaths(root_dir: pathlib.Path,
     return [x[2:] for x in find_output.split('\n')]
   else:
     return []
+
+
+@contextlib.contextmanager
+def AllFilesRelativePathsFile(root_dir: pathlib.Path) -> pathlib.Path:
+  """Write the relative paths to all files in a directory to a file.
+
+  This is used to share the file list of a repository with worker processes,
+  which read it using ReadAllFilesRelativePaths(), rather than sending the
+  whole list with every job.
+
+  Args:
+    root_dir: The directory to find files in.
+
+  Returns:
+    The path of a file containing the relative paths of all files in
+    root_dir, one per line. The file is deleted on leaving the scope.
+  """
+  relpaths = GetAllFilesRelativePaths(root_dir)
+  fd, path = tempfile.mkstemp(prefix='phd_all_files_relpaths_')
+  try:
+    with os.fdopen(fd, 'w') as f:
+      f.write('\n'.join(relpaths))
+    yield pathlib.Path(path)
+  finally:
+    os.unlink(path)
+
+
+# The file list most recently read by ReadAllFilesRelativePaths(), and the
+# identity of the file it was read from. Workers process the files of one
+# repository at a time, so a single entry suffices.
+_all_files_relpaths_cache = (None, [])
+
+
+def ReadAllFilesRelativePaths(path: pathlib.Path) -> typing.List[str]:
+  """Read a file list written by AllFilesRelativePathsFile().
+
+  The file list is cached, so that repeated calls with the same file return
+  the same list without reading the file again.
+
+  Args:
+    path: The path of the file list.
+
+  Returns:
+    A list of paths relative to the root directory.
+  """
+  global _all_files_relpaths_cache
+  stat = os.stat(path)
+  key = (str(path), stat.st_ino, stat.st_mtime_ns)
+  if _all_files_relpaths_cache[0] != key:
+    with open(path) as f:
+      text = f.read()
+    _all_files_relpaths_cache = (key, text.split('\n') if text else [])
+  return _all_files_relpaths_cache[1]
@@ -25,6 +25,26 @@ def test_GetAllFilesRelativePaths_relpath(tempdir: pathlib.Path):
   assert public.GetAllFilesRelativePaths(tempdir) == ['a']
 
 
+# ReadAllFilesRelativePaths() tests.
+
+def test_ReadAllFilesRelativePaths_empty_dir(tempdir: pathlib.Path):
+  """Test that an empty directory returns an empty list."""
+  with public.AllFilesRelativePathsFile(tempdir) as path:
+    assert public.ReadAllFilesRelativePaths(path) == []
+  assert not path.is_file()
+
+
+def test_ReadAllFilesRelativePaths_relpaths(tempdir: pathlib.Path):
+  """Test that the file list round-trips and is cached."""
+  (tempdir / 'a').touch()
+  (tempdir / 'b').mkdir()
+  (tempdir / 'b' / 'c').touch()
+  with public.AllFilesRelativePathsFile(tempdir) as path:
+    relpaths = public.ReadAllFilesRelativePaths(path)
+    assert sorted(relpaths) == ['a', 'b/c']
+    assert public.ReadAllFilesRelativePaths(path) is relpaths
+
+
 def main(argv):
   """Main entry point."""
   if len(argv) > 1:
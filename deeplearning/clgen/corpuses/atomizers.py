@@ -125,6 +125,12 @@ class AtomizerBase(object):
 class AsciiCharacterAtomizer(AtomizerBase):
   """An atomizer for character-level syntactic modelling."""
 
+  def _UpdateVocabulary(self) -> None:
+    """Private method which must be called if vocab is modified."""
+    super(AsciiCharacterAtomizer, self)._UpdateVocabulary()
+    # The lookup table is lazily constructed by AtomizeString().
+    self._lookup_table = None
+
   def AtomizeString(self, text: str) -> np.array:
     """Atomize a text into an array of vocabulary indices.
 
@@ -134,10 +140,45 @@ class AsciiCharacterAtomizer(AtomizerBase):
     Returns:
       An array of indices into vocabulary for all atoms in text.
     """
+    if getattr(self, '_lookup_table', None) is None:
+      self._lookup_table = self._BuildLookupTable()
     try:
-      return np.array(list(map(lambda x: self.vocab[x], text)), dtype=np.int32)
-    except KeyError:
+      # Decode the text into an array of unicode code points, and map the code
+      # points through the lookup table.
+      codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    except UnicodeEncodeError:
+      # Text containing unpaired surrogates cannot be encoded, so fall back to
+      # a per-character lookup.
+      try:
+        return np.array([self.vocab[x] for x in text], dtype=np.int32)
+      except KeyError:
+        raise errors.VocabError
+    if codes.size and codes.max() >= len(self._lookup_table):
       raise errors.VocabError
+    indices = self._lookup_table[codes]
+    if indices.size and indices.min() < 0:
+      raise errors.VocabError
+    return indices
+
+  def _BuildLookupTable(self) -> np.ndarray:
+    """Build a table which maps unicode code points to vocabulary indices.
+
+    Code points which are not in the vocabulary map to -1. Multi-character
+    atoms can never be matched by a character-level atomizer, so are ignored.
+    """
+    chars = {atom: index for atom, index in self.vocab.items()
+             if len(atom) == 1}
+    table = np.full(max([ord(c) for c in chars], default=-1) + 1, -1,
+                    dtype=np.int32)
+    for char, index in chars.items():
+      table[ord(char)] = index
+    return table
+
+  def __getstate__(self) -> typing.Dict[str, typing.Any]:
+    # Don't pickle the lookup table, it is cheap to reconstruct.
+    state = self.__dict__.copy()
+    state['_lookup_table'] = None
+    return state
 
   def __repr__(self) -> str:
     return f'AsciiCharacterAtomizer[{self.vocab_size} chars]'
@@ -162,18 +203,36 @@ class AsciiCharacterAtomizer(AtomizerBase):
 class GreedyAtomizer(AtomizerBase):
   """A greedy atomizer supports multi-character tokens."""
 
+  # The key marking the end of a token in trie nodes. This cannot collide with
+  # a character key, as characters are strings.
+  TOKEN_END = None
+
   def __init__(self, vocab: typing.Dict[str, int], determine_chars=False):
     self.determine_chars = determine_chars
     super(GreedyAtomizer, self).__init__(vocab)
+    self.trie = self._BuildTrie()
+
+  def _BuildTrie(self) -> typing.Dict[str, typing.Any]:
+    """Build a prefix trie of the multi-character tokens in the vocabulary.
 
-    multichars = set(k for k in self.atoms if len(k) > 1)
-    first_chars = set(a[0] for a in multichars)
-    self.lookup = dict(
-        (c, [a for a in multichars if a[0] == c]) for c in first_chars)
+    Each node of the trie is a dictionary mapping the next character of a token
+    to a child node. Nodes which end a token contain the TOKEN_END key.
+    """
+    trie = {}
+    for atom in self.vocab:
+      if len(atom) > 1:
+        node = trie
+        for char in atom:
+          node = node.setdefault(char, {})
+        node[self.TOKEN_END] = True
+    return trie
 
   def AtomizeString(self, text: str) -> np.array:
     """Atomize a text into an array of vocabulary indices.
 
+    The text is tokenized greedily, by selecting the longest multi-character
+    token which matches at each position in the text, else a single character.
+
     Args:
       text: Input text.
 
@@ -190,30 +249,23 @@ class GreedyAtomizer(AtomizerBase):
 
     indices = []
     i = 0
-    j = 2
+    n = len(text)
     try:
-      while i < len(text):
-        if self.lookup.get(text[i]):
-          if j <= len(text) and any(
-              x.startswith(text[i:j]) for x in self.lookup[text[i]]):
-            j += 1
-          else:
-            while j > i + 1:
-              if any(x == text[i:j] for x in self.lookup[text[i]]):
-                indices.append(self.vocab[text[i:j]])
-                i = j
-                j += 2
-                break
-              else:
-                j -= 1
-            else:
-              indices.append(_AddToVocab(text[i]))
-              i += 1
-              j += 2
+      while i < n:
+        # Walk the trie to find the end of the longest token at i.
+        end = i + 1
+        node = self.trie.get(text[i])
+        j = i + 1
+        while node is not None and j < n:
+          node = node.get(text[j])
+          j += 1
+          if node is not None and self.TOKEN_END in node:
+            end = j
+        if end > i + 1:
+          indices.append(self.vocab[text[i:end]])
         else:
           indices.append(_AddToVocab(text[i]))
-          i += 1
-          j += 2
+        i = end
     except KeyError:
       raise errors.VocabError
 
@@ -222,6 +274,19 @@ class GreedyAtomizer(AtomizerBase):
 
     return np.array(indices, dtype=np.int32)
 
+  def __getstate__(self) -> typing.Dict[str, typing.Any]:
+    # Don't pickle the trie, it is cheap to reconstruct.
+    state = self.__dict__.copy()
+    state.pop('trie', None)
+    return state
+
+  def __setstate__(self, state: typing.Dict[str, typing.Any]) -> None:
+    # Atomizers pickled before the trie was introduced contain a 'lookup'
+    # table of multi-character tokens instead.
+    state.pop('lookup', None)
+    self.__dict__.update(state)
+    self.trie = self._BuildTrie()
+
   def __repr__(self) -> str:
     return f'GreedyAtomizer[{self.vocab_size} tokens]'
 
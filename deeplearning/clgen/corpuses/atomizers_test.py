@@ -1,12 +1,14 @@
 """Unit tests for //deeplearning/clgen/atomizers.py."""
 import pathlib
 import pytest
+import subprocess
 import sys
 import tempfile
 from absl import app
 
 import deeplearning.clgen.errors
 from deeplearning.clgen.corpuses import atomizers
+from phd.lib.labm8 import bazelutil
 
 
 # The set of multichar tokens for the OpenCL programming language.
@@ -32,6 +34,16 @@ OPENCL_ATOMS = set(
      'union', 'unsigned', 'void', 'volatile', 'while', 'wide', 'write_only', ])
 
 
+@pytest.fixture(scope='module')
+def tiny_corpus() -> str:
+  """A test fixture which returns the concatenated tiny OpenCL corpus."""
+  with tempfile.TemporaryDirectory() as d:
+    subprocess.check_call(['tar', '-xjf', str(bazelutil.DataPath(
+        'phd/deeplearning/clgen/tests/data/tiny/corpus.tar.bz2')), '-C', d])
+    paths = sorted((pathlib.Path(d) / 'corpus').iterdir())
+    return '\n\n'.join(path.read_text() for path in paths)
+
+
 # AsciiCharacterAtomizer
 
 
@@ -76,6 +88,25 @@ def test_AsciiCharacterAtomizer_AtomizeString_vocab_error():
     c.AtomizeString('abcdeabc')
 
 
+def test_AsciiCharacterAtomizer_AtomizeString_unicode():
+  c = atomizers.AsciiCharacterAtomizer({'a': 1, '\u00e9': 2, '\u4e2d': 3})
+  assert list(c.AtomizeString('a\u4e2d\u00e9')) == [1, 3, 2]
+
+
+def test_AsciiCharacterAtomizer_AtomizeString_empty():
+  c = atomizers.AsciiCharacterAtomizer({'a': 1, 'b': 2, 'c': 3})
+  assert list(c.AtomizeString('')) == []
+
+
+def test_AsciiCharacterAtomizer_AtomizeString_vocab_modified():
+  """Test that the atomizer encodes atoms added to the vocabulary."""
+  c = atomizers.AsciiCharacterAtomizer({'a': 1, 'b': 2, 'c': 3})
+  assert list(c.AtomizeString('abc')) == [1, 2, 3]
+  c.vocab['d'] = 4
+  c._UpdateVocabulary()
+  assert list(c.AtomizeString('abcd')) == [1, 2, 3, 4]
+
+
 def test_AsciiCharacterAtomizer_DeatomizeIndices():
   c = atomizers.AsciiCharacterAtomizer({'a': 1, 'b': 2, 'c': 3})
   assert c.DeatomizeIndices([1, 2, 3, 1, 2, 3]) == 'abcabc'
@@ -169,6 +200,40 @@ __kernel void A(__global float* a, __global float* b, const int c) {
   assert c.vocab_size == len(tokens)
 
 
+def test_GreedyAtomizer_TokenizeString_longest_match():
+  """Test that the longest token is selected after a failed longer match."""
+  test_vocab = {'abcd': 0, 'ab': 1, 'a': 2, 'b': 3, 'c': 4, 'e': 5}
+  c = atomizers.GreedyAtomizer(test_vocab)
+  assert c.TokenizeString('abceabcd') == ['ab', 'c', 'e', 'abcd']
+
+
+def test_GreedyAtomizer_ToFile_FromFile_equivalency():
+  """Test that ToFile() and FromFile() produce the same atomizer."""
+  c1 = atomizers.GreedyAtomizer({'abc': 1, 'a': 2, 'b': 3, 'ab': 4, 'c': 5})
+  with tempfile.TemporaryDirectory() as d:
+    c1.ToFile(pathlib.Path(d) / 'atomizer')
+    c2 = atomizers.AtomizerBase.FromFile(pathlib.Path(d) / 'atomizer')
+  assert type(c2) == atomizers.GreedyAtomizer
+  assert c2.vocab == c1.vocab
+  assert c2.TokenizeString('abcab') == ['abc', 'ab']
+
+
+# Benchmarks.
+
+def test_benchmark_AsciiCharacterAtomizer_AtomizeString_tiny_corpus(
+    benchmark, tiny_corpus):
+  """Benchmark character-level encoding of an OpenCL corpus."""
+  c = atomizers.AsciiCharacterAtomizer.FromText(tiny_corpus)
+  benchmark(c.AtomizeString, tiny_corpus)
+
+
+def test_benchmark_GreedyAtomizer_AtomizeString_tiny_corpus(
+    benchmark, tiny_corpus):
+  """Benchmark greedy multi-character encoding of an OpenCL corpus."""
+  c = atomizers.GreedyAtomizer.FromText(tiny_corpus, OPENCL_ATOMS)
+  benchmark(c.AtomizeString, tiny_corpus)
+
+
 def main(argv):
   """Main entry point."""
   if len(argv) > 1:
@@ -121,6 +121,9 @@ class Corpus(object):
       raise errors.UserError(f"Content ID not found: '{self.content_id}'")
     self.preprocessed = preprocessed.PreprocessedContentFiles(
         preprocessed_db_path)
+    # The preprocessor cache is shared by all corpuses.
+    self.preprocessor_cache = preprocessed.PreprocessorCache(
+        cache.cachepath('corpus', 'preprocessor_cache.db'))
     # Create symlink to contentfiles.
     symlink = self.preprocessed.database_path.parent / 'contentfiles'
     if not symlink.is_symlink():
@@ -161,7 +164,7 @@ class Corpus(object):
     preprocessed_lock_path = self.preprocessed.database_path.parent / 'LOCK'
     with lockfile.LockFile(preprocessed_lock_path).acquire(
         replace_stale=True, block=True):
-      self.preprocessed.Create(self.config)
+      self.preprocessed.Create(self.config, self.preprocessor_cache)
     if not self.preprocessed.size:
       raise errors.EmptyCorpusException(
           "Pre-processed corpus contains no files: "
@@ -207,19 +210,34 @@ class Corpus(object):
   def GetTrainingData(self, shuffle: bool) -> np.ndarray:
     """Concatenate the entire encoded corpus into an array.
 
+    The encoded corpus is memory-mapped from the token store. Without shuffling,
+    the returned array is a read-only view of the token store. With shuffling,
+    the contentfiles are gathered into a single new array. Use
+    GetShuffledTrainingData() to avoid copying the shuffled corpus.
+
     Args:
-      shuffle: If true, randomize order of ebcided contentfiles.
+      shuffle: If true, randomize order of encoded contentfiles.
 
     Returns:
       The encoded corpus.
     """
-    # TODO: Can binary numpy strings be concatenated and decoded as one?
-    with self.encoded.Session() as session:
-      query = session.query(encoded.EncodedContentFile.data)
-      if shuffle:
-        query = query.order_by(func.random())
-      return np.concatenate(
-          [np.frombuffer(x[0], dtype=np.int32) for x in query])
+    if shuffle:
+      return self.GetShuffledTrainingData()[:]
+    tokens, _ = self.encoded.GetTokenStore()
+    return tokens
+
+  def GetShuffledTrainingData(self) -> encoded.ShuffledTokenStore:
+    """Return the encoded corpus with its contentfiles in a random order.
+
+    Only the table of contentfile offsets is permuted. Ranges of tokens are
+    sliced from the memory-mapped token store on demand.
+
+    Returns:
+      A ShuffledTokenStore.
+    """
+    tokens, offsets = self.encoded.GetTokenStore()
+    return encoded.ShuffledTokenStore(
+        tokens, offsets, np.random.permutation(len(offsets) - 1))
 
   def GetNumContentFiles(self) -> int:
     """Get the number of contentfiles which were pre-processed."""
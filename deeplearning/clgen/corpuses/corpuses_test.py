@@ -1,6 +1,7 @@
 """Unit tests for //deeplearning/clgen/corpus.py."""
 import os
 import pathlib
+import shutil
 import tempfile
 import sys
 
@@ -279,6 +280,37 @@ kernel void foo(global int* a) {
   assert c.GetNumPreprocessedFiles() == 1
 
 
+def test_Corpus_Create_preprocessor_cache(clgen_cache_dir, abc_corpus_config):
+  """Test that pre-processed files are shared between corpuses."""
+  del clgen_cache_dir
+  c1 = corpuses.Corpus(abc_corpus_config)
+  c1.Create()
+  with c1.preprocessor_cache.Session() as session:
+    assert session.query(preprocessed.PreprocessorCacheEntry).count() == 3
+  with tempfile.TemporaryDirectory() as d:
+    # Create a second corpus which contains the same files, plus a new one.
+    shutil.copytree(abc_corpus_config.local_directory, f'{d}/corpus')
+    with open(f'{d}/corpus/d', 'w') as f:
+      f.write('A new file.')
+    abc_corpus_config.local_directory = f'{d}/corpus'
+    c2 = corpuses.Corpus(abc_corpus_config)
+    assert c1.hash != c2.hash
+    c2.Create()
+    assert c2.GetNumContentFiles() == 4
+    assert 'A new file.' in c2.GetTextCorpus(shuffle=False)
+    with c2.preprocessor_cache.Session() as session:
+      assert session.query(preprocessed.PreprocessorCacheEntry).count() == 4
+    # Files imported from the cache took no wall time to pre-process.
+    with c2.preprocessed.Session() as session:
+      wall_times = {
+        pathlib.Path(relpath).name: wall_time_ms for relpath, wall_time_ms in
+        session.query(preprocessed.PreprocessedContentFile.input_relpath,
+                      preprocessed.PreprocessedContentFile.wall_time_ms)}
+    assert wall_times['a'] == 0
+    assert wall_times['b'] == 0
+    assert wall_times['c'] == 0
+
+
 def test_Corpus_GetTextCorpus_no_shuffle(clgen_cache_dir, abc_corpus_config):
   """Test the concatenation of the abc corpus."""
   del clgen_cache_dir
@@ -341,6 +373,38 @@ def test_Corpus_GetTrainingData_decode(clgen_cache_dir, abc_corpus):
              'The cat sat on the mat.\n!!\n') == len(decoded)
 
 
+def test_Corpus_GetTrainingData_shuffle(clgen_cache_dir, abc_corpus):
+  """Test that shuffling preserves the encoded contentfiles."""
+  del clgen_cache_dir
+  c = corpuses.Corpus(corpus_pb2.Corpus(local_directory=abc_corpus,
+                                        ascii_character_atomizer=True,
+                                        contentfile_separator='\n!!\n'))
+  c.Create()
+  ordered = c.GetTrainingData(shuffle=False)
+  shuffled = c.GetTrainingData(shuffle=True)
+  assert len(ordered) == len(shuffled)
+  assert sorted(ordered) == sorted(shuffled)
+  decoded = c.atomizer.DeatomizeIndices(shuffled)
+  assert '\nSuch corpus.\nVery wow.\n!!\n' in decoded
+  assert 'Hello, world!\n!!\n' in decoded
+  assert 'The cat sat on the mat.\n!!\n' in decoded
+
+
+def test_Corpus_GetShuffledTrainingData(clgen_cache_dir, abc_corpus):
+  """Test that the shuffled view contains the encoded contentfiles."""
+  del clgen_cache_dir
+  c = corpuses.Corpus(corpus_pb2.Corpus(local_directory=abc_corpus,
+                                        ascii_character_atomizer=True,
+                                        contentfile_separator='\n!!\n'))
+  c.Create()
+  shuffled = c.GetShuffledTrainingData()
+  assert len(shuffled) == c.size
+  decoded = c.atomizer.DeatomizeIndices(shuffled[:])
+  assert '\nSuch corpus.\nVery wow.\n!!\n' in decoded
+  assert 'Hello, world!\n!!\n' in decoded
+  assert 'The cat sat on the mat.\n!!\n' in decoded
+
+
 def test_Corpus_preprocessed_symlink(clgen_cache_dir, abc_corpus_config):
   """Test path of symlink to pre-preprocessed files."""
   del clgen_cache_dir
@@ -2,6 +2,7 @@
 import binascii
 import datetime
 import multiprocessing
+import os
 import pathlib
 import pickle
 import time
@@ -95,9 +96,86 @@ class EncodedContentFile(Base):
         date_added=datetime.datetime.utcnow())
 
 
+# The atomizer of an encoder pool worker, see EncoderWorkerInitializer().
+_worker_atomizer: typing.Optional[atomizers.AtomizerBase] = None
+
+
+class ShuffledTokenStore(object):
+  """A shuffled ordering of the contentfiles in a token store.
+
+  Only the table of contentfile offsets is permuted. Tokens are read from the
+  underlying (memory-mapped) token store when a range is sliced, so the
+  shuffled corpus is never materialized in full.
+  """
+
+  def __init__(self, tokens: np.ndarray, offsets: np.ndarray,
+               order: np.ndarray):
+    """Instantiate a shuffled token store.
+
+    Args:
+      tokens: The array of every token in the encoded corpus.
+      offsets: The num_files + 1 offsets of contentfiles into tokens.
+      order: A permutation of the contentfile indices.
+    """
+    self.tokens = tokens
+    self.starts = offsets[:-1][order]
+    self.lengths = (offsets[1:] - offsets[:-1])[order]
+    # The end position of each contentfile within the shuffled corpus.
+    self.ends = np.cumsum(self.lengths)
+
+  def __len__(self) -> int:
+    return int(self.ends[-1]) if len(self.ends) else 0
+
+  def __getitem__(self, index: slice) -> np.ndarray:
+    """Return a contiguous range of tokens from the shuffled corpus.
+
+    A range within a single contentfile is returned as a view of the token
+    store, otherwise the contentfiles it spans are copied into a new array.
+
+    Raises:
+      TypeError: If index is not a slice.
+      ValueError: If the slice has a step.
+    """
+    if not isinstance(index, slice):
+      raise TypeError('ShuffledTokenStore indices must be slices')
+    start, stop, step = index.indices(len(self))
+    if step != 1:
+      raise ValueError('ShuffledTokenStore does not support slice steps')
+    if start >= stop:
+      return self.tokens[:0]
+    first = np.searchsorted(self.ends, start, side='right')
+    last = np.searchsorted(self.ends, stop - 1, side='right')
+    pieces = []
+    for i in range(first, last + 1):
+      file_start = self.ends[i] - self.lengths[i]
+      begin = self.starts[i] + max(start, file_start) - file_start
+      end = self.starts[i] + min(stop, self.ends[i]) - file_start
+      pieces.append(self.tokens[begin:end])
+    if len(pieces) == 1:
+      return pieces[0]
+    return np.concatenate(pieces)
+
+
+def EncoderWorkerInitializer(pickled_atomizer: bytes) -> None:
+  """Initialize an encoder pool worker with the atomizer to encode using.
+
+  The atomizer is unpickled once per worker process, rather than once per job.
+  """
+  global _worker_atomizer
+  _worker_atomizer = pickle.loads(pickled_atomizer)
+
+
 def EncoderWorker(
     job: internal_pb2.EncoderWorker) -> typing.Optional[EncodedContentFile]:
-  """Encode a single content file."""
+  """Encode a single content file.
+
+  If the job does not contain a pickled atomizer, the atomizer set by
+  EncoderWorkerInitializer() is used.
+  """
+  if job.HasField('pickled_atomizer'):
+    atomizer = pickle.loads(job.pickled_atomizer)
+  else:
+    atomizer = _worker_atomizer
   # TODO(cec): There is a bug in the atomizer creation logic such that the
   # derived atomizer is not always capable of encoding the preprocessed files.
   # Once this has been fixed, there is no need to catch the VocabError here,
@@ -105,7 +183,7 @@ def EncoderWorker(
   try:
     return EncodedContentFile.FromPreprocessed(
         preprocessed.PreprocessedContentFile(id=job.id, text=job.text),
-        pickle.loads(job.pickled_atomizer), job.contentfile_separator)
+        atomizer, job.contentfile_separator)
   except errors.VocabError:
     return None
 
@@ -113,8 +191,19 @@ def EncoderWorker(
 class EncodedContentFiles(sqlutil.Database):
   """A database of encoded pre-processed contentfiles."""
 
+  # The number of preprocessed contentfiles to read from the database at a
+  # time, and the number of encoded contentfiles to commit at a time.
+  job_chunk_size = 10000
+  commit_batch_size = 1000
+
   def __init__(self, path: pathlib.Path):
     super(EncodedContentFiles, self).__init__(path, Base)
+    # The token store is a flat file of the int32 encoded data of every content
+    # file, ordered by id, with a separate index of the token offset at which
+    # each content file begins. It is memory-mapped for training, so that the
+    # encoded corpus need never be loaded from the database in its entirety.
+    self.token_store_path = self.database_path.parent / 'tokens.int32'
+    self.token_offsets_path = self.database_path.parent / 'token_offsets.npy'
 
   def Create(self, p: preprocessed.PreprocessedContentFiles,
              atomizer: atomizers.AtomizerBase,
@@ -138,6 +227,8 @@ class EncodedContentFiles(sqlutil.Database):
         self.Import(session, p, atomizer, contentfile_separator)
         self.SetDone(session)
         session.commit()
+      if not self.HasTokenStore():
+        self.ExportTokenStore(session)
 
       # Logging output.
       num_files = session.query(EncodedContentFile).count()
@@ -168,6 +259,62 @@ class EncodedContentFiles(sqlutil.Database):
     with self.Session() as session:
       return session.query(func.sum(EncodedContentFile.tokencount)).scalar()
 
+  def HasTokenStore(self) -> bool:
+    """Return whether the token store and offsets index have been written."""
+    return (self.token_store_path.is_file() and
+            self.token_offsets_path.is_file())
+
+  def ExportTokenStore(self, session: sqlutil.Database.session_t) -> None:
+    """Write the token store and offsets index from the encoded contentfiles.
+
+    The files are written to temporary paths and then moved into place, so that
+    an interrupted export never leaves a partial token store behind.
+
+    Args:
+      session: A database session.
+    """
+    start_time = time.time()
+    tokens_path = self.token_store_path.parent / (
+        self.token_store_path.name + '.tmp')
+    offsets_path = self.token_offsets_path.parent / (
+        self.token_offsets_path.name + '.tmp')
+    offsets = [0]
+    query = session.query(EncodedContentFile.data).order_by(
+        EncodedContentFile.id).yield_per(1000)
+    with open(tokens_path, 'wb') as f:
+      for data, in query:
+        f.write(data)
+        offsets.append(offsets[-1] + len(data) // 4)
+    with open(offsets_path, 'wb') as f:
+      np.save(f, np.array(offsets, dtype=np.int64))
+    # The token store is moved into place last, as its presence marks the
+    # export as complete.
+    os.rename(offsets_path, self.token_offsets_path)
+    os.rename(tokens_path, self.token_store_path)
+    logging.info('Wrote token store of %s tokens in %s ms.',
+                 humanize.intcomma(offsets[-1]),
+                 humanize.intcomma(int((time.time() - start_time) * 1000)))
+
+  def GetTokenStore(self) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """Return the memory-mapped token store and its offsets index.
+
+    If the token store has not been written (e.g. for a database encoded before
+    token stores were introduced), it is exported first.
+
+    Returns:
+      A tuple of a read-only array of every token in the encoded corpus, and an
+      array of num_files + 1 offsets into it, where the i-th content file is
+      tokens[offsets[i]:offsets[i + 1]].
+    """
+    if not self.HasTokenStore():
+      with self.Session() as session:
+        self.ExportTokenStore(session)
+    offsets = np.load(self.token_offsets_path)
+    if not offsets[-1]:
+      # np.memmap() cannot map an empty file.
+      return np.zeros(0, dtype=np.int32), offsets
+    return np.memmap(self.token_store_path, dtype=np.int32, mode='r'), offsets
+
   def IsDone(self, session: sqlutil.Database.session_t):
     if session.query(Meta).filter(Meta.key == 'done').first():
       return True
@@ -181,40 +328,104 @@ class EncodedContentFiles(sqlutil.Database):
              preprocessed_db: preprocessed.PreprocessedContentFiles,
              atomizer: atomizers.AtomizerBase,
              contentfile_separator: str) -> None:
+    """Encode the preprocessed contentfiles which have not been encoded.
+
+    Preprocessed contentfiles are read from the database and encoded in chunks,
+    and the results are committed in batches, so that memory usage does not
+    grow with the size of the corpus.
+
+    Args:
+      session: A database session.
+      preprocessed_db: The PreprocessedContentFiles database to encode.
+      atomizer: The atomizer to encode using.
+      contentfile_separator: The contentfile separator.
+
+    Raises:
+      EmptyCorpusException: If the PreprocessedContentFiles database has
+        no files.
+    """
     with preprocessed_db.Session() as p_session:
-      query = p_session.query(preprocessed.PreprocessedContentFile).filter(
-          preprocessed.PreprocessedContentFile.preprocessing_succeeded == True,
-          ~preprocessed.PreprocessedContentFile.id.in_(
-              session.query(EncodedContentFile.id).all()))
-      jobs = [
-        internal_pb2.EncoderWorker(
-            id=x.id, text=x.text, contentfile_separator=contentfile_separator,
-            pickled_atomizer=pickle.dumps(atomizer))
-        for x in query
-      ]
-      if not jobs:
+      num_preprocessed = p_session.query(
+          preprocessed.PreprocessedContentFile).filter(
+          preprocessed.PreprocessedContentFile.preprocessing_succeeded == True
+      ).count()
+      if not num_preprocessed:
         raise errors.EmptyCorpusException(
             "Pre-processed corpus contains no files: "
             f"'{preprocessed_db.database_path}'")
-
+      num_todo = num_preprocessed - session.query(EncodedContentFile).count()
       logging.info('Encoding %s of %s preprocessed files',
-                   humanize.intcomma(query.count()),
-                   humanize.intcomma(p_session.query(
-                       preprocessed.PreprocessedContentFile).filter(
-                       preprocessed.PreprocessedContentFile.preprocessing_succeeded == True).count()))
-      pool = multiprocessing.Pool()
-      bar = progressbar.ProgressBar(max_value=len(jobs))
+                   humanize.intcomma(num_todo),
+                   humanize.intcomma(num_preprocessed))
+
+      pool = multiprocessing.Pool(initializer=EncoderWorkerInitializer,
+                                  initargs=(pickle.dumps(atomizer),))
+      bar = progressbar.ProgressBar(max_value=num_todo)
+      batch = []
+      num_done = 0
       last_commit = time.time()
       wall_time_start = time.time()
-      for encoded_cf in bar(pool.imap_unordered(EncoderWorker, jobs)):
-        wall_time_end = time.time()
-        # TODO(cec): Remove the if check once EncoderWorker no longer returns
-        # None on atomizer encode error.
-        if encoded_cf:
-          encoded_cf.wall_time_ms = int(
-              (wall_time_end - wall_time_start) * 1000)
-          session.add(encoded_cf)
-        wall_time_start = wall_time_end
-        if wall_time_end - last_commit > 10:
-          session.commit()
-          last_commit = wall_time_end
+      for jobs in self.GetEncoderJobChunks(session, p_session,
+                                           contentfile_separator):
+        for encoded_cf in pool.imap_unordered(EncoderWorker, jobs):
+          wall_time_end = time.time()
+          # TODO(cec): Remove the if check once EncoderWorker no longer returns
+          # None on atomizer encode error.
+          if encoded_cf:
+            encoded_cf.wall_time_ms = int(
+                (wall_time_end - wall_time_start) * 1000)
+            batch.append(encoded_cf)
+          wall_time_start = wall_time_end
+          num_done += 1
+          bar.update(min(num_done, num_todo))
+          if (len(batch) >= self.commit_batch_size or
+              wall_time_end - last_commit > 10):
+            session.bulk_save_objects(batch)
+            session.commit()
+            batch = []
+            last_commit = wall_time_end
+      session.bulk_save_objects(batch)
+      session.commit()
+      pool.close()
+      bar.finish()
+
+  def GetEncoderJobChunks(
+      self, session: sqlutil.Database.session_t,
+      p_session: sqlutil.Database.session_t, contentfile_separator: str
+  ) -> typing.Iterator[typing.List[internal_pb2.EncoderWorker]]:
+    """Read the preprocessed contentfiles to encode, in chunks.
+
+    Contentfiles are read in order of id. Those which have already been encoded
+    are skipped, so that an interrupted import can be resumed.
+
+    Args:
+      session: A session for this database.
+      p_session: A session for the preprocessed contentfiles database.
+      contentfile_separator: The contentfile separator.
+
+    Returns:
+      An iterator over lists of at most job_chunk_size encoder jobs.
+    """
+    last_id = None
+    while True:
+      query = p_session.query(
+          preprocessed.PreprocessedContentFile.id,
+          preprocessed.PreprocessedContentFile.text).filter(
+          preprocessed.PreprocessedContentFile.preprocessing_succeeded == True)
+      if last_id is not None:
+        query = query.filter(preprocessed.PreprocessedContentFile.id > last_id)
+      rows = query.order_by(preprocessed.PreprocessedContentFile.id).limit(
+          self.job_chunk_size).all()
+      if not rows:
+        return
+      done = {x[0] for x in session.query(EncodedContentFile.id).filter(
+          EncodedContentFile.id >= rows[0][0],
+          EncodedContentFile.id <= rows[-1][0])}
+      jobs = [
+        internal_pb2.EncoderWorker(
+            id=id_, text=text, contentfile_separator=contentfile_separator)
+        for id_, text in rows if id_ not in done
+      ]
+      if jobs:
+        yield jobs
+      last_id = rows[-1][0]
@@ -1,5 +1,7 @@
 """Unit tests for ///cxx_test."""
+import datetime
 import pathlib
+import pickle
 import sys
 import tempfile
 
@@ -12,6 +14,7 @@ from deeplearning.clgen import errors
 from deeplearning.clgen.corpuses import atomizers
 from deeplearning.clgen.corpuses import encoded
 from deeplearning.clgen.corpuses import preprocessed
+from deeplearning.clgen.proto import internal_pb2
 
 
 FLAGS = flags.FLAGS
@@ -81,6 +84,34 @@ def test_EncodedContentFile_FromPreprocessed_date_added(
   assert enc.date_added
 
 
+# EncoderWorker() tests.
+
+def test_EncoderWorker_pickled_atomizer(abc_atomizer):
+  """Test encoding with an atomizer pickled in the job."""
+  enc = encoded.EncoderWorker(internal_pb2.EncoderWorker(
+      id=5, text='abc', contentfile_separator='a',
+      pickled_atomizer=pickle.dumps(abc_atomizer)))
+  assert enc.id == 5
+  np.testing.assert_array_equal(
+      np.array([0, 1, 2, 0], dtype=np.int32), enc.indices_array)
+
+
+def test_EncoderWorker_worker_atomizer(abc_atomizer):
+  """Test encoding with the atomizer set by the worker initializer."""
+  encoded.EncoderWorkerInitializer(pickle.dumps(abc_atomizer))
+  enc = encoded.EncoderWorker(internal_pb2.EncoderWorker(
+      id=5, text='abc', contentfile_separator='a'))
+  np.testing.assert_array_equal(
+      np.array([0, 1, 2, 0], dtype=np.int32), enc.indices_array)
+
+
+def test_EncoderWorker_vocab_error(abc_atomizer):
+  """Test that None is returned if the text cannot be encoded."""
+  encoded.EncoderWorkerInitializer(pickle.dumps(abc_atomizer))
+  assert encoded.EncoderWorker(internal_pb2.EncoderWorker(
+      id=5, text='xyz', contentfile_separator='a')) is None
+
+
 # EncodedContentFiles tests.
 
 def test_EncodedContentFiles_indices_array_equivalence(
@@ -122,6 +153,95 @@ def test_EncodedContentFiles_token_count(
   assert 20 == temp_db.token_count
 
 
+def test_EncodedContentFiles_GetTokenStore(
+    temp_db: encoded.EncodedContentFiles,
+    abc_preprocessed: preprocessed.PreprocessedContentFile,
+    abc_atomizer: atomizers.AsciiCharacterAtomizer):
+  """Test that the token store concatenates encoded files in id order."""
+  enc1 = encoded.EncodedContentFile.FromPreprocessed(
+      abc_preprocessed, abc_atomizer, 'a')
+  abc_preprocessed.id += 1
+  abc_preprocessed.text = 'edcba'
+  enc2 = encoded.EncodedContentFile.FromPreprocessed(
+      abc_preprocessed, abc_atomizer, 'a')
+  with temp_db.Session(commit=True) as session:
+    session.add(enc2)
+    session.add(enc1)
+  assert not temp_db.HasTokenStore()
+  tokens, offsets = temp_db.GetTokenStore()
+  assert temp_db.HasTokenStore()
+  np.testing.assert_array_equal(np.array([0, 11, 17], dtype=np.int64), offsets)
+  np.testing.assert_array_equal(
+      np.array([0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 0, 4, 3, 2, 1, 0, 0],
+               dtype=np.int32), tokens)
+
+
+def test_EncodedContentFiles_GetTokenStore_empty(
+    temp_db: encoded.EncodedContentFiles):
+  """Test that an empty database produces an empty token store."""
+  tokens, offsets = temp_db.GetTokenStore()
+  assert not len(tokens)
+  np.testing.assert_array_equal(np.array([0], dtype=np.int64), offsets)
+
+
+# ShuffledTokenStore tests.
+
+def test_ShuffledTokenStore_slices():
+  """Test that slices of a shuffled token store span contentfiles."""
+  tokens = np.array([0, 1, 2, 3, 4, 5], dtype=np.int32)
+  offsets = np.array([0, 2, 2, 5, 6], dtype=np.int64)
+  store = encoded.ShuffledTokenStore(tokens, offsets, np.array([3, 1, 2, 0]))
+  expected = np.array([5, 2, 3, 4, 0, 1], dtype=np.int32)
+  assert len(store) == 6
+  np.testing.assert_array_equal(expected, store[:])
+  for start in range(7):
+    for stop in range(start, 7):
+      np.testing.assert_array_equal(expected[start:stop], store[start:stop])
+
+
+def test_ShuffledTokenStore_view():
+  """Test that a slice within a contentfile is not copied."""
+  tokens = np.array([0, 1, 2, 3, 4, 5], dtype=np.int32)
+  offsets = np.array([0, 2, 6], dtype=np.int64)
+  store = encoded.ShuffledTokenStore(tokens, offsets, np.array([1, 0]))
+  assert np.shares_memory(store[1:3], tokens)
+
+
+def test_ShuffledTokenStore_empty():
+  """Test that an empty token store has no tokens."""
+  store = encoded.ShuffledTokenStore(
+      np.zeros(0, dtype=np.int32), np.array([0], dtype=np.int64),
+      np.array([], dtype=np.int64))
+  assert not len(store)
+  assert not len(store[:])
+
+
+def test_EncodedContentFiles_Create_chunked(
+    temp_db: encoded.EncodedContentFiles,
+    abc_atomizer: atomizers.AsciiCharacterAtomizer):
+  """Test that contentfiles are encoded across multiple job chunks."""
+  temp_db.job_chunk_size = 2
+  temp_db.commit_batch_size = 2
+  with tempfile.TemporaryDirectory() as d:
+    p = preprocessed.PreprocessedContentFiles(
+        pathlib.Path(d) / 'preprocessed.db')
+    with p.Session(commit=True) as session:
+      for i, text in enumerate(['a', 'bb', 'ccc', 'dddd', 'eeeee', 'x']):
+        session.add(preprocessed.PreprocessedContentFile(
+            id=i + 1, input_relpath=str(i), input_sha256=b'0',
+            input_charcount=0, input_linecount=0, sha256=b'0',
+            charcount=len(text), linecount=1, text=text,
+            # The last file did not pre-process.
+            preprocessing_succeeded=text != 'x', preprocess_time_ms=0,
+            wall_time_ms=0, date_added=datetime.datetime.utcnow()))
+    temp_db.Create(p, abc_atomizer, 'a')
+  assert temp_db.size == 5
+  assert temp_db.token_count == 15
+  tokens, offsets = temp_db.GetTokenStore()
+  np.testing.assert_array_equal(
+      np.array([0, 2, 5, 9, 14, 20], dtype=np.int64), offsets)
+
+
 def test_EncodedContentFiles_empty_preprocessed_db(
     temp_db: encoded.EncodedContentFiles,
     abc_atomizer: atomizers.AsciiCharacterAtomizer):
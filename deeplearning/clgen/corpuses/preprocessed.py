@@ -15,7 +15,7 @@ import time
 import typing
 from absl import flags
 from absl import logging
-from phd.lib.labm8 import fs
+from phd.lib.labm8 import crypto
 from phd.lib.labm8 import sqlutil
 from sqlalchemy.ext import declarative
 from sqlalchemy.sql import func
@@ -77,6 +77,13 @@ class PreprocessedContentFile(Base):
     """Return the 64 character hexadecimal representation of sha256."""
     return binascii.hexlify(self.sha256).decode('utf-8')
 
+  def ToRow(self) -> typing.Dict[str, typing.Any]:
+    """Return the table row of the content file, for bulk inserts."""
+    return {
+      column.name: getattr(self, column.name)
+      for column in self.__table__.columns if column.name != 'id'
+    }
+
   @classmethod
   def FromContentFile(
       cls, contentfile_root: pathlib.Path, relpath: pathlib.Path,
@@ -112,6 +119,127 @@ class PreprocessedContentFile(Base):
     )
 
 
+CacheBase = declarative.declarative_base()
+
+
+class PreprocessorCacheEntry(CacheBase):
+  """The outcome of pre-processing an input with a preprocessor pipeline.
+
+  Entries are keyed by the checksum of the input file and the ID of the
+  preprocessor pipeline, so that they can be shared by every corpus which
+  contains the same file.
+  """
+  __tablename__ = 'preprocessor_cache'
+
+  # Checksum of the input file.
+  input_sha256: str = sql.Column(sql.Binary(32), primary_key=True)
+  # The ID of the preprocessor pipeline, see GetPreprocessorPipelineId().
+  pipeline_id: str = sql.Column(sql.String(40), primary_key=True)
+  input_charcount = sql.Column(sql.Integer, nullable=False)
+  input_linecount = sql.Column(sql.Integer, nullable=False)
+  sha256: str = sql.Column(sql.Binary(32), nullable=False)
+  charcount = sql.Column(sql.Integer, nullable=False)
+  linecount = sql.Column(sql.Integer, nullable=False)
+  text: str = sql.Column(sql.UnicodeText(), nullable=False)
+  preprocessing_succeeded: bool = sql.Column(sql.Boolean, nullable=False)
+  preprocess_time_ms: int = sql.Column(sql.Integer, nullable=False)
+  date_added: datetime.datetime = sql.Column(sql.DateTime, nullable=False,
+                                             default=datetime.datetime.utcnow)
+
+  @staticmethod
+  def ToRow(preprocessed_cf: PreprocessedContentFile,
+            pipeline_id: str) -> typing.Dict[str, typing.Any]:
+    """Return the cache table row for a pre-processed content file."""
+    return {
+      'input_sha256': preprocessed_cf.input_sha256,
+      'pipeline_id': pipeline_id,
+      'input_charcount': preprocessed_cf.input_charcount,
+      'input_linecount': preprocessed_cf.input_linecount,
+      'sha256': preprocessed_cf.sha256,
+      'charcount': preprocessed_cf.charcount,
+      'linecount': preprocessed_cf.linecount,
+      'text': preprocessed_cf.text,
+      'preprocessing_succeeded': preprocessed_cf.preprocessing_succeeded,
+      'preprocess_time_ms': preprocessed_cf.preprocess_time_ms,
+      'date_added': preprocessed_cf.date_added,
+    }
+
+  def ToPreprocessedContentFile(
+      self, relpath: str) -> PreprocessedContentFile:
+    """Instantiate a PreprocessedContentFile from the cached outcome."""
+    return PreprocessedContentFile(
+        input_relpath=relpath,
+        input_sha256=self.input_sha256,
+        input_charcount=self.input_charcount,
+        input_linecount=self.input_linecount,
+        sha256=self.sha256,
+        charcount=self.charcount,
+        linecount=self.linecount,
+        text=self.text,
+        preprocessing_succeeded=self.preprocessing_succeeded,
+        preprocess_time_ms=self.preprocess_time_ms,
+        # No pre-processing was done, so no wall time elapsed.
+        wall_time_ms=0,
+        date_added=datetime.datetime.utcnow(),
+    )
+
+
+class PreprocessorCache(sqlutil.Database):
+  """A content-addressed cache of pre-processed files, shared by corpuses."""
+
+  # The maximum number of checksums to look up in a single query. SQLite
+  # limits the number of host parameters in a statement to 999.
+  lookup_chunk_size = 500
+
+  def __init__(self, path: pathlib.Path):
+    super(PreprocessorCache, self).__init__(path, CacheBase)
+
+  def Lookup(self, pipeline_id: str, input_sha256s: typing.List[bytes]
+             ) -> typing.Dict[bytes, PreprocessorCacheEntry]:
+    """Look up the cached outcomes for a list of input checksums.
+
+    Args:
+      pipeline_id: The ID of the preprocessor pipeline.
+      input_sha256s: A list of input file checksums.
+
+    Returns:
+      A map from input checksum to cache entry, for every checksum which is in
+      the cache.
+    """
+    entries = {}
+    with self.Session() as session:
+      for i in range(0, len(input_sha256s), self.lookup_chunk_size):
+        chunk = input_sha256s[i:i + self.lookup_chunk_size]
+        query = session.query(PreprocessorCacheEntry).filter(
+            PreprocessorCacheEntry.pipeline_id == pipeline_id,
+            PreprocessorCacheEntry.input_sha256.in_(chunk))
+        for entry in query:
+          session.expunge(entry)
+          entries[entry.input_sha256] = entry
+    return entries
+
+  def Insert(self, rows: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Add rows to the cache, ignoring any which are already present.
+
+    Multiple corpuses may be populating the cache at the same time, so rows
+    which have been added by another writer are silently skipped.
+
+    Args:
+      rows: A list of rows, as returned by PreprocessorCacheEntry.ToRow().
+    """
+    if not rows:
+      return
+    with self.Session(commit=True) as session:
+      session.execute(
+          PreprocessorCacheEntry.__table__.insert().prefix_with('OR IGNORE'),
+          rows)
+
+
+def GetPreprocessorPipelineId(preprocessors_: typing.List[str]) -> str:
+  """Return the ID of an ordered list of preprocessors."""
+  return crypto.sha1_list(*preprocessors_)
+
+
 def PreprocessorWorker(
     job: internal_pb2.PreprocessorWorker) -> PreprocessedContentFile:
   """The inner loop of a parallelizable pre-processing job."""
@@ -122,13 +250,27 @@ def PreprocessorWorker(
 class PreprocessedContentFiles(sqlutil.Database):
   """A database of pre-processed contentfiles."""
 
+  # The number of content files to pre-process in each chunk, and the number
+  # of pre-processed files to insert at a time.
+  import_chunk_size = 10000
+  commit_batch_size = 1000
+
   def __init__(self, path: pathlib.Path):
     super(PreprocessedContentFiles, self).__init__(path, Base)
 
-  def Create(self, config: corpus_pb2.Corpus):
+  def Create(self, config: corpus_pb2.Corpus,
+             preprocessor_cache: typing.Optional[PreprocessorCache] = None):
+    """Populate the pre-processed contentfiles database.
+
+    Args:
+      config: The corpus config proto.
+      preprocessor_cache: An optional cache of pre-processed files. If
+        provided, files which are in the cache are not pre-processed again,
+        and newly pre-processed files are added to the cache.
+    """
     with self.Session() as session:
       if not self.IsDone(session):
-        self.Import(session, config)
+        self.Import(session, config, preprocessor_cache)
         self.SetDone(session)
         session.commit()
 
@@ -169,34 +311,147 @@ class PreprocessedContentFiles(sqlutil.Database):
   def SetDone(self, session: sqlutil.Database.session_t):
     session.add(Meta(key='done', value='yes'))
 
+  def GetImportCheckpoint(
+      self, session: sqlutil.Database.session_t) -> typing.Optional[str]:
+    """Return the relpath of the last file of the last imported chunk."""
+    checkpoint = session.query(Meta).filter(
+        Meta.key == 'import_checkpoint').first()
+    return checkpoint.value if checkpoint else None
+
+  def SetImportCheckpoint(self, session: sqlutil.Database.session_t,
+                          relpath: str) -> None:
+    session.merge(Meta(key='import_checkpoint', value=relpath))
+
   def Import(self, session: sqlutil.Database.session_t,
-             config: corpus_pb2.Corpus) -> None:
+             config: corpus_pb2.Corpus,
+             preprocessor_cache: typing.Optional[PreprocessorCache] = None
+            ) -> None:
+    """Pre-process and import the content files.
+
+    The content files directory is walked lazily, and files are pre-processed
+    in chunks of import_chunk_size, so that the number of files in flight is
+    bounded. Results are written using bulk inserts. Once every file in a chunk
+    has been committed, the relpath of the last file in the chunk is recorded
+    as a checkpoint. An interrupted import resumes from the checkpoint, without
+    walking the directories which precede it.
+
+    Args:
+      session: A database session.
+      config: The corpus config proto.
+      preprocessor_cache: An optional cache of pre-processed files.
+
+    Raises:
+      EmptyCorpusException: If the content files directory is empty.
+    """
     with self.GetContentFileRoot(config) as contentfile_root:
-      relpaths = set(self.GetImportRelpaths(contentfile_root))
-      done = set(
-          [x[0] for x in session.query(PreprocessedContentFile.input_relpath)])
-      todo = relpaths - done
-      logging.info('Preprocessing %s of %s content files',
-                   humanize.intcomma(len(todo)),
-                   humanize.intcomma(len(relpaths)))
-      jobs = [
-        internal_pb2.PreprocessorWorker(
-            contentfile_root=str(contentfile_root),
-            relpath=t, preprocessors=config.preprocessor)
-        for t in todo]
+      checkpoint = self.GetImportCheckpoint(session)
+      if checkpoint:
+        logging.info("Resuming pre-processing after '%s'", checkpoint)
+      pipeline_id = GetPreprocessorPipelineId(config.preprocessor)
       pool = multiprocessing.Pool()
-      bar = progressbar.ProgressBar(max_value=len(jobs))
-      last_commit = time.time()
+      bar = progressbar.ProgressBar(max_value=progressbar.UnknownLength)
+      num_files = 0
       wall_time_start = time.time()
-      for preprocessed_cf in bar(pool.imap_unordered(PreprocessorWorker, jobs)):
-        wall_time_end = time.time()
-        preprocessed_cf.wall_time_ms = (
-          int((wall_time_end - wall_time_start) * 1000))
-        wall_time_start = wall_time_end
-        session.add(preprocessed_cf)
-        if wall_time_end - last_commit > 10:
-          session.commit()
-          last_commit = wall_time_end
+      for chunk in Chunkify(WalkContentFiles(contentfile_root, checkpoint),
+                            self.import_chunk_size):
+        num_files += len(chunk)
+        # Files may have been imported before an interrupted import reached
+        # the end of the chunk.
+        done = self.GetImportedRelpaths(session, chunk)
+        todo = [relpath for relpath in chunk if relpath not in done]
+        rows = []
+        cache_rows = []
+        if preprocessor_cache and todo:
+          hits, todo = self.LookupPreprocessorCache(
+              pool, contentfile_root, todo, pipeline_id, preprocessor_cache)
+          rows += [cf.ToRow() for cf in hits]
+        jobs = [
+          internal_pb2.PreprocessorWorker(
+              contentfile_root=str(contentfile_root),
+              relpath=t, preprocessors=config.preprocessor)
+          for t in todo]
+        for preprocessed_cf in pool.imap_unordered(PreprocessorWorker, jobs):
+          wall_time_end = time.time()
+          preprocessed_cf.wall_time_ms = (
+            int((wall_time_end - wall_time_start) * 1000))
+          wall_time_start = wall_time_end
+          rows.append(preprocessed_cf.ToRow())
+          if preprocessor_cache:
+            cache_rows.append(
+                PreprocessorCacheEntry.ToRow(preprocessed_cf, pipeline_id))
+          bar.update(num_files - len(chunk) + len(rows))
+          if len(rows) >= self.commit_batch_size:
+            self.InsertRows(session, rows, preprocessor_cache, cache_rows)
+            rows, cache_rows = [], []
+        self.InsertRows(session, rows, preprocessor_cache, cache_rows)
+        self.SetImportCheckpoint(session, chunk[-1])
+        session.commit()
+        bar.update(num_files)
+      pool.close()
+      bar.finish()
+      if not num_files and not checkpoint:
+        raise errors.EmptyCorpusException(
+            f"Empty content files directory: '{contentfile_root}'")
+      logging.info('Pre-processed %s content files',
+                   humanize.intcomma(num_files))
+
+  def GetImportedRelpaths(self, session: sqlutil.Database.session_t,
+                          relpaths: typing.List[str]) -> typing.Set[str]:
+    """Return the subset of relpaths which have already been imported."""
+    done = set()
+    # SQLite limits the number of host parameters in a statement to 999.
+    for i in range(0, len(relpaths), 500):
+      done.update(x[0] for x in session.query(
+          PreprocessedContentFile.input_relpath).filter(
+          PreprocessedContentFile.input_relpath.in_(relpaths[i:i + 500])))
+    return done
+
+  @staticmethod
+  def InsertRows(session: sqlutil.Database.session_t,
+                 rows: typing.List[typing.Dict[str, typing.Any]],
+                 preprocessor_cache: typing.Optional[PreprocessorCache],
+                 cache_rows: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Bulk insert and commit pre-processed rows, and add them to the cache."""
+    session.bulk_insert_mappings(PreprocessedContentFile, rows)
+    session.commit()
+    if preprocessor_cache:
+      preprocessor_cache.Insert(cache_rows)
+
+  def LookupPreprocessorCache(
+      self, pool: multiprocessing.Pool, contentfile_root: pathlib.Path,
+      relpaths: typing.List[str], pipeline_id: str,
+      preprocessor_cache: PreprocessorCache
+  ) -> typing.Tuple[typing.List[PreprocessedContentFile], typing.List[str]]:
+    """Look up content files in the preprocessor cache.
+
+    Args:
+      pool: A multiprocessing pool, used to checksum the content files.
+      contentfile_root: The root of the content files directory.
+      relpaths: The relative paths of the content files to look up.
+      pipeline_id: The ID of the preprocessor pipeline.
+      preprocessor_cache: The preprocessor cache.
+
+    Returns:
+      A list of pre-processed content files which were found in the cache, and
+      the list of relpaths which were not found in the cache, and must be
+      pre-processed.
+    """
+    start_time = time.time()
+    input_sha256s = pool.map(
+        GetFileSha256, [contentfile_root / r for r in relpaths])
+    entries = preprocessor_cache.Lookup(pipeline_id, list(set(input_sha256s)))
+    hits = []
+    todo = []
+    for relpath, input_sha256 in zip(relpaths, input_sha256s):
+      entry = entries.get(input_sha256)
+      if entry:
+        hits.append(entry.ToPreprocessedContentFile(relpath))
+      else:
+        todo.append(relpath)
+    logging.info('Found %s of %s content files in preprocessor cache in %s ms',
+                 humanize.intcomma(len(hits)), humanize.intcomma(len(relpaths)),
+                 humanize.intcomma(int((time.time() - start_time) * 1000)))
+    return hits, todo
 
   @contextlib.contextmanager
   def GetContentFileRoot(self, config: corpus_pb2.Corpus) -> pathlib.Path:
@@ -283,26 +538,54 @@ class PreprocessedContentFiles(sqlutil.Database):
       return session.query(
           func.sum(PreprocessedContentFile.input_linecount)).scalar()
 
-  def GetImportRelpaths(
-      self, contentfile_root: pathlib.Path) -> typing.List[str]:
-    """Get relative paths to all files in the content files directory.
-
-    Args:
-      contentfile_root: The root of the content files directory.
 
-    Returns:
-      A list of paths relative to the content files root.
-
-    Raises:
-      EmptyCorpusException: If the content files directory is empty.
-    """
-    with fs.chdir(contentfile_root):
-      find_output = subprocess.check_output(['find', '.', '-type', 'f']).decode(
-          'utf-8').strip()
-      if not find_output:
-        raise errors.EmptyCorpusException(
-            f"Empty content files directory: '{contentfile_root}'")
-      return find_output.split('\n')
+def WalkContentFiles(contentfile_root: pathlib.Path,
+                     after: typing.Optional[str] = None
+                    ) -> typing.Iterator[str]:
+  """Walk the files in a content files directory, in a deterministic order.
+
+  Directory entries are visited in order of name, and directories are walked
+  as they are visited. Symbolic links are not followed.
+
+  Args:
+    contentfile_root: The root of the content files directory.
+    after: If set, only files which follow this relpath in the walk order are
+      returned, and directories which entirely precede it are not walked.
+
+  Returns:
+    An iterator over file paths relative to the content files root, in the
+    form './path/to/file'.
+  """
+  after_parts = pathlib.PurePosixPath(after).parts if after else ()
+
+  def _Walk(directory: str, parts: typing.Tuple[str, ...]):
+    with os.scandir(directory) as it:
+      entries = sorted(it, key=lambda x: x.name)
+    for entry in entries:
+      entry_parts = parts + (entry.name,)
+      if entry.is_dir(follow_symlinks=False):
+        if entry_parts < after_parts[:len(entry_parts)]:
+          continue
+        yield from _Walk(entry.path, entry_parts)
+      elif entry.is_file(follow_symlinks=False):
+        if entry_parts <= after_parts:
+          continue
+        yield './' + '/'.join(entry_parts)
+
+  return _Walk(str(contentfile_root), ())
+
+
+def Chunkify(iterable: typing.Iterable[typing.Any],
+             chunk_size: int) -> typing.Iterator[typing.List[typing.Any]]:
+  """Split an iterable into lists of at most chunk_size elements."""
+  chunk = []
+  for element in iterable:
+    chunk.append(element)
+    if len(chunk) >= chunk_size:
+      yield chunk
+      chunk = []
+  if chunk:
+    yield chunk
 
 
 def ExpandConfigPath(path: str) -> pathlib.Path:
@@ -0,0 +1,82 @@
+"""Unit tests for //deeplearning/clgen/corpuses/preprocessed.py."""
+import pathlib
+import sys
+import tempfile
+
+import pytest
+from absl import app
+from absl import flags
+
+from deeplearning.clgen.corpuses import preprocessed
+from deeplearning.clgen.proto import corpus_pb2
+
+
+FLAGS = flags.FLAGS
+
+
+@pytest.fixture(scope='function')
+def contentfiles() -> pathlib.Path:
+  """A test fixture which returns a directory of empty content files."""
+  with tempfile.TemporaryDirectory() as d:
+    d = pathlib.Path(d)
+    for relpath in ['b/a', 'b/c/a', 'b/c/b', 'a', 'c', 'd/a']:
+      (d / relpath).parent.mkdir(parents=True, exist_ok=True)
+      (d / relpath).touch()
+    (d / 'e').mkdir()
+    yield d
+
+
+def test_WalkContentFiles_order(contentfiles: pathlib.Path):
+  """Test that files are returned in walk order."""
+  assert list(preprocessed.WalkContentFiles(contentfiles)) == [
+    './a', './b/a', './b/c/a', './b/c/b', './c', './d/a']
+
+
+def test_WalkContentFiles_empty_directory():
+  """Test that an empty directory yields no files."""
+  with tempfile.TemporaryDirectory() as d:
+    assert not list(preprocessed.WalkContentFiles(pathlib.Path(d)))
+
+
+@pytest.mark.parametrize('after', [
+  './a', './b/a', './b/c/a', './b/c/b', './c', './d/a'])
+def test_WalkContentFiles_after(contentfiles: pathlib.Path, after: str):
+  """Test that resuming a walk returns the remaining files."""
+  relpaths = list(preprocessed.WalkContentFiles(contentfiles))
+  assert list(preprocessed.WalkContentFiles(contentfiles, after)) == (
+    relpaths[relpaths.index(after) + 1:])
+
+
+def test_Chunkify():
+  """Test chunking an iterable."""
+  assert list(preprocessed.Chunkify(range(5), 2)) == [[0, 1], [2, 3], [4]]
+  assert not list(preprocessed.Chunkify([], 2))
+
+
+def test_PreprocessedContentFiles_Import_resume(contentfiles: pathlib.Path):
+  """Test that an import resumes after the checkpoint."""
+  config = corpus_pb2.Corpus(
+      local_directory=str(contentfiles),
+      preprocessor=['deeplearning.clgen.preprocessors.common'
+                    ':StripDuplicateEmptyLines'])
+  with tempfile.TemporaryDirectory() as d:
+    db = preprocessed.PreprocessedContentFiles(pathlib.Path(d) / 'test.db')
+    db.import_chunk_size = 2
+    with db.Session(commit=True) as session:
+      db.SetImportCheckpoint(session, './b/c/a')
+    with db.Session(commit=True) as session:
+      db.Import(session, config)
+      assert db.GetImportCheckpoint(session) == './d/a'
+      assert sorted(x[0] for x in session.query(
+          preprocessed.PreprocessedContentFile.input_relpath)) == [
+        './b/c/b', './c', './d/a']
+
+
+def main(argv):
+  """Main entry point."""
+  del argv
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -1,8 +1,12 @@
 """Neural network backends for CLgen models."""
 import numpy as np
+import os
+import pathlib
 import typing
 from absl import flags
+from absl import logging
 from phd.lib.labm8 import cache
+from phd.lib.labm8 import labdate
 
 from deeplearning.clgen import samplers
 from deeplearning.clgen.corpuses import atomizers
@@ -11,6 +15,13 @@ from deeplearning.clgen.proto import model_pb2
 
 FLAGS = flags.FLAGS
 
+flags.DEFINE_bool(
+    'clgen_continuous_batching', False,
+    'If set, a row of a sampling batch which completes a sample immediately '
+    'begins a new sample, rather than idling until every sample in the batch '
+    'is complete. Sampling stops as soon as the requested number of samples '
+    'have been produced, rather than at the end of a batch.')
+
 
 class BackendBase(object):
   """The base class for a language model backend.
@@ -23,6 +34,8 @@ class BackendBase(object):
     self.config = config
     self.cache = fs_cache
     self.atomizer = atomizer
+    # A mapping from <sampler hash, checkpoint> to start states.
+    self.start_states = {}
 
   def Train(self, corpus: 'Corpus') -> None:
     """Train the backend."""
@@ -45,3 +58,145 @@ class BackendBase(object):
       A numpy array of int32 values with shape (batch_size,).
     """
     raise NotImplementedError
+
+  def GetStartStatePath(self, sampler: samplers.Sampler,
+                        checkpoint: str) -> pathlib.Path:
+    """Return the path of a cached start state.
+
+    Start states are cached alongside the sampler cache directory.
+    """
+    return (self.cache.path / 'samples' /
+            f'{sampler.hash}.{checkpoint}.start_state.npz')
+
+  def LoadStartState(self, sampler: samplers.Sampler, checkpoint: str
+                    ) -> typing.Optional[typing.List[np.ndarray]]:
+    """Load the cached model state after seeding with a sampler's start text.
+
+    Args:
+      sampler: The sampler.
+      checkpoint: The name of the checkpoint that the model weights were
+        restored from.
+
+    Returns:
+      A list of state arrays for a single row of a batch, in the order that they
+      were saved by SaveStartState(), or None if the state is not cached.
+    """
+    key = (sampler.hash, checkpoint)
+    if key not in self.start_states:
+      path = self.GetStartStatePath(sampler, checkpoint)
+      if not path.is_file():
+        return None
+      with np.load(path) as data:
+        self.start_states[key] = [
+          data[f'arr_{i}'] for i in range(len(data.files))]
+    return self.start_states[key]
+
+  def SaveStartState(self, sampler: samplers.Sampler, checkpoint: str,
+                     start_state: typing.List[np.ndarray]) -> None:
+    """Cache the model state after seeding with a sampler's start text.
+
+    The state is always cached in memory. Saving it to disk is best-effort,
+    since the cache of a pre-trained model may be read-only.
+
+    Args:
+      sampler: The sampler.
+      checkpoint: The name of the checkpoint that the model weights were
+        restored from.
+      start_state: A list of state arrays for a single row of a batch.
+    """
+    self.start_states[(sampler.hash, checkpoint)] = start_state
+    path = self.GetStartStatePath(sampler, checkpoint)
+    # Write to a temporary file and rename so that concurrent samplers never
+    # read a partially written state.
+    temp_path = path.parent / f'{path.name}.{os.getpid()}.tmp'
+    try:
+      path.parent.mkdir(parents=True, exist_ok=True)
+      with open(temp_path, 'wb') as f:
+        np.savez(f, *start_state)
+      os.replace(temp_path, path)
+    except OSError as e:
+      logging.warning('Failed to save start state %s: %s', path, e)
+      if temp_path.is_file():
+        temp_path.unlink()
+
+  def ResetSampleBatchRows(self, sampler: samplers.Sampler,
+                           rows: np.ndarray) -> None:
+    """Reset rows of the current sample batch to the start text state.
+
+    Subsequent calls to SampleNextIndices() begin new samples in these rows,
+    without affecting the other rows of the batch. Only called after
+    InitSampleBatch().
+
+    Args:
+      sampler: The sampler to sample using.
+      rows: The indices of the rows to reset.
+    """
+    raise NotImplementedError
+
+  def SampleBatch(self, sampler: samplers.Sampler,
+                  atomizer: atomizers.AtomizerBase, batch_size: int,
+                  continuous: bool = False) -> typing.Iterator[model_pb2.Sample]:
+    """Sample a batch, yielding each sample as soon as it is complete.
+
+    Sampled tokens are recorded as vocabulary indices, and termination is
+    determined for the whole batch at once using the sampler's batch
+    termination criteria. The text of a sample is decoded only once it is
+    complete. Only called after InitSampling().
+
+    Args:
+      sampler: The sampler to sample using.
+      atomizer: The atomizer that the sampler is specialized to, used to decode
+        samples.
+      batch_size: The number of samples in the batch.
+      continuous: If True, once the sample in a row of the batch is complete,
+        the row is reset using ResetSampleBatchRows() and immediately begins a
+        new sample. The returned iterator never ends.
+
+    Returns:
+      An iterator over samples. Unless continuous, the iterator ends after
+      batch_size samples.
+    """
+    start_time = labdate.MillisecondsTimestamp()
+    wall_time_start = start_time
+
+    self.InitSampleBatch(sampler, batch_size)
+    sampler.InitBatch(batch_size)
+
+    # The vocabulary indices of the samples in progress. The buffer grows as
+    # required.
+    start_length = len(sampler.encoded_start_text)
+    tokens = np.empty((batch_size, max(2 * start_length, 256)), dtype=np.int32)
+    tokens[:, :start_length] = sampler.encoded_start_text
+    lengths = np.full(batch_size, start_length, dtype=np.int32)
+    start_times = np.full(batch_size, start_time, dtype=np.int64)
+    done = np.zeros(batch_size, dtype=bool)
+    rows = np.arange(batch_size)
+
+    # Sampling loop. Continues until all samples in the batch are done.
+    while not done.all():
+      indices = np.asarray(self.SampleNextIndices(sampler, batch_size))
+      if lengths.max() == tokens.shape[1]:
+        tokens = np.concatenate((tokens, np.empty_like(tokens)), axis=1)
+      tokens[rows, lengths] = indices
+      lengths += 1
+
+      complete = np.flatnonzero(sampler.BatchIsComplete(indices) & ~done)
+      for i in complete:
+        end_time = labdate.MillisecondsTimestamp()
+        yield model_pb2.Sample(
+            text=atomizer.DeatomizeIndices(tokens[i, :lengths[i]]),
+            sample_start_epoch_ms_utc=int(start_times[i]),
+            sample_time_ms=end_time - int(start_times[i]),
+            wall_time_ms=end_time - wall_time_start,
+            num_tokens=int(lengths[i]))
+        wall_time_start = labdate.MillisecondsTimestamp()
+
+      if not complete.size:
+        continue
+      if continuous:
+        self.ResetSampleBatchRows(sampler, complete)
+        sampler.ResetBatchRows(complete)
+        lengths[complete] = start_length
+        start_times[complete] = labdate.MillisecondsTimestamp()
+      else:
+        done[complete] = True
@@ -0,0 +1,141 @@
+"""Unit tests for //deeplearning/clgen/models/backends.py."""
+import itertools
+import pathlib
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+from absl import app
+from absl import flags
+from phd.lib.labm8 import cache
+
+from deeplearning.clgen import samplers
+from deeplearning.clgen.corpuses import atomizers
+from deeplearning.clgen.models import backends
+from deeplearning.clgen.proto import sampler_pb2
+
+
+FLAGS = flags.FLAGS
+
+
+class MockBackend(backends.BackendBase):
+  """A backend which samples from a fixed sequence of indices."""
+
+  def __init__(self, atomizer: atomizers.AtomizerBase, text: str):
+    super(MockBackend, self).__init__(None, None, atomizer)
+    self.text = text
+    self.num_sample_batches = 0
+
+  def InitSampleBatch(self, sampler: samplers.Sampler, batch_size: int) -> None:
+    self.num_sample_batches += 1
+    self.step = 0
+    self.reset_rows = []
+
+  def ResetSampleBatchRows(self, sampler: samplers.Sampler,
+                           rows: np.ndarray) -> None:
+    self.reset_rows += rows.tolist()
+
+  def SampleNextIndices(self, sampler: samplers.Sampler,
+                        batch_size: int) -> np.ndarray:
+    # Each sample in the batch begins from a different offset into the text.
+    indices = self.atomizer.AtomizeString(
+        ''.join(self.text[(self.step + i) % len(self.text)]
+                for i in range(batch_size)))
+    self.step += 1
+    return indices
+
+
+@pytest.fixture(scope='function')
+def sampler() -> samplers.Sampler:
+  """A test fixture which returns a sampler which stops on balanced braces."""
+  return samplers.Sampler(sampler_pb2.Sampler(
+      start_text='k{', batch_size=3, temperature_micros=1000000,
+      termination_criteria=[
+        sampler_pb2.SampleTerminationCriterion(
+            symtok=sampler_pb2.SymmetricalTokenDepth(
+                depth_increase_token='{', depth_decrease_token='}')),
+        sampler_pb2.SampleTerminationCriterion(
+            maxlen=sampler_pb2.MaxTokenLength(maximum_tokens_in_sample=300)),
+      ]))
+
+
+def test_BackendBase_SampleBatch(sampler: samplers.Sampler):
+  """Test that samples are decoded and ordered by completion."""
+  atomizer = atomizers.AsciiCharacterAtomizer.FromText('k{}ab')
+  backend = MockBackend(atomizer, 'ab}{}}')
+  sampler.Specialize(atomizer)
+  samples = list(backend.SampleBatch(sampler, atomizer, 3))
+  assert backend.num_sample_batches == 1
+  assert [s.text for s in samples] == ['k{}', 'k{b}', 'k{ab}']
+  assert [s.num_tokens for s in samples] == [3, 4, 5]
+
+
+def test_BackendBase_SampleBatch_grows_buffer(sampler: samplers.Sampler):
+  """Test that samples longer than the initial token buffer are returned."""
+  atomizer = atomizers.AsciiCharacterAtomizer.FromText('k{}ab')
+  backend = MockBackend(atomizer, 'a')
+  sampler.Specialize(atomizer)
+  samples = list(backend.SampleBatch(sampler, atomizer, 2))
+  assert [s.text for s in samples] == ['k{' + 'a' * 298] * 2
+
+
+def test_BackendBase_SampleBatch_continuous(sampler: samplers.Sampler):
+  """Test that completed rows are reset and begin new samples."""
+  atomizer = atomizers.AsciiCharacterAtomizer.FromText('k{}ab')
+  backend = MockBackend(atomizer, 'ab}{}}')
+  sampler.Specialize(atomizer)
+  samples = itertools.islice(
+      backend.SampleBatch(sampler, atomizer, 3, continuous=True), 5)
+  assert [s.text for s in samples] == [
+    'k{}', 'k{b}', 'k{ab}', 'k{{}}', 'k{{}}']
+  assert backend.num_sample_batches == 1
+  assert backend.reset_rows == [2, 1, 0, 2]
+
+
+def test_BackendBase_LoadStartState_not_cached(sampler: samplers.Sampler):
+  """Test that None is returned for an uncached start state."""
+  with tempfile.TemporaryDirectory() as d:
+    backend = backends.BackendBase(None, cache.FSCache(d), None)
+    assert backend.LoadStartState(sampler, 'checkpoint-1') is None
+
+
+def test_BackendBase_SaveStartState_persists(sampler: samplers.Sampler):
+  """Test that a saved start state can be loaded by a new backend."""
+  with tempfile.TemporaryDirectory() as d:
+    backend = backends.BackendBase(None, cache.FSCache(d), None)
+    backend.SaveStartState(
+        sampler, 'checkpoint-1', [np.arange(3), np.ones(2, dtype=np.float32)])
+    assert [p.name for p in (pathlib.Path(d) / 'samples').iterdir()] == [
+      f'{sampler.hash}.checkpoint-1.start_state.npz']
+
+    backend = backends.BackendBase(None, cache.FSCache(d), None)
+    start_state = backend.LoadStartState(sampler, 'checkpoint-1')
+    assert len(start_state) == 2
+    np.testing.assert_array_equal(np.arange(3), start_state[0])
+    np.testing.assert_array_equal(np.ones(2), start_state[1])
+    assert start_state[1].dtype == np.float32
+    # Start states are specific to a checkpoint.
+    assert backend.LoadStartState(sampler, 'checkpoint-2') is None
+
+
+def test_BackendBase_SaveStartState_unwritable_cache(
+    sampler: samplers.Sampler):
+  """Test that a start state which can't be saved is still cached in memory."""
+  with tempfile.TemporaryDirectory() as d:
+    # A file in place of the samples directory makes the cache unwritable.
+    (pathlib.Path(d) / 'samples').touch()
+    backend = backends.BackendBase(None, cache.FSCache(d), None)
+    backend.SaveStartState(sampler, 'checkpoint-1', [np.arange(3)])
+    start_state = backend.LoadStartState(sampler, 'checkpoint-1')
+    np.testing.assert_array_equal(np.arange(3), start_state[0])
+
+
+def main(argv):
+  """Main entry point."""
+  del argv
+  sys.exit(pytest.main([__file__, '-vv']))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -63,24 +63,31 @@ def BatchGenerator(
   Returns:
     A generator suitable for use by a model's fit_generator() method.
   """
-  x, y, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
+  encoded_corpus, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
+  batch_size = training_opts.batch_size
+  sequence_length = training_opts.sequence_length
+  # The corpus is split into batch_size rows, and each batch is a window of
+  # sequence_length tokens across all rows.
+  row_length = steps_per_epoch * sequence_length
 
   # Per-epoch outer loop.
   epoch_num = 0
   while True:
     # Re-shuffle corpus if needed.
     if epoch_num and training_opts.shuffle_corpus_contentfiles_between_epochs:
-      x, y, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
+      encoded_corpus, steps_per_epoch = GetTrainingCorpus(corpus, training_opts)
 
-    # Roll so that we don't need to reset model states over epochs.
-    x_epoch = np.split(np.roll(x, -epoch_num, axis=0), steps_per_epoch, axis=1)
-    y_epoch = np.split(np.roll(y, -epoch_num, axis=0), steps_per_epoch, axis=1)
+    # Roll the rows so that we don't need to reset model states over epochs.
+    rows = (np.arange(batch_size) + epoch_num) % batch_size
     # Per-batch inner loop.
     for batch_num in range(steps_per_epoch):
+      starts = rows * row_length + batch_num * sequence_length
       batch = DataBatch(
-          X=x_epoch[batch_num],
+          X=GatherSequences(encoded_corpus, starts, sequence_length),
           # Lazy one-hot encoding.
-          y=OneHotEncode(y_epoch[batch_num], corpus.vocab_size))
+          y=OneHotEncode(
+              GatherSequences(encoded_corpus, starts + 1, sequence_length),
+              corpus.vocab_size))
       if not batch_num and not epoch_num:
         LogBatchTelemetry(batch, steps_per_epoch, training_opts.num_epochs)
       yield batch
@@ -96,11 +103,11 @@ class TensorflowBatchGenerator(object):
     # Lazily instantiated.
     self.encoded_corpus = None
     self.num_batches = 0
-    self.batches = None
+    self.clipped_corpus_length = 0
     self.CreateBatches()
 
     LogBatchTelemetry(
-        self.batches[0], self.num_batches, self.training_opts.num_epochs)
+        self.GetBatch(0), self.num_batches, self.training_opts.num_epochs)
 
   def CreateBatches(self) -> None:
     start_time = time.time()
@@ -109,8 +116,9 @@ class TensorflowBatchGenerator(object):
     self.i = 0
     if (self.encoded_corpus is None or
         self.training_opts.shuffle_corpus_contentfiles_between_epochs):
-      self.encoded_corpus = self.corpus.GetTrainingData(
-          shuffle=self.training_opts.shuffle_corpus_contentfiles_between_epochs)
+      self.encoded_corpus = GetEncodedCorpus(
+          self.corpus,
+          self.training_opts.shuffle_corpus_contentfiles_between_epochs)
 
     batch_size = self.training_opts.batch_size
     sequence_length = self.training_opts.sequence_length
@@ -122,43 +130,93 @@ class TensorflowBatchGenerator(object):
       raise errors.UserError(
           "Not enough data. Use a smaller sequence_length and batch_size")
 
-    # split into batches
-    clipped_corpus_length = self.num_batches * batch_size * sequence_length
-    clipped_corpus = self.encoded_corpus[:clipped_corpus_length]
-    xdata = clipped_corpus
-    ydata = np.copy(clipped_corpus)
-
-    # Wrap-around.
-    ydata[:-1] = xdata[1:]
-    ydata[-1] = xdata[0]
-    self.batches = [
-      DataBatch(x, y) for x, y in zip(
-          np.split(xdata.reshape(batch_size, -1), self.num_batches, 1),
-          np.split(ydata.reshape(batch_size, -1), self.num_batches, 1)
-      )
-    ]
+    # Batches are sliced from the encoded corpus on demand by GetBatch().
+    self.clipped_corpus_length = (
+        self.num_batches * batch_size * sequence_length)
     logging.info(
         'Encoded corpus of %s tokens (clipped last %s tokens) in %s ms.',
-        humanize.intcomma(clipped_corpus_length),
-        humanize.intcomma(len(self.encoded_corpus) - clipped_corpus_length),
+        humanize.intcomma(self.clipped_corpus_length),
+        humanize.intcomma(
+            len(self.encoded_corpus) - self.clipped_corpus_length),
         humanize.intcomma(int((time.time() - start_time) * 1000)))
 
+  def GetBatch(self, batch_num: int) -> DataBatch:
+    """Slice a batch from the encoded corpus.
+
+    The clipped corpus is split into batch_size rows, and each batch is a
+    window of sequence_length tokens across all rows. The y values are the
+    x values shifted by one token, wrapping around at the end of the clipped
+    corpus.
+
+    Args:
+      batch_num: The index of the batch, in the range [0, num_batches).
+
+    Returns:
+      X, Y DataBatch.
+    """
+    batch_size = self.training_opts.batch_size
+    sequence_length = self.training_opts.sequence_length
+    starts = (np.arange(batch_size) * self.num_batches * sequence_length +
+              batch_num * sequence_length)
+    x = GatherSequences(self.encoded_corpus, starts, sequence_length)
+    y = np.empty_like(x)
+    y[:, :-1] = x[:, 1:]
+    # The last y value of each row is the token following the window.
+    next_starts = (starts + sequence_length) % self.clipped_corpus_length
+    y[:, -1] = GatherSequences(self.encoded_corpus, next_starts, 1)[:, 0]
+    return DataBatch(x, y)
+
   def NextBatch(self) -> DataBatch:
     """Fetch next batch.
 
     Returns:
       X, Y DataBatch.
     """
-    batch = self.batches[self.i]
+    batch = self.GetBatch(self.i)
     self.i += 1
     assert 0 <= self.i <= self.num_batches
     return batch
 
 
+def GetEncodedCorpus(
+    corpus: 'corpuses.Corpus',
+    shuffle: bool) -> typing.Union[np.ndarray, 'encoded.ShuffledTokenStore']:
+  """Get the encoded corpus to slice training batches from.
+
+  Args:
+    corpus: A Corpus instance.
+    shuffle: If true, randomize the order of encoded contentfiles.
+
+  Returns:
+    The memory-mapped token store, or a shuffled view of it. Either supports
+    len() and slicing of contiguous ranges.
+  """
+  if shuffle:
+    return corpus.GetShuffledTrainingData()
+  return corpus.GetTrainingData(shuffle=False)
+
+
+def GatherSequences(
+    encoded_corpus: typing.Union[np.ndarray, 'encoded.ShuffledTokenStore'],
+    starts: np.ndarray, sequence_length: int) -> np.ndarray:
+  """Gather token sequences from the encoded corpus.
+
+  Args:
+    encoded_corpus: The encoded corpus, as returned by GetEncodedCorpus().
+    starts: An array of start positions in the encoded corpus.
+    sequence_length: The number of tokens in each sequence.
+
+  Returns:
+    A 2D array of shape [len(starts), sequence_length].
+  """
+  return np.stack(
+      [encoded_corpus[start:start + sequence_length] for start in starts])
+
+
 def GetTrainingCorpus(
     corpus: 'corpuses.Corpus',
     training_opts: model_pb2.TrainingOptions) -> typing.Tuple[
-  np.ndarray, np.ndarray, int]:
+  typing.Union[np.ndarray, 'encoded.ShuffledTokenStore'], int]:
   """Get the corpus to train over.
 
   Args:
@@ -166,15 +224,15 @@ def GetTrainingCorpus(
     training_opts: A TrainingOptions proto.
 
   Returns:
-    An X, y pair of data for an epoch, and the number of steps in the epoch.
+    The encoded corpus for an epoch, and the number of steps in the epoch.
 
   Raises:
     UserError: If batch_size and sequence_length are too large for the corpus,
       yielding no batches.
   """
   start_time = time.time()
-  encoded_corpus = corpus.GetTrainingData(
-      shuffle=training_opts.shuffle_corpus_contentfiles_between_epochs)
+  encoded_corpus = GetEncodedCorpus(
+      corpus, training_opts.shuffle_corpus_contentfiles_between_epochs)
   corpus_length = len(encoded_corpus)
   steps_per_epoch = (corpus_length - 1) // (
       training_opts.batch_size * training_opts.sequence_length)
@@ -188,21 +246,12 @@ def GetTrainingCorpus(
       steps_per_epoch * training_opts.batch_size *
       training_opts.sequence_length)
 
-  x = np.reshape(
-      encoded_corpus[:clipped_corpus_length],
-      [training_opts.batch_size,
-       steps_per_epoch * training_opts.sequence_length])
-  y = np.reshape(
-      encoded_corpus[1:clipped_corpus_length + 1],
-      [training_opts.batch_size,
-       steps_per_epoch * training_opts.sequence_length])
-
   logging.info(
       'Encoded corpus of %s tokens (clipped last %s tokens) in %s ms.',
       humanize.intcomma(clipped_corpus_length),
       humanize.intcomma(corpus_length - clipped_corpus_length),
       humanize.intcomma(int((time.time() - start_time) * 1000)))
-  return x, y, steps_per_epoch
+  return encoded_corpus, steps_per_epoch
 
 
 def OneHotEncode(indices: np.ndarray, vocabulary_size: int):
@@ -6,7 +6,9 @@ import pytest
 from absl import app
 
 from deeplearning.clgen import errors
+from deeplearning.clgen.corpuses import encoded
 from deeplearning.clgen.models import data_generators
+from deeplearning.clgen.proto import model_pb2
 
 
 class CorpusMock(object):
@@ -22,6 +24,31 @@ class CorpusMock(object):
     return np.array([1] * self.corpus_len)
 
 
+class ShuffledCorpusMock(object):
+  """A corpus of contentfiles with a fixed shuffled order."""
+
+  def __init__(self):
+    self.vocab_size = 100
+    self.tokens = np.arange(100, dtype=np.int32)
+    self.offsets = np.array([0, 7, 30, 31, 64, 100], dtype=np.int64)
+    self.order = np.array([2, 4, 0, 3, 1])
+
+  def GetTrainingData(self, shuffle: bool) -> np.ndarray:
+    if shuffle:
+      return self.GetShuffledTrainingData()[:]
+    return self.tokens
+
+  def GetShuffledTrainingData(self) -> encoded.ShuffledTokenStore:
+    return encoded.ShuffledTokenStore(self.tokens, self.offsets, self.order)
+
+
+def MakeTrainingOptions(shuffle: bool) -> model_pb2.TrainingOptions:
+  """Create training options for the ShuffledCorpusMock."""
+  return model_pb2.TrainingOptions(
+      num_epochs=2, sequence_length=5, batch_size=3,
+      shuffle_corpus_contentfiles_between_epochs=shuffle)
+
+
 # BatchGenerator() tests.
 @pytest.mark.skip(reason='TODO(cec):')
 def test_BatchGenerator_sequence_length_too_large(abc_model_config):
@@ -45,6 +72,44 @@ def test_BatchGenerator_batch_size_too_large(abc_model_config):
   assert ('') == str(e_info.value)
 
 
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_BatchGenerator_batches(shuffle: bool):
+  """Test that batches are windows over rows of the corpus."""
+  corpus = ShuffledCorpusMock()
+  data = corpus.GetTrainingData(shuffle)
+  # 99 // (3 * 5) = 6 steps per epoch, with rows of 30 tokens.
+  x = np.reshape(data[:90], [3, 30])
+  y = np.reshape(data[1:91], [3, 30])
+  generator = data_generators.BatchGenerator(corpus, MakeTrainingOptions(shuffle))
+  for epoch_num in range(2):
+    for batch_num in range(6):
+      batch = next(generator)
+      columns = slice(batch_num * 5, (batch_num + 1) * 5)
+      np.testing.assert_array_equal(
+          np.roll(x, -epoch_num, axis=0)[:, columns], batch.X)
+      np.testing.assert_array_equal(
+          np.roll(y, -epoch_num, axis=0)[:, columns],
+          np.argmax(batch.y, axis=2))
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_TensorflowBatchGenerator_batches(shuffle: bool):
+  """Test that batches are windows over rows of the clipped corpus."""
+  corpus = ShuffledCorpusMock()
+  data = corpus.GetTrainingData(shuffle)
+  # 100 // (3 * 5) = 6 batches, with rows of 30 tokens.
+  x = data[:90]
+  y = np.roll(x, -1)
+  generator = data_generators.TensorflowBatchGenerator(
+      corpus, MakeTrainingOptions(shuffle))
+  assert generator.num_batches == 6
+  for batch_num in range(6):
+    batch = generator.NextBatch()
+    columns = slice(batch_num * 5, (batch_num + 1) * 5)
+    np.testing.assert_array_equal(x.reshape(3, 30)[:, columns], batch.X)
+    np.testing.assert_array_equal(y.reshape(3, 30)[:, columns], batch.y)
+
+
 # OneHotEncode() tests.
 
 def test_OneHotEncode_empty_input():
@@ -41,6 +41,7 @@ class KerasBackend(backends.BackendBase):
 
     self.inference_indices = None
     self.inference_model = None
+    self.inference_checkpoint = None
 
   def GetTrainingModel(self) -> 'keras.models.Sequential':
     """Get the Keras model."""
@@ -176,31 +177,63 @@ class KerasBackend(backends.BackendBase):
   def InitSampling(self, sampler: samplers.Sampler,
                    seed: typing.Optional[int] = None) -> int:
     self.inference_model, batch_size = self.GetInferenceModel()
+    self.inference_checkpoint = self.epoch_checkpoints[
+      self.config.training.num_epochs - 1].stem
     if seed is not None:
       np.random.seed(seed)
     return batch_size
 
   def InitSampleBatch(self, sampler: samplers.Sampler, batch_size: int) -> None:
-    self.inference_model.reset_states()
-    # Set internal states from seed text.
-    for index in sampler.encoded_start_text[:-1]:
-      x = np.array([[index]] * batch_size)
-      # input shape: (batch_size, 1)
-      self.inference_model.predict(x)
+    # Deferred importing of Keras so that we don't have to activate the
+    # TensorFlow backend every time we import this module.
+    import keras
+
+    start_state = self.LoadStartState(sampler, self.inference_checkpoint)
+    if start_state is None:
+      self.inference_model.reset_states()
+      # Set internal states from seed text.
+      for index in sampler.encoded_start_text[:-1]:
+        x = np.array([[index]] * batch_size)
+        # input shape: (batch_size, 1)
+        self.inference_model.predict(x)
+      self.SaveStartState(sampler, self.inference_checkpoint, [
+        keras.backend.get_value(state)[0]
+        for state in self.GetInferenceStates()])
+    else:
+      # Every row of the batch begins from the same cached state.
+      for state, start_row in zip(self.GetInferenceStates(), start_state):
+        keras.backend.set_value(
+            state, np.repeat(start_row[np.newaxis], batch_size, axis=0))
 
-    self.inference_indices = sampler.encoded_start_text[-1]
+    self.inference_indices = np.full(
+        (batch_size, 1), sampler.encoded_start_text[-1], dtype=np.int32)
+
+  def ResetSampleBatchRows(self, sampler: samplers.Sampler,
+                           rows: np.ndarray) -> None:
+    import keras
+
+    start_state = self.LoadStartState(sampler, self.inference_checkpoint)
+    for state, start_row in zip(self.GetInferenceStates(), start_state):
+      value = keras.backend.get_value(state)
+      value[rows] = start_row
+      keras.backend.set_value(state, value)
+    self.inference_indices[rows] = sampler.encoded_start_text[-1]
 
   def SampleNextIndices(self, sampler: samplers.Sampler, batch_size: int):
     # Predict the next index for the entire batch.
-    x = np.array([self.inference_indices] * batch_size)
     # Input shape: (bath_size, 1).
-    probabilities = self.inference_model.predict(x)
+    probabilities = self.inference_model.predict(self.inference_indices)
     # Output shape: (batch_size, 1, vocab_size).
-    self.inference_indices = [
+    self.inference_indices[:, 0] = [
       WeightedPick(p.squeeze(), sampler.temperature)
       for p in probabilities
     ]
-    return self.inference_indices
+    return self.inference_indices[:, 0].copy()
+
+  def GetInferenceStates(self) -> typing.List['tf.Variable']:
+    """Return the state variables of the inference model's stateful layers."""
+    return [state for layer in self.inference_model.layers
+            if getattr(layer, 'stateful', False) for state in layer.states]
 
   def InferenceManifest(self) -> typing.List[pathlib.Path]:
     """Return the list of files which are required for model inference.
@@ -38,6 +38,19 @@ class MockSampler(object):
     """Crude 'maxlen' mock."""
     return len(sample_in_progress) >= 10
 
+  def InitBatch(self, batch_size):
+    """Sampler.InitBatch() mock."""
+    self.lengths = np.full(batch_size, len(self.encoded_start_text))
+
+  def BatchIsComplete(self, indices):
+    """Crude 'maxlen' mock."""
+    self.lengths += 1
+    return self.lengths >= 10
+
+  def ResetBatchRows(self, rows):
+    """Sampler.ResetBatchRows() mock."""
+    self.lengths[rows] = len(self.encoded_start_text)
+
 
 @pytest.fixture(scope='function')
 def abc_keras_model_config(abc_model_config: model_pb2.Model):
@@ -1,6 +1,5 @@
 """This file defines the PreTrainedModel class."""
 import humanize
-import numpy as np
 import pathlib
 import typing
 from absl import flags
@@ -61,7 +60,8 @@ class PreTrainedModel(object):
         sampling occurs in batches. The model will continue producing samples
         until the lowest mulitple of the sampler batch size property that is
         larger than this value. E.g. if min_num_samples is 7 and the Sampler
-        batch size is 10, 10 samples will be returned.
+        batch size is 10, 10 samples will be returned. With
+        --clgen_continuous_batching, exactly min_num_samples are returned.
       seed: A numeric value to seed the RNG with. If not present, the RNG is
         seeded randomly.
 
@@ -83,42 +83,14 @@ class PreTrainedModel(object):
     # Per-sample batch outer loop. Continues until we have as many samples
     # as we want.
     while True:
-      samples_in_progress = [
-        sampler.tokenized_start_text.copy()
-        for _ in range(batch_size)]
-      done = np.zeros(batch_size, dtype=np.bool)
-      start_time = labdate.MillisecondsTimestamp()
-      wall_time_start = start_time
-
-      self.backend.InitSampleBatch(sampler, batch_size)
-
-      # Sampling loop. Continues until all samples in the batch are done.
-      while True:
-        indices = self.backend.SampleNextIndices(sampler, batch_size)
-
-        # Iterate over all samples in batch to determine whether they're
-        # done.
-        for i in range(batch_size):
-          if done[i]:
-            continue
-
-          token = atomizer.decoder[indices[i]]
-          samples_in_progress[i].append(token)
-          if sampler.SampleIsComplete(samples_in_progress[i]):
-            end_time = labdate.MillisecondsTimestamp()
-            done[i] = 1
-            sample = model_pb2.Sample(
-                text=''.join(samples_in_progress[i]),
-                sample_start_epoch_ms_utc=start_time,
-                sample_time_ms=end_time - start_time,
-                wall_time_ms=end_time - wall_time_start,
-                num_tokens=len(samples_in_progress[i]))
-            sample_count += 1
-            yield sample
-            wall_time_start = labdate.MillisecondsTimestamp()
-
-        # Complete the batch.
-        if done.all():
+      for sample in self.backend.SampleBatch(
+          sampler, atomizer, batch_size,
+          continuous=FLAGS.clgen_continuous_batching):
+        sample_count += 1
+        yield sample
+        # In continuous batching mode, the batch never ends.
+        if (FLAGS.clgen_continuous_batching and
+            sample_count > min_num_samples):
           break
 
       # Complete sampling. Note that sample_count starts at 1.
@@ -38,6 +38,8 @@ class TensorFlowBackend(backends.BackendBase):
     self.initial_state = None
     self.logits = None
     self.probs = None
+    self.temperature = None
+    self.generated = None
     self.loss = None
     self.final_state = None
     self.learning_rate = None
@@ -46,10 +48,12 @@ class TensorFlowBackend(backends.BackendBase):
 
     self.inference_tf = None
     self.inference_sess = None
+    self.inference_checkpoint = None
     self.inference_state = None
     self.inference_indices = None
 
-  def InitTfGraph(self, inference: bool) -> 'tf':
+  def InitTfGraph(self, inference: bool,
+                  seed: typing.Optional[int] = None) -> 'tf':
     """Instantiate a TensorFlow graph for training or inference.
 
     The tensorflow graph is different for training and inference, so must be
@@ -58,6 +62,8 @@ class TensorFlowBackend(backends.BackendBase):
     Args:
       inference: If True, initialize model for inference. If False, initialize
         model for training.
+      seed: A numeric value to seed the graph-level RNG with. If not present,
+        the RNG is seeded randomly.
 
     Returns:
       The imported TensorFlow module.
@@ -83,6 +89,8 @@ class TensorFlowBackend(backends.BackendBase):
 
     # Reset the graph when switching between training and inference.
     tf.reset_default_graph()
+    if seed is not None:
+      tf.set_random_seed(seed)
 
     # Corpus attributes.
     sequence_length = 1 if inference else self.config.training.sequence_length
@@ -127,6 +135,12 @@ class TensorFlowBackend(backends.BackendBase):
                         [-1, self.config.architecture.neurons_per_layer])
     self.logits = tf.matmul(output, softmax_w) + softmax_b
     self.probs = tf.nn.softmax(self.logits)
+    if inference:
+      # Temperature sampling of the next indices for the whole batch, so that
+      # only the sampled indices leave the session.
+      self.temperature = tf.placeholder(tf.float32, [])
+      self.generated = tf.squeeze(tf.multinomial(
+          self.logits / self.temperature, 1, output_dtype=tf.int32), [1])
     sequence_loss = seq2seq.sequence_loss_by_example(
         [self.logits],
         [tf.reshape(self.targets, [-1])],
@@ -333,12 +347,7 @@ class TensorFlowBackend(backends.BackendBase):
     if self.inference_sess:
       del self.inference_sess
 
-    # Seed the RNG.
-    if seed is not None:
-      np.random.seed(seed)
-      self.inference_tf.set_random_seed(seed)
-
-    self.inference_tf = self.InitTfGraph(inference=True)
+    self.inference_tf = self.InitTfGraph(inference=True, seed=seed)
     self.inference_sess = self.inference_tf.Session()
 
     self.inference_tf.global_variables_initializer().run(
@@ -355,6 +364,8 @@ class TensorFlowBackend(backends.BackendBase):
     assert checkpoint_state.model_checkpoint_path
 
     saver.restore(self.inference_sess, checkpoint_state.model_checkpoint_path)
+    self.inference_checkpoint = pathlib.Path(
+        checkpoint_state.model_checkpoint_path).name
 
     return self.config.training.batch_size
 
@@ -363,27 +374,45 @@ class TensorFlowBackend(backends.BackendBase):
         self.cell.zero_state(batch_size, self.inference_tf.float32))
     self.inference_indices = np.zeros((batch_size, 1))
 
-    # Seed the model state with the starting text.
-    for symbol in sampler.encoded_start_text[:-1]:
-      self.inference_indices[:] = symbol
-      feed = {
-        self.input_data: self.inference_indices,
-        self.initial_state: self.inference_state
-      }
-      [self.inference_state] = self.inference_sess.run([self.final_state], feed)
+    start_state = self.LoadStartState(sampler, self.inference_checkpoint)
+    if start_state is None:
+      # Seed the model state with the starting text.
+      for symbol in sampler.encoded_start_text[:-1]:
+        self.inference_indices[:] = symbol
+        feed = {
+          self.input_data: self.inference_indices,
+          self.initial_state: self.inference_state
+        }
+        [self.inference_state] = self.inference_sess.run(
+            [self.final_state], feed)
+      self.SaveStartState(sampler, self.inference_checkpoint, [
+        state[0] for state in FlattenState(self.inference_state)])
+    else:
+      # Every row of the batch begins from the same cached state.
+      for state, start_row in zip(FlattenState(self.inference_state),
+                                  start_state):
+        state[:] = start_row
     self.inference_indices[:] = sampler.encoded_start_text[-1]
 
+  def ResetSampleBatchRows(self, sampler: samplers.Sampler,
+                           rows: np.ndarray) -> None:
+    start_state = self.LoadStartState(sampler, self.inference_checkpoint)
+    for state, start_row in zip(FlattenState(self.inference_state),
+                                start_state):
+      state[rows] = start_row
+    self.inference_indices[rows] = sampler.encoded_start_text[-1]
+
   def SampleNextIndices(self, sampler: samplers.Sampler, batch_size: int):
     # Sample distribution to pick next symbol.
     feed = {
       self.input_data: self.inference_indices,
       self.initial_state: self.inference_state
     }
-    [predictions, self.inference_state] = self.inference_sess.run(
-        [self.probs, self.final_state], feed)
-    self.inference_indices[:, 0] = [
-      WeightedPick(p, sampler.temperature) for p in predictions]
-    return [i[0] for i in self.inference_indices]
+    feed[self.temperature] = sampler.temperature
+    [generated, self.inference_state] = self.inference_sess.run(
+        [self.generated, self.final_state], feed)
+    self.inference_indices[:, 0] = generated
+    return generated
 
   @property
   def is_trained(self) -> bool:
@@ -396,11 +425,15 @@ class TensorFlowBackend(backends.BackendBase):
     return self.config.training.num_epochs in epoch_nums
 
 
-def WeightedPick(predictions: np.ndarray, temperature: float) -> np.ndarray:
-  """Make a weighted choice from a predictions array."""
-  predictions = np.log(np.asarray(predictions).astype('float64')) / temperature
-  predictions_exp = np.exp(predictions)
-  # Normalize the probabilities.
-  predictions = predictions_exp / np.sum(predictions_exp)
-  predictions = np.random.multinomial(1, predictions, 1)
-  return np.argmax(predictions)
+def FlattenState(state) -> typing.List[np.ndarray]:
+  """Flatten a nested tuple of RNN state arrays.
+
+  Args:
+    state: An RNN state array, or a (nested) tuple of state arrays.
+
+  Returns:
+    A list of state arrays, in depth-first order.
+  """
+  if isinstance(state, np.ndarray):
+    return [state]
+  return [array for substate in state for array in FlattenState(substate)]
@@ -4,6 +4,7 @@ import numpy as np
 import pytest
 import sys
 from absl import app
+from absl import flags
 from phd.lib.labm8 import crypto
 from phd.lib.labm8 import pbutil
 
@@ -13,6 +14,9 @@ from deeplearning.clgen.proto import model_pb2
 from deeplearning.clgen.proto import telemetry_pb2
 
 
+FLAGS = flags.FLAGS
+
+
 class MockSampler(object):
   """Mock class for a Sampler."""
 
@@ -36,6 +40,19 @@ class MockSampler(object):
     """Crude 'maxlen' mock."""
     return len(sample_in_progress) >= 10
 
+  def InitBatch(self, batch_size):
+    """Sampler.InitBatch() mock."""
+    self.lengths = np.full(batch_size, len(self.encoded_start_text))
+
+  def BatchIsComplete(self, indices):
+    """Crude 'maxlen' mock."""
+    self.lengths += 1
+    return self.lengths >= 10
+
+  def ResetBatchRows(self, rows):
+    """Sampler.ResetBatchRows() mock."""
+    self.lengths[rows] = len(self.encoded_start_text)
+
 
 @pytest.fixture(scope='function')
 def abc_tensorflow_model_config(abc_model_config: model_pb2.Model):
@@ -190,13 +207,40 @@ def test_TensorFlowBackend_Sample_inexact_multiple_of_batch_size(
   assert len(m.Sample(MockSampler(), 4)) == 6
 
 
-# WeightedPick() tests.
+def test_TensorFlowBackend_Sample_continuous_batching(
+    clgen_cache_dir,
+    abc_tensorflow_model_config):
+  """Test that exactly min_num_samples are returned in continuous mode."""
+  del clgen_cache_dir
+  abc_tensorflow_model_config.training.batch_size = 3
+  m = models.Model(abc_tensorflow_model_config)
+  FLAGS.clgen_continuous_batching = True
+  try:
+    assert len(m.Sample(MockSampler(), 2)) == 2
+    assert len(m.Sample(MockSampler(), 4)) == 4
+  finally:
+    FLAGS.clgen_continuous_batching = False
+
+
+def test_TensorFlowBackend_SampleFast_seed_is_deterministic(
+    clgen_cache_dir,
+    abc_tensorflow_model_config):
+  """Test that samples are reproducible when seeded."""
+  del clgen_cache_dir
+  m = models.Model(abc_tensorflow_model_config)
+  samples_a = m.SampleFast(MockSampler(), 4, seed=204)
+  samples_b = m.SampleFast(MockSampler(), 4, seed=204)
+  assert [s.text for s in samples_a] == [s.text for s in samples_b]
+
+
+# FlattenState() tests.
 
-@pytest.mark.skip(reason='TODO(cec): Update for new WeightedPick().')
-def test_WeightedPick_output_range():
-  """Test that WeightedPick() returns an integer index into array"""
-  a = [1, 2, 3, 4]
-  assert 0 <= tensorflow_backend.WeightedPick(np.array(a), 1.0) <= len(a)
+def test_FlattenState_nested_tuple():
+  """Test that state arrays are flattened in depth-first order."""
+  a, b, c = np.zeros(1), np.ones(1), np.full(1, 2)
+  flat = tensorflow_backend.FlattenState(((a, b), c))
+  assert len(flat) == 3
+  assert flat[0] is a and flat[1] is b and flat[2] is c
 
 
 # Benchmarks.
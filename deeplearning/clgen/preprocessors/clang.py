@@ -9,7 +9,6 @@ import json
 import re
 import subprocess
 import sys
-import tempfile
 import typing
 from absl import flags
 from absl import logging
@@ -25,6 +24,10 @@ FLAGS = flags.FLAGS
 _LLVM_REPO = 'llvm_mac' if sys.platform == 'darwin' else 'llvm_linux'
 # Path to clang binary.
 CLANG = bazelutil.DataPath(f'{_LLVM_REPO}/bin/clang')
+# The clang -x languages of source file suffixes, used to compile sources from
+# stdin.
+CLANG_LANGUAGES = {'.c': 'c', '.cc': 'c++', '.cpp': 'c++', '.cxx': 'c++',
+                   '.cl': 'cl'}
 # The marker used to mark stdin from clang pre-processor output.
 CLANG_STDIN_MARKER = re.compile(r'# \d+ "<stdin>" 2')
 # Options to pass to clang-format.
@@ -105,10 +108,13 @@ def CompileLlvmBytecode(src: str, suffix: str, cflags: typing.List[str],
                         timeout_seconds: int = 60) -> str:
   """Compile input code into textual LLVM byte code.
 
+  The source is passed to clang on stdin, so the suffix determines the
+  language of the source.
+
   Args:
     src: The source code to compile.
-    suffix: The suffix to append to the source code temporary file. E.g. '.c'
-      for a C program.
+    suffix: The file name suffix of the source code, e.g. '.c' for a C program.
+      See CLANG_LANGUAGES for the supported suffixes.
     cflags: A list of flags to be passed to clang.
     timeout_seconds: The number of seconds to allow before killing clang.
 
@@ -116,20 +122,19 @@ def CompileLlvmBytecode(src: str, suffix: str, cflags: typing.List[str],
     The textual LLVM byte code.
 
   Raises:
+    ValueError: If the suffix is not supported.
     ClangException: In case of an error.
     ClangTimeout: If clang does not complete before timeout_seconds.
   """
+  if suffix not in CLANG_LANGUAGES:
+    raise ValueError(f"Unsupported source suffix: '{suffix}'")
   builtin_cflags = ['-S', '-emit-llvm', '-o', '-']
-  with tempfile.NamedTemporaryFile('w', prefix='clgen_clang_',
-                                   suffix=suffix) as f:
-    f.write(src)
-    f.flush()
-    cmd = ['timeout', '-s9', str(timeout_seconds), str(CLANG),
-           f.name] + builtin_cflags + cflags
-    logging.debug('$ %s', ' '.join(cmd))
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE, universal_newlines=True)
-    stdout, stderr = process.communicate()
+  cmd = ['timeout', '-s9', str(timeout_seconds), str(CLANG),
+         '-x', CLANG_LANGUAGES[suffix], '-'] + builtin_cflags + cflags
+  logging.debug('$ %s', ' '.join(cmd))
+  process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+  stdout, stderr = process.communicate(src)
   if process.returncode == 9:
     raise errors.ClangTimeout(f'Clang timed out after {timeout_seconds}s')
   elif process.returncode != 0:
@@ -140,10 +145,11 @@ def CompileLlvmBytecode(src: str, suffix: str, cflags: typing.List[str],
 def ClangFormat(text: str, suffix: str, timeout_seconds: int = 60) -> str:
   """Run clang-format on a source to enforce code style.
 
+  The source is passed to clang-format on stdin.
+
   Args:
     text: The source code to run through clang-format.
-    suffix: The suffix to append to the source code temporary file. E.g. '.c'
-      for a C program.
+    suffix: The file name suffix of the source code, e.g. '.c' for a C program.
     timeout_seconds: The number of seconds to allow clang-format to run for.
 
   Returns:
@@ -16,7 +16,19 @@
 // Prints the number of variable and function names that are rewritten. If
 // nothing is rewritten, exit with status code
 #define E_NO_INPUT 204
-
+//
+// Server mode:
+//
+//     ./rewriter --server input.cl -extra-arg=... --
+//
+// Rewrites many sources, read from stdin. The source path is not read from
+// disk, but is used as the name of every source, so its suffix determines the
+// language. Each request is a line containing the length of the source in
+// bytes, followed by the source. Each response is a line containing the status
+// code and the length of the rewritten source in bytes, followed by the
+// rewritten source. The server exits when stdin is closed.
+
+#include <iostream>
 #include <map>
 #include <memory>
 #include <set>
@@ -85,6 +97,10 @@ static clang::Rewriter rewriter;
 
 static llvm::cl::OptionCategory _tool_category("clgen");
 
+static llvm::cl::opt<bool> _server_mode(
+    "server", llvm::cl::desc("Rewrite sources read from stdin"),
+    llvm::cl::cat(_tool_category));
+
 // function rewrite counters
 static unsigned int _fn_decl_rewrites_counter = 0;
 static unsigned int _fn_call_rewrites_counter = 0;
@@ -161,7 +177,7 @@ std::string get_next_name(rewrite_table_t& rewrites,
 
 class RewriterVisitor : public clang::RecursiveASTVisitor<RewriterVisitor> {
  private:
-  std::unique_ptr<clang::ASTContext> _context;  // additional AST info
+  clang::ASTContext* _context;  // additional AST info, owned by the compiler
 
   // identifier rewrite tables. There's one table to rewrite function names,
   // one table to rewrite global variables, and one table for each user
@@ -378,7 +394,7 @@ class RewriterVisitor : public clang::RecursiveASTVisitor<RewriterVisitor> {
 
 class RewriterASTConsumer : public clang::ASTConsumer {
  private:
-  RewriterVisitor *visitor;
+  std::unique_ptr<RewriterVisitor> visitor;
 
  public:
   // override the constructor in order to pass CI
@@ -404,6 +420,55 @@ class RewriterFrontendAction : public clang::ASTFrontendAction {
 };
 
 
+// reset the global state between sources in server mode
+//
+static void reset() {
+  rewriter = clang::Rewriter();
+  _fn_decl_rewrites_counter = 0;
+  _fn_call_rewrites_counter = 0;
+  _var_decl_rewrites_counter = 0;
+  _var_use_rewrites_counter = 0;
+}
+
+
+// rewrite sources read from stdin until it is closed
+//
+static int serve(clang::tooling::CommonOptionsParser& op) {
+  const std::string path = op.getSourcePathList()[0];
+  const auto factory = clang::tooling::newFrontendActionFactory<
+      RewriterFrontendAction>();
+
+  size_t length;
+  while (std::cin >> length) {
+    std::cin.ignore(1);  // the newline
+    std::string src(length, '\0');
+    std::cin.read(&src[0], length);
+    if (static_cast<size_t>(std::cin.gcount()) != length)
+      return 1;
+
+    reset();
+    clang::tooling::ClangTool tool(op.getCompilations(),
+                                   std::vector<std::string>{path});
+    tool.mapVirtualFile(path, src);
+    int result = tool.run(factory.get());
+
+    std::string out;
+    if (isRewritten()) {
+      llvm::raw_string_ostream stream(out);
+      const auto& id = rewriter.getSourceMgr().getMainFileID();
+      rewriter.getEditBuffer(id).write(stream);
+      stream.flush();
+    } else {
+      result = E_NO_INPUT;
+    }
+
+    llvm::outs() << result << " " << out.size() << "\n" << out;
+    llvm::outs().flush();
+  }
+  return 0;
+}
+
+
 }  // namespace rewriter
 
 
@@ -411,6 +476,9 @@ class RewriterFrontendAction : public clang::ASTFrontendAction {
 //
 int main(int argc, const char** argv) {
   clang::tooling::CommonOptionsParser op(argc, argv, rewriter::_tool_category);
+  if (rewriter::_server_mode)
+    return rewriter::serve(op);
+
   clang::tooling::ClangTool tool(op.getCompilations(), op.getSourcePathList());
 
   const auto result = tool.run(
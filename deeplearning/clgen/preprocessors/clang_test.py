@@ -228,7 +228,15 @@ def test_CompileLlvmBytecode_command(mocker):
   subprocess.Popen.assert_called_once()
   cmd = subprocess.Popen.call_args_list[0][0][0]
   assert cmd[:3] == ['timeout', '-s9', '60']
-  assert cmd[5:] == ['-S', '-emit-llvm', '-o', '-', '-foo']
+  assert cmd[4:] == ['-x', 'c', '-', '-S', '-emit-llvm', '-o', '-', '-foo']
+  # The source is passed on stdin.
+  assert mock_Popen.call_args_list[0][1]['stdin'] == subprocess.PIPE
+
+
+def test_CompileLlvmBytecode_unsupported_suffix():
+  """Test that ValueError is raised for an unknown source suffix."""
+  with pytest.raises(ValueError):
+    clang.CompileLlvmBytecode('', '.java', [])
 
 
 def test_CompileLlvmBytecode_ClangTimeout(mocker):
@@ -1,7 +1,9 @@
 """Python entry point to the clang_rewriter binary."""
 import os
+import select
 import subprocess
 import tempfile
+import time
 import typing
 
 from absl import flags
@@ -13,6 +15,13 @@ from phd.lib.labm8 import bazelutil
 
 FLAGS = flags.FLAGS
 
+flags.DEFINE_boolean(
+    'clgen_rewriter_server', False,
+    'If true, NormalizeIdentifiers() sends sources to a long-lived '
+    'clang_rewriter server process, rather than starting a new process for '
+    'every source. Each process (e.g. each preprocessing pool worker) starts '
+    'one server for every combination of file suffix and clang flags.')
+
 CLGEN_REWRITER = bazelutil.DataPath(
     'phd/deeplearning/clgen/preprocessors/clang_rewriter')
 assert CLGEN_REWRITER.is_file()
@@ -24,6 +33,127 @@ if bazelutil.DataPath('llvm_linux', must_exist=False).is_dir():
   liblto = bazelutil.DataPath('llvm_linux/lib/libLTO.so')
   CLGEN_REWRITER_ENV['LD_PRELOAD'] = f'{libclang}:{liblto}'
 
+# If there was nothing to rewrite, rewriter exits with error code:
+EUGLY_CODE = 204
+
+
+class RewriterServer(object):
+  """A long-lived clang_rewriter process which rewrites many sources.
+
+  Sources are sent to the server over a pipe, amortizing the cost of process
+  creation and clang startup over every source. If the server times out or
+  crashes, it is killed, and a new server is started for the next source.
+  """
+
+  def __init__(self, suffix: str, cflags: typing.List[str]):
+    self.cmd = [str(CLGEN_REWRITER), '--server', f'input{suffix}'] + [
+      '-extra-arg=' + x for x in cflags] + ['--']
+    self.process = None
+    self._buffer = b''
+
+  def Start(self) -> None:
+    """Start the server process."""
+    logging.debug('$ %s', ' '.join(self.cmd))
+    # Diagnostics are discarded, as an unread stderr pipe would eventually
+    # fill and block the server.
+    self.process = subprocess.Popen(self.cmd, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.DEVNULL,
+                                    env=CLGEN_REWRITER_ENV)
+    self._buffer = b''
+
+  def Stop(self) -> None:
+    """Kill the server process."""
+    if self.process:
+      self.process.kill()
+      self.process.wait()
+      self.process = None
+
+  def Rewrite(self, text: str, timeout_seconds: int = 60) -> str:
+    """Rewrite a source.
+
+    Args:
+      text: The source code to rewrite.
+      timeout_seconds: The number of seconds to allow before killing the
+        server.
+
+    Returns:
+      Source code with identifier names normalized.
+
+    Raises:
+      RewriterException: If rewriter found nothing to rewrite, or if the server
+        crashed.
+      ClangTimeout: If rewriter fails to complete within timeout_seconds.
+    """
+    if not self.process or self.process.poll() is not None:
+      self.Start()
+    deadline = time.time() + timeout_seconds
+    src = text.encode('utf-8')
+    try:
+      self.process.stdin.write(f'{len(src)}\n'.encode('utf-8') + src)
+      self.process.stdin.flush()
+      returncode, length = self._ReadUntil(b'\n', deadline).split()
+      stdout = self._Read(int(length), deadline).decode('utf-8')
+    except (BrokenPipeError, EOFError, ValueError):
+      self.Stop()
+      raise errors.RewriterException('clang_rewriter server crashed')
+    except TimeoutError:
+      self.Stop()
+      raise errors.ClangTimeout(
+          f'clang_rewriter failed to complete after {timeout_seconds}s')
+    if int(returncode) == EUGLY_CODE:
+      raise errors.RewriterException('clang_rewriter found nothing to rewrite')
+    # As with NormalizeIdentifiers(), all other error codes are ignored.
+    return stdout
+
+  def _Fill(self, deadline: float) -> None:
+    """Read available output from the server into the buffer."""
+    fd = self.process.stdout.fileno()
+    remaining = deadline - time.time()
+    if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+      raise TimeoutError
+    data = os.read(fd, 65536)
+    if not data:
+      raise EOFError
+    self._buffer += data
+
+  def _ReadUntil(self, delimiter: bytes, deadline: float) -> bytes:
+    """Read from the server up to and including a delimiter."""
+    while delimiter not in self._buffer:
+      self._Fill(deadline)
+    i = self._buffer.index(delimiter) + len(delimiter)
+    data, self._buffer = self._buffer[:i], self._buffer[i:]
+    return data
+
+  def _Read(self, n: int, deadline: float) -> bytes:
+    """Read exactly n bytes from the server."""
+    while len(self._buffer) < n:
+      self._Fill(deadline)
+    data, self._buffer = self._buffer[:n], self._buffer[n:]
+    return data
+
+
+# The rewriter servers of this process, keyed by suffix and cflags. Child
+# processes must not share their parent's servers, so the servers are
+# discarded if the process ID changes.
+_rewriter_servers: typing.Dict[typing.Tuple[str, ...], RewriterServer] = {}
+_rewriter_servers_pid = os.getpid()
+
+
+def GetRewriterServer(suffix: str,
+                      cflags: typing.List[str]) -> RewriterServer:
+  """Return the rewriter server of this process for a suffix and cflags."""
+  global _rewriter_servers
+  global _rewriter_servers_pid
+  if _rewriter_servers_pid != os.getpid():
+    _rewriter_servers = {}
+    _rewriter_servers_pid = os.getpid()
+  key = (suffix, *cflags)
+  if key not in _rewriter_servers:
+    _rewriter_servers[key] = RewriterServer(suffix, cflags)
+  return _rewriter_servers[key]
+
+
 def NormalizeIdentifiers(text: str, suffix: str, cflags: typing.List[str],
                          timeout_seconds: int = 60) -> str:
   """Normalize identifiers in source code.
@@ -49,6 +179,9 @@ def NormalizeIdentifiers(text: str, suffix: str, cflags: typing.List[str],
     RewriterException: If rewriter found nothing to rewrite.
     ClangTimeout: If rewriter fails to complete within timeout_seconds.
   """
+  if FLAGS.clgen_rewriter_server:
+    return GetRewriterServer(suffix, cflags).Rewrite(text, timeout_seconds)
+
   with tempfile.NamedTemporaryFile('w', suffix=suffix) as f:
     f.write(text)
     f.flush()
@@ -63,8 +196,6 @@ def NormalizeIdentifiers(text: str, suffix: str, cflags: typing.List[str],
                                universal_newlines=True, env=CLGEN_REWRITER_ENV)
     stdout, stderr = process.communicate()
     logging.debug(stderr)
-  # If there was nothing to rewrite, rewriter exits with error code:
-  EUGLY_CODE = 204
   if process.returncode == EUGLY_CODE:
     # Propagate the error:
     raise errors.RewriterException(stderr)
@@ -127,6 +127,93 @@ void A(int a, char** b) {
 """
 
 
+# RewriterServer tests.
+
+# A fake rewriter server which upper-cases each source. Sources containing
+# 'sleep' are never responded to, and sources containing 'crash' crash the
+# server.
+FAKE_SERVER = """
+import sys
+import time
+while True:
+  length = sys.stdin.buffer.readline()
+  if not length:
+    break
+  src = sys.stdin.buffer.read(int(length))
+  if b'sleep' in src:
+    time.sleep(60)
+  if b'crash' in src:
+    sys.exit(1)
+  status = 204 if not src else 0
+  sys.stdout.buffer.write(b'%d %d\\n' % (status, len(src)) + src.upper())
+  sys.stdout.buffer.flush()
+"""
+
+
+@pytest.fixture(scope='function')
+def fake_server() -> normalizer.RewriterServer:
+  """A test fixture which returns a fake rewriter server."""
+  server = normalizer.RewriterServer('.c', [])
+  server.cmd = [sys.executable, '-c', FAKE_SERVER]
+  yield server
+  server.Stop()
+
+
+def test_RewriterServer_command():
+  """Test the clang_rewriter server command."""
+  server = normalizer.RewriterServer('.cl', ['-foo'])
+  assert server.cmd[1:] == ['--server', 'input.cl', '-extra-arg=-foo', '--']
+
+
+def test_RewriterServer_Rewrite_multiple_sources(
+    fake_server: normalizer.RewriterServer):
+  """Test that a single server process rewrites multiple sources."""
+  assert fake_server.Rewrite('abc') == 'ABC'
+  process = fake_server.process
+  assert fake_server.Rewrite('multi\nline') == 'MULTI\nLINE'
+  assert fake_server.process is process
+
+
+def test_RewriterServer_Rewrite_RewriterException(
+    fake_server: normalizer.RewriterServer):
+  """Test that RewriterException is raised if server returns 204."""
+  with pytest.raises(errors.RewriterException):
+    fake_server.Rewrite('')
+  # The server is not restarted.
+  assert fake_server.process.poll() is None
+
+
+def test_RewriterServer_Rewrite_ClangTimeout(
+    fake_server: normalizer.RewriterServer):
+  """Test that a server which times out is restarted."""
+  with pytest.raises(errors.ClangTimeout):
+    fake_server.Rewrite('sleep', timeout_seconds=1)
+  assert not fake_server.process
+  assert fake_server.Rewrite('abc') == 'ABC'
+
+
+def test_RewriterServer_Rewrite_crash(fake_server: normalizer.RewriterServer):
+  """Test that a server which crashes is restarted."""
+  with pytest.raises(errors.RewriterException):
+    fake_server.Rewrite('crash')
+  assert not fake_server.process
+  assert fake_server.Rewrite('abc') == 'ABC'
+
+
+def test_NormalizeIdentifiers_server_small_cl_program():
+  """Test the output of a small OpenCL program using a rewriter server."""
+  FLAGS.clgen_rewriter_server = True
+  try:
+    for _ in range(2):
+      assert normalizer.NormalizeIdentifiers("""
+kernel void foo(global int* bar) {}
+""", '.cl', []) == """
+kernel void A(global int* a) {}
+"""
+  finally:
+    FLAGS.clgen_rewriter_server = False
+
+
 # Benchmarks.
 
 def test_benchmark_NormalizeIdentifiers_c_hello_world(benchmark):
@@ -141,6 +228,23 @@ int main(int argc, char** argv) {
 """, '.c', [])
 
 
+def test_benchmark_NormalizeIdentifiers_server_c_hello_world(benchmark):
+  """Benchmark NormalizeIdentifiers for a "hello world" C program, using a
+  rewriter server."""
+  FLAGS.clgen_rewriter_server = True
+  try:
+    benchmark(normalizer.NormalizeIdentifiers, """
+#include <stdio.h>
+
+int main(int argc, char** argv) {
+  printf("Hello, world!\\n");
+  return 0;
+}
+""", '.c', [])
+  finally:
+    FLAGS.clgen_rewriter_server = False
+
+
 def main(argv):
   """Main entry point."""
   del argv
@@ -99,6 +99,31 @@ kernel void A(global float* a, const int b) {
             code_out)
 
 
+def test_benchmark_opencl_small_program_rewriter_server(benchmark):
+  """Benchmark preprocessing an OpenCL kernel using a full pipeline and a
+  clang_rewriter server."""
+  code_in = """
+__kernel void foo(__global float* a, const int b) {
+  int id = get_global_id(0);
+  if (id <= b)
+    a[id] = 0;
+}
+"""
+  code_out = """\
+kernel void A(global float* a, const int b) {
+  int c = get_global_id(0);
+  if (c <= b)
+    a[c] = 0;
+}\
+"""
+  FLAGS.clgen_rewriter_server = True
+  try:
+    benchmark(_PreprocessBenchmarkInnerLoop, OPENCL_PREPROCESSORS, code_in,
+              code_out)
+  finally:
+    FLAGS.clgen_rewriter_server = False
+
+
 def test_benchmark_opencl_invalid_syntax(benchmark):
   """Benchmark preprocessing an OpenCL program with syntax errors."""
   benchmark(_PreprocessBenchmarkInnerLoopBadCode, OPENCL_PREPROCESSORS,
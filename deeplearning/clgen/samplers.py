@@ -5,6 +5,7 @@ determines the shape of the generated samples.
 """
 import typing
 
+import numpy as np
 from absl import flags
 
 from deeplearning.clgen import errors
@@ -44,9 +45,14 @@ def AssertConfigIsValid(config: sampler_pb2.Sampler) -> sampler_pb2.Sampler:
 class TerminationCriterionBase(object):
   """Base class for TerminationCriterion objects.
 
-  A TerminationCriterion is an object with a single public function
-  SampleIsComplete(), which accepts as its sole argument a sample-in-progress,
-  and returns whether to stop sampling.
+  A TerminationCriterion is an object with a public function SampleIsComplete(),
+  which accepts as its sole argument a sample-in-progress, and returns whether
+  to stop sampling.
+
+  For sampling in batches, a TerminationCriterion also provides InitBatch() and
+  BatchIsComplete(), which maintain per-sample state for a batch of samples,
+  and update it incrementally with the vocabulary indices of each newly
+  sampled token.
   """
 
   def Specialize(self, atomizer: atomizers.AtomizerBase) -> None:
@@ -73,6 +79,41 @@ class TerminationCriterionBase(object):
     """
     raise NotImplementedError('abstract class')
 
+  def InitBatch(self, batch_size: int, encoded_start_text: np.ndarray) -> None:
+    """Begin a new batch of samples.
+
+    Args:
+      batch_size: The number of samples in the batch.
+      encoded_start_text: The vocabulary indices of the text which every sample
+        in the batch begins with.
+    """
+    raise NotImplementedError('abstract class')
+
+  def BatchIsComplete(self, indices: np.ndarray) -> np.ndarray:
+    """Determine which samples in a batch to stop sampling.
+
+    Only called after InitBatch().
+
+    Args:
+      indices: The vocabulary indices of the token sampled for each sample in
+        the batch, with shape (batch_size,).
+
+    Returns:
+      An array of bools with shape (batch_size,), where True indicates that the
+      sample is "complete".
+    """
+    raise NotImplementedError('abstract class')
+
+  def ResetBatchRows(self, rows: np.ndarray) -> None:
+    """Reset samples in a batch to begin new samples from the start text.
+
+    Only called after InitBatch().
+
+    Args:
+      rows: The indices of the samples in the batch to reset.
+    """
+    raise NotImplementedError('abstract class')
+
 
 class MaxlenTerminationCriterion(TerminationCriterionBase):
   """A termination criterion which limits the maximum length of a sample."""
@@ -84,11 +125,28 @@ class MaxlenTerminationCriterion(TerminationCriterionBase):
           'MaxTokenLength.maximum_tokens_in_sample must be > 0')
     except pbutil.ProtoValueError as e:
       raise errors.UserError(e)
+    # Set in InitBatch().
+    self.lengths = None
+    self.start_length = None
 
   def SampleIsComplete(self, sample_in_progress: typing.List[str]) -> bool:
     """Determine whether to stop sampling."""
     return len(sample_in_progress) >= self.max_len
 
+  def InitBatch(self, batch_size: int, encoded_start_text: np.ndarray) -> None:
+    """Begin a new batch of samples."""
+    self.lengths = np.full(batch_size, len(encoded_start_text), dtype=np.int32)
+    self.start_length = len(encoded_start_text)
+
+  def BatchIsComplete(self, indices: np.ndarray) -> np.ndarray:
+    """Determine which samples in a batch to stop sampling."""
+    self.lengths += 1
+    return self.lengths >= self.max_len
+
+  def ResetBatchRows(self, rows: np.ndarray) -> None:
+    """Reset samples in a batch to begin new samples from the start text."""
+    self.lengths[rows] = self.start_length
+
 
 class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
   """A termination criterion which counts symmetrical token depth.
@@ -113,6 +171,14 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
       raise errors.UserError(e)
     if self.left_token == self.right_token:
       raise errors.UserError('SymmetricalTokenDepth tokens must be different')
+    # Set in Specialize().
+    self.left_index = None
+    self.right_index = None
+    # Set in InitBatch().
+    self.left_counts = None
+    self.right_counts = None
+    self.start_left_count = None
+    self.start_right_count = None
 
   def Specialize(self, atomizer: atomizers.AtomizerBase) -> None:
     """Specialize a termination criteria to a vocabulary.
@@ -140,6 +206,8 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
       raise errors.InvalidSymtokTokens(
           'Sampler symmetrical depth tokens cannot be encoded using the '
           'corpus vocabulary')
+    self.left_index = l[0]
+    self.right_index = r[0]
 
   def SampleIsComplete(self, sample_in_progress: typing.List[str]) -> bool:
     """Determine whether to stop sampling."""
@@ -157,6 +225,38 @@ class SymmetricalTokenDepthCriterion(TerminationCriterionBase):
       return False
     return left_token_count - right_token_count == 0
 
+  def InitBatch(self, batch_size: int, encoded_start_text: np.ndarray) -> None:
+    """Begin a new batch of samples."""
+    encoded_start_text = np.asarray(encoded_start_text)
+    self.start_left_count = np.count_nonzero(
+        encoded_start_text == self.left_index)
+    self.start_right_count = np.count_nonzero(
+        encoded_start_text == self.right_index)
+    self.left_counts = np.full(batch_size, self.start_left_count,
+                               dtype=np.int32)
+    self.right_counts = np.full(batch_size, self.start_right_count,
+                                dtype=np.int32)
+
+  def BatchIsComplete(self, indices: np.ndarray) -> np.ndarray:
+    """Determine which samples in a batch to stop sampling.
+
+    This is equivalent to SampleIsComplete(), but keeps a running count of
+    depth tokens for each sample, rather than counting the tokens of the entire
+    sample for every new token.
+    """
+    is_right = indices == self.right_index
+    self.left_counts += indices == self.left_index
+    self.right_counts += is_right
+    # A sample is complete when the last token decreases the depth to zero, or
+    # when it descends into negative depth before the depth has increased.
+    return is_right & ((self.left_counts == 0) |
+                       (self.left_counts == self.right_counts))
+
+  def ResetBatchRows(self, rows: np.ndarray) -> None:
+    """Reset samples in a batch to begin new samples from the start text."""
+    self.left_counts[rows] = self.start_left_count
+    self.right_counts[rows] = self.start_right_count
+
 
 def GetTerminationCriteria(
     config: typing.List[sampler_pb2.SampleTerminationCriterion]) \
@@ -254,6 +354,41 @@ class Sampler(object):
     """
     return any(t.SampleIsComplete(sample_in_progress) for t in self.terminators)
 
+  def InitBatch(self, batch_size: int) -> None:
+    """Begin a new batch of samples. Only called after Specialize().
+
+    Args:
+      batch_size: The number of samples in the batch.
+    """
+    for terminator in self.terminators:
+      terminator.InitBatch(batch_size, self.encoded_start_text)
+
+  def BatchIsComplete(self, indices: np.ndarray) -> np.ndarray:
+    """Determine which samples in a batch to stop sampling.
+
+    Args:
+      indices: The vocabulary indices of the token sampled for each sample in
+        the batch, with shape (batch_size,).
+
+    Returns:
+      An array of bools with shape (batch_size,), where True indicates that the
+      sample is "complete".
+    """
+    complete = np.zeros(len(indices), dtype=bool)
+    # Every terminator must see every token, so don't short circuit.
+    for terminator in self.terminators:
+      complete |= terminator.BatchIsComplete(indices)
+    return complete
+
+  def ResetBatchRows(self, rows: np.ndarray) -> None:
+    """Reset samples in a batch to begin new samples from the start text.
+
+    Args:
+      rows: The indices of the samples in the batch to reset.
+    """
+    for terminator in self.terminators:
+      terminator.ResetBatchRows(rows)
+
   @staticmethod
   def _ComputeHash(config: sampler_pb2.Sampler) -> str:
     """Compute sampler hash.
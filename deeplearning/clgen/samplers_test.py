@@ -107,6 +107,16 @@ def test_MaxlenTerminationCriterion_SampleIsComplete():
   assert t.SampleIsComplete(['a', 'b', 'c', 'd', 'e'])
 
 
+def test_MaxlenTerminationCriterion_BatchIsComplete():
+  """Test BatchIsComplete() returns expected values."""
+  t = samplers.MaxlenTerminationCriterion(sampler_pb2.MaxTokenLength(
+      maximum_tokens_in_sample=3))
+  t.InitBatch(2, np.array([0]))
+  assert not t.BatchIsComplete(np.array([0, 1])).any()
+  assert t.BatchIsComplete(np.array([0, 1])).all()
+  assert t.BatchIsComplete(np.array([0, 1])).all()
+
+
 # SymmetricalTokenDepthCriterion tests.
 
 def test_SymmetricalTokenDepthCriterion_depth_increase_token():
@@ -181,6 +191,54 @@ def test_SymmetrcalTokenDepthCriterion_SampleIsComplete_reverse_order():
 
 # Sampler tests.
 
+def test_SymmetricalTokenDepthCriterion_BatchIsComplete():
+  """Test BatchIsComplete() is equivalent to SampleIsComplete()."""
+  t = samplers.SymmetricalTokenDepthCriterion(sampler_pb2.SymmetricalTokenDepth(
+      depth_increase_token='+', depth_decrease_token='-'))
+  t.left_index, t.right_index = 1, 2
+  decoder = {0: 'a', 1: '+', 2: '-'}
+  start_text = [0, 1]
+  samples = np.random.RandomState(0).randint(0, 3, (100, 20))
+  t.InitBatch(len(samples), np.array(start_text))
+  for i in range(samples.shape[1]):
+    expected = [
+      t.SampleIsComplete([decoder[x] for x in start_text + list(s[:i + 1])])
+      for s in samples]
+    assert t.BatchIsComplete(samples[:, i]).tolist() == expected
+
+
+def test_Sampler_BatchIsComplete(abc_sampler_config: sampler_pb2.Sampler):
+  """Test that a sample is complete if any termination criterion is met."""
+  abc_sampler_config.ClearField('termination_criteria')
+  abc_sampler_config.termination_criteria.add().maxlen.CopyFrom(
+      sampler_pb2.MaxTokenLength(maximum_tokens_in_sample=3))
+  abc_sampler_config.termination_criteria.add().symtok.CopyFrom(
+      sampler_pb2.SymmetricalTokenDepth(depth_increase_token='+',
+                                        depth_decrease_token='-'))
+  s = samplers.Sampler(abc_sampler_config)
+  s.Specialize(AtomizerMock())
+  s.terminators[1].left_index, s.terminators[1].right_index = 2, 3
+  s.InitBatch(3)
+  np.testing.assert_array_equal(
+      [False, False, True], s.BatchIsComplete(np.array([0, 2, 3])))
+  np.testing.assert_array_equal(
+      [True, True, True], s.BatchIsComplete(np.array([0, 0, 0])))
+
+
+def test_Sampler_ResetBatchRows(abc_sampler_config: sampler_pb2.Sampler):
+  """Test that reset samples begin again from the start text."""
+  abc_sampler_config.termination_criteria[0].maxlen.maximum_tokens_in_sample = 3
+  s = samplers.Sampler(abc_sampler_config)
+  s.Specialize(AtomizerMock())
+  s.InitBatch(2)
+  assert not s.BatchIsComplete(np.array([0, 0])).any()
+  s.ResetBatchRows(np.array([1]))
+  np.testing.assert_array_equal(
+      [True, False], s.BatchIsComplete(np.array([0, 0])))
+  np.testing.assert_array_equal(
+      [True, True], s.BatchIsComplete(np.array([0, 0])))
+
+
 def test_Sampler_config_type_error():
   """Test that a TypeError is raised if config is not a Sampler proto."""
   with pytest.raises(TypeError) as e_info:
@@ -0,0 +1,54 @@
+"""A command-line interface for differential testing the results in a datastore.
+
+Outcomes are stored in the datastore as they are computed, so an interrupted
+run can be resumed by running the same command again. To parallelize, run
+multiple instances over disjoint ranges of testcase IDs, using
+--start_testcase_id and --end_testcase_id.
+"""
+from absl import app
+from absl import flags
+from absl import logging
+
+from deeplearning.deepsmith import datastore
+from deeplearning.deepsmith.difftests import difftests
+from deeplearning.deepsmith.difftests import opencl
+from deeplearning.deepsmith.difftests import runner
+
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('datastore', None, 'Path to a DataStore config proto.')
+flags.DEFINE_integer('gold_standard_testbed_id', None,
+                     'The ID of the gold standard testbed.')
+flags.DEFINE_string('difftest_output_name', 'stdout',
+                    'The name of the result output to compare.')
+flags.DEFINE_integer('start_testcase_id', 0,
+                     'The first testcase ID to difftest.')
+flags.DEFINE_integer('end_testcase_id', None,
+                     'The testcase ID to stop at, exclusive. If not set, all '
+                     'testcases from --start_testcase_id are difftested.')
+flags.DEFINE_integer('difftest_batch_size', 100,
+                     'The number of testcases to difftest in each transaction.')
+flags.DEFINE_bool('opencl_filters', False,
+                  'Discard difftests using the CLgen OpenCL filters.')
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Unrecognized arguments')
+  if FLAGS.gold_standard_testbed_id is None:
+    raise app.UsageError('Flag --gold_standard_testbed_id must be set')
+
+  ds = datastore.DataStore.FromFlags()
+  difftester = runner.DataStoreDiffTester(
+      ds, FLAGS.gold_standard_testbed_id,
+      difftests.NamedOutputIsEqual(FLAGS.difftest_output_name),
+      filters=opencl.ClgenOpenClFilters() if FLAGS.opencl_filters else None,
+      batch_size=FLAGS.difftest_batch_size)
+  num_difftests = difftester.Run(FLAGS.start_testcase_id,
+                                 FLAGS.end_testcase_id)
+  logging.info('Difftested %d testcases', num_difftests)
+
+
+if __name__ == '__main__':
+  app.run(main)
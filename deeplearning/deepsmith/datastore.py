@@ -2,12 +2,14 @@
 """
 import contextlib
 import pathlib
+import time
 
 from absl import flags
 from absl import logging
 from sqlalchemy import orm
 
 import deeplearning.deepsmith.client
+import deeplearning.deepsmith.difftest
 import deeplearning.deepsmith.generator
 import deeplearning.deepsmith.harness
 import deeplearning.deepsmith.result
@@ -18,7 +20,6 @@ import deeplearning.deepsmith.toolchain
 import phd.lib.labm8.sqlutil
 from deeplearning.deepsmith import db
 from deeplearning.deepsmith.proto import datastore_pb2
-from deeplearning.deepsmith.proto import deepsmith_pb2
 from phd.lib.labm8 import pbutil
 
 
@@ -39,6 +40,7 @@ class DataStore(object):
     db.Table.metadata.create_all(self._engine)
     db.Table.metadata.bind = self._engine
     self._make_session = orm.sessionmaker(bind=self._engine)
+    self._pool_metrics = db.GetPoolMetrics(self._engine)
 
   @classmethod
   def FromFile(cls, path: pathlib.Path) -> 'DataStore':
@@ -84,6 +86,11 @@ class DataStore(object):
     logging.info('Read datastore proto %s', FLAGS.datastore)
     return ds
 
+  @property
+  def pool_metrics(self) -> db.PoolMetrics:
+    """The connection pool usage statistics of the datastore."""
+    return self._pool_metrics
+
   @contextlib.contextmanager
   def Session(self, commit: bool = False) -> db.session_t:
     """Provide a transactional scope around a session.
@@ -96,6 +103,11 @@ class DataStore(object):
     """
     session = self._make_session()
     try:
+      # Acquire the session's connection up front to measure the time spent
+      # waiting for the connection pool.
+      start_time = time.time()
+      session.connection()
+      self._pool_metrics.RecordCheckoutWait(time.time() - start_time)
       yield session
       if commit:
         session.commit()
@@ -111,14 +123,17 @@ class DataStore(object):
     """
     del response
     with self.Session(commit=True) as session:
-      for testcase in request.testcases:
-        self._AddOneTestcase(session, testcase)
+      deeplearning.deepsmith.testcase.Testcase.GetOrAddMany(
+          session, request.testcases)
 
-  def _AddOneTestcase(self, session: db.session_t,
-                      proto: deepsmith_pb2.Testcase) -> None:
-    """Record a single Testcase in the database.
+  def SubmitResults(self, request: datastore_pb2.SubmitResultsRequest,
+                    response: datastore_pb2.SubmitResultsResponse) -> None:
+    """Add a sequence of results to the datastore.
     """
-    deeplearning.deepsmith.testcase.Testcase.GetOrAdd(session, proto)
+    del response
+    with self.Session(commit=True) as session:
+      deeplearning.deepsmith.result.Result.GetOrAddMany(
+          session, request.results)
 
   def _BuildTestcaseRequestQuery(self, session, request) -> db.query_t:
     def _FilterToolchainGeneratorHarness(q):
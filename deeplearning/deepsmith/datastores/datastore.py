@@ -56,7 +56,10 @@ def main(argv):
     raise app.UsageError('Unrecognized arguments')
   datastore_config = services.ServiceConfigFromFlag(
       'datastore_config', datastore_pb2.DataStore())
-  server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+  # Serve as many concurrent requests as there are database connections.
+  server = grpc.server(futures.ThreadPoolExecutor(
+      max_workers=datastore_config.pool.size +
+                  datastore_config.pool.max_overflow))
   services.AssertLocalServiceHostname(datastore_config.service)
   service = DataStore(datastore_config)
   datastore_pb2_grpc.add_DataStoreServiceServicer_to_server(service, server)
@@ -1,13 +1,20 @@
 """Database backend.
 """
+import collections
 import datetime
+import hashlib
 import pathlib
+import threading
+import typing
+import weakref
+
 import sqlalchemy as sql
 from absl import flags
 from absl import logging
 from phd.lib.labm8 import labdate
 from phd.lib.labm8 import pbutil
 from phd.lib.labm8.sqlutil import GetOrAdd
+from sqlalchemy import orm
 from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -27,6 +34,13 @@ query_t = sql.orm.query.Query
 # The SQLAlchemy base table.
 Base = declarative_base()
 
+# The maximum number of values bound to a single IN (...) clause by the bulk
+# lookup functions. SQLite limits the number of parameters in a statement.
+BULK_LOOKUP_CHUNK_SIZE = 500
+
+# The maximum number of entries in the intern cache of each engine.
+INTERN_CACHE_SIZE = 10000
+
 
 class InvalidDatabaseConfig(ValueError):
   """Raise if the datastore config contains invalid values."""
@@ -208,7 +222,44 @@ class StringTable(Table):
     if len(string) > cls.maxlen:
       raise StringTooLongError(cls, string, cls.maxlen)
 
-    return GetOrAdd(session, cls, string=string)
+    instance = GetInterned(session, cls, 'string', string)
+    if instance is None:
+      instance = GetOrAdd(session, cls, string=string)
+      InternId(session, cls, string, instance.id)
+    return instance
+
+  @classmethod
+  def GetOrAddMany(cls, session: session_t,
+                   strings: typing.Iterable[str]) -> typing.Dict[str, int]:
+    """Resolve the IDs of many strings, adding those which do not exist.
+
+    This is the bulk equivalent of StringTable.GetOrAdd(). Instead of a query
+    per string, the strings are resolved with a single IN (...) lookup, and
+    the missing strings are added with a single multi-row insert.
+
+    Args:
+      session: A database session.
+      strings: The strings.
+
+    Returns:
+      A map from string to ID.
+
+    Raises:
+      StringTooLongError: If any of the strings are too long.
+    """
+    ids, rows = {}, []
+    for string in strings:
+      if len(string) > cls.maxlen:
+        raise StringTooLongError(cls, string, cls.maxlen)
+      id_ = GetInternedId(session, cls, string)
+      if id_ is None:
+        rows.append({'string': string})
+      else:
+        ids[string] = id_
+    for key, id_ in BulkGetOrAdd(session, cls, ['string'], rows).items():
+      InternId(session, cls, key[0], id_)
+      ids[key[0]] = id_
+    return ids
 
   def TruncatedString(self, n=80):
     """Return the truncated first 'n' characters of the string.
@@ -230,9 +281,472 @@ class StringTable(Table):
     return self.TruncatedString(n=52)
 
 
+def GetKeyValueSetId(pairs: typing.Mapping[str, str]) -> bytes:
+  """Compute the ID of a set of <name, value> pairs.
+
+  This is the MD5 of the concatenated names and values, in name order.
+
+  Args:
+    pairs: A map of names to values.
+
+  Returns:
+    A 16 byte digest.
+  """
+  md5 = hashlib.md5()
+  for name in sorted(pairs):
+    md5.update((name + pairs[name]).encode('utf-8'))
+  return md5.digest()
+
+
+def BulkGet(session: session_t, table, key_columns: typing.List[str],
+            keys: typing.Iterable[typing.Tuple]) -> typing.Dict[
+  typing.Tuple, typing.Any]:
+  """Look up the IDs of many table rows.
+
+  Rows are selected using an IN (...) clause on the first key column, so this
+  should be the most selective of the key columns. The remaining key columns
+  are matched once the rows have been fetched.
+
+  Args:
+    session: A database session.
+    table: The table class.
+    key_columns: The names of the columns which uniquely identify a row.
+    keys: The tuples of key column values to look up.
+
+  Returns:
+    A map from key tuple to the value of the row's "id" column. Keys which do
+    not exist in the table are omitted.
+  """
+  keys = set(keys)
+  columns = table.__table__.c
+  query_columns = [columns[name] for name in key_columns]
+  # Set tables use the "id" column as part of their key.
+  if 'id' in key_columns:
+    id_index = key_columns.index('id')
+  else:
+    id_index = len(key_columns)
+    query_columns.append(columns.id)
+  first_values = list({key[0] for key in keys})
+  ids = {}
+  for i in range(0, len(first_values), BULK_LOOKUP_CHUNK_SIZE):
+    chunk = first_values[i:i + BULK_LOOKUP_CHUNK_SIZE]
+    query = sql.select(query_columns).where(
+        columns[key_columns[0]].in_(chunk))
+    for row in session.execute(query):
+      key = tuple(row[:len(key_columns)])
+      if key in keys:
+        ids[key] = row[id_index]
+  return ids
+
+
+def BulkAdd(session: session_t, table,
+            rows: typing.List[typing.Dict[str, typing.Any]]) -> None:
+  """Insert many rows into a table.
+
+  The rows are inserted using a single executemany() statement, which DBAPI
+  drivers such as mysqlclient rewrite into multi-row INSERTs. Unlike
+  session.add(), this bypasses the ORM, so the inserted rows are not visible
+  through relationships of objects already loaded in the session.
+
+  Args:
+    session: A database session.
+    table: The table class.
+    rows: A list of column name to value dicts.
+  """
+  if rows:
+    session.execute(table.__table__.insert(), rows)
+
+
+def BulkGetOrAdd(session: session_t, table, key_columns: typing.List[str],
+                 rows: typing.Iterable[typing.Dict[str, typing.Any]]) -> \
+    typing.Dict[typing.Tuple, typing.Any]:
+  """Look up the IDs of many table rows, adding those which do not exist.
+
+  This is the bulk equivalent of sqlutil.GetOrAdd(), for tables in which the
+  key columns are unique. Rows with duplicate keys are added only once, using
+  the first of the duplicates.
+
+  Args:
+    session: A database session.
+    table: The table class.
+    key_columns: The names of the columns which uniquely identify a row. See
+      BulkGet() for the order of key columns.
+    rows: A list of column name to value dicts.
+
+  Returns:
+    A map from key tuple to the value of the row's "id" column.
+  """
+  rows_by_key = {}
+  for row in rows:
+    rows_by_key.setdefault(tuple(row[name] for name in key_columns), row)
+  ids = BulkGet(session, table, key_columns, rows_by_key.keys())
+  missing = [key for key in rows_by_key if key not in ids]
+  if missing:
+    BulkAdd(session, table, [rows_by_key[key] for key in missing])
+    ids.update(BulkGet(session, table, key_columns, missing))
+  return ids
+
+
+class InternCache(object):
+  """A size-bounded map from <table, key> to row ID.
+
+  Rows which are looked up by a unique key, such as the strings of a
+  StringTable, are immutable once added. Caching the IDs of these rows
+  removes the lookup query the next time that the same key is requested. When
+  the cache is full, the least recently used entries are evicted. The cache
+  is shared by the sessions of an engine, and is thread safe.
+  """
+
+  def __init__(self, max_size: int = INTERN_CACHE_SIZE):
+    self.max_size = max_size
+    self._ids = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def Get(self, table, key: typing.Any) -> typing.Optional[int]:
+    """Look up the ID of a row.
+
+    Args:
+      table: The table class.
+      key: The unique key of the row.
+
+    Returns:
+      The row ID, or None if not cached.
+    """
+    with self._lock:
+      id_ = self._ids.get((table, key))
+      if id_ is not None:
+        self._ids.move_to_end((table, key))
+      return id_
+
+  def Put(self, table, key: typing.Any, id_: int) -> None:
+    """Record the ID of a row.
+
+    Args:
+      table: The table class.
+      key: The unique key of the row.
+      id_: The row ID.
+    """
+    with self._lock:
+      self._ids[(table, key)] = id_
+      self._ids.move_to_end((table, key))
+      while len(self._ids) > self.max_size:
+        self._ids.popitem(last=False)
+
+  def Clear(self) -> None:
+    """Remove all entries from the cache."""
+    with self._lock:
+      self._ids.clear()
+
+  def __len__(self):
+    return len(self._ids)
+
+
+# The intern caches of each engine. An ID is only valid for the database that
+# it was read from.
+_INTERN_CACHES = weakref.WeakKeyDictionary()
+
+# The session.info key of the IDs interned during the current transaction.
+_PENDING_INTERNED_IDS = 'pending_interned_ids'
+
+
+def GetInternCache(session: session_t) -> InternCache:
+  """Get the intern cache of the engine that a session is bound to.
+
+  Args:
+    session: A database session.
+
+  Returns:
+    An InternCache instance.
+  """
+  engine = session.get_bind()
+  cache = _INTERN_CACHES.get(engine)
+  if cache is None:
+    cache = InternCache()
+    _INTERN_CACHES[engine] = cache
+  return cache
+
+
+def GetInternedId(session: session_t, table,
+                  key: typing.Any) -> typing.Optional[int]:
+  """Look up the interned ID of a row.
+
+  Args:
+    session: A database session.
+    table: The table class.
+    key: The unique key of the row.
+
+  Returns:
+    The row ID, or None if the row has not been interned.
+  """
+  pending = session.info.get(_PENDING_INTERNED_IDS)
+  if pending and (table, key) in pending:
+    return pending[(table, key)]
+  return GetInternCache(session).Get(table, key)
+
+
+def GetInterned(session: session_t, table, key_column: str,
+                key: typing.Any) -> typing.Optional[Table]:
+  """Get an instance of an interned row without querying the database.
+
+  Args:
+    session: A database session.
+    table: The table class.
+    key_column: The name of the unique column which the key is a value of.
+    key: The unique key of the row.
+
+  Returns:
+    A persistent instance of the table, or None if the row has not been
+    interned.
+  """
+  id_ = GetInternedId(session, table, key)
+  if id_ is None:
+    return None
+  instance = session.identity_map.get(orm.util.identity_key(table, id_))
+  if instance is None:
+    # Attach an instance with the known ID and key. The remaining columns are
+    # loaded from the database if accessed.
+    instance = table(id=id_, **{key_column: key})
+    orm.make_transient_to_detached(instance)
+    session.add(instance)
+  return instance
+
+
+def InternId(session: session_t, table, key: typing.Any,
+             id_: typing.Optional[int]) -> None:
+  """Intern the ID of a row.
+
+  The ID is visible to the session immediately, and to other sessions of the
+  same engine once the session's outermost transaction is committed. If any
+  transaction of the session is rolled back, the ID is discarded.
+
+  Args:
+    session: A database session.
+    table: The table class.
+    key: The unique key of the row.
+    id_: The row ID. If None, as is the case for rows which have not been
+      flushed, nothing is interned.
+  """
+  if id_ is not None:
+    session.info.setdefault(_PENDING_INTERNED_IDS, {})[(table, key)] = id_
+
+
+@sql.event.listens_for(orm.Session, 'after_commit')
+def _CommitInternedIds(session: session_t) -> None:
+  # after_commit is also fired when a SAVEPOINT is released. The enclosing
+  # transaction may still be rolled back, so the IDs remain pending.
+  if session.transaction.nested:
+    return
+  pending = session.info.pop(_PENDING_INTERNED_IDS, None)
+  if pending:
+    cache = GetInternCache(session)
+    for (table, key), id_ in pending.items():
+      cache.Put(table, key, id_)
+
+
+@sql.event.listens_for(orm.Session, 'after_soft_rollback')
+def _DiscardInternedIds(session: session_t, previous_transaction) -> None:
+  del previous_transaction
+  session.info.pop(_PENDING_INTERNED_IDS, None)
+
+
+# Legal values of the SQLite journal_mode and synchronous pragmas.
+SQLITE_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL',
+                        'OFF'}
+SQLITE_SYNCHRONOUS_MODES = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+class PoolMetrics(object):
+  """Connection pool usage statistics of an engine.
+
+  Attributes:
+    num_connects: The number of database connections opened.
+    num_checkouts: The number of times a connection was checked out of the
+      pool.
+    num_checked_out: The number of connections currently checked out.
+    total_checkout_wait_seconds: The total time spent acquiring connections,
+      as recorded by RecordCheckoutWait().
+    max_checkout_wait_seconds: The longest time spent acquiring a connection.
+  """
+
+  def __init__(self):
+    self.num_connects = 0
+    self.num_checkouts = 0
+    self.num_checked_out = 0
+    self.total_checkout_wait_seconds = 0.0
+    self.max_checkout_wait_seconds = 0.0
+    self._lock = threading.Lock()
+
+  def RecordCheckoutWait(self, seconds: float) -> None:
+    """Record the time taken to acquire a connection.
+
+    Args:
+      seconds: The elapsed time.
+    """
+    with self._lock:
+      self.total_checkout_wait_seconds += seconds
+      self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds,
+                                           seconds)
+
+  def Listen(self, engine: sql.engine.Engine) -> None:
+    """Count the connection pool events of an engine.
+
+    Args:
+      engine: The engine to listen to.
+    """
+    sql.event.listen(engine, 'connect', self._OnConnect)
+    sql.event.listen(engine, 'checkout', self._OnCheckout)
+    sql.event.listen(engine, 'checkin', self._OnCheckin)
+
+  def _OnConnect(self, dbapi_connection, connection_record) -> None:
+    del dbapi_connection, connection_record
+    with self._lock:
+      self.num_connects += 1
+
+  def _OnCheckout(self, dbapi_connection, connection_record,
+                  connection_proxy) -> None:
+    del dbapi_connection, connection_record, connection_proxy
+    with self._lock:
+      self.num_checkouts += 1
+      self.num_checked_out += 1
+
+  def _OnCheckin(self, dbapi_connection, connection_record) -> None:
+    del dbapi_connection, connection_record
+    with self._lock:
+      self.num_checked_out -= 1
+
+  def __repr__(self):
+    return (f'{self.num_connects} connects, {self.num_checkouts} checkouts, '
+            f'{self.num_checked_out} checked out, '
+            f'{self.total_checkout_wait_seconds:.3f}s total wait, '
+            f'{self.max_checkout_wait_seconds:.3f}s max wait')
+
+
+# The connection pool metrics of each engine.
+_POOL_METRICS = weakref.WeakKeyDictionary()
+
+
+def GetPoolMetrics(engine: sql.engine.Engine) -> PoolMetrics:
+  """Get the connection pool metrics of an engine.
+
+  Args:
+    engine: An engine created by MakeEngine().
+
+  Returns:
+    The engine's PoolMetrics.
+  """
+  metrics = _POOL_METRICS.get(engine)
+  if metrics is None:
+    metrics = PoolMetrics()
+    metrics.Listen(engine)
+    _POOL_METRICS[engine] = metrics
+  return metrics
+
+
+def _SetSqlitePragmas(engine: sql.engine.Engine,
+                      config: datastore_pb2.DataStore.Sqlite) -> None:
+  """Set the configured pragmas on every new SQLite connection.
+
+  Raises:
+    InvalidDatabaseConfig: If a pragma has an illegal value.
+  """
+  pragmas = []
+  if config.HasField('journal_mode'):
+    if config.journal_mode.upper() not in SQLITE_JOURNAL_MODES:
+      raise InvalidDatabaseConfig(
+          f"Invalid SQLite journal_mode '{config.journal_mode}'")
+    pragmas.append(f'PRAGMA journal_mode={config.journal_mode.upper()}')
+  if config.HasField('synchronous'):
+    if config.synchronous.upper() not in SQLITE_SYNCHRONOUS_MODES:
+      raise InvalidDatabaseConfig(
+          f"Invalid SQLite synchronous '{config.synchronous}'")
+    pragmas.append(f'PRAGMA synchronous={config.synchronous.upper()}')
+  if not pragmas:
+    return
+
+  @sql.event.listens_for(engine, 'connect')
+  def _OnConnect(dbapi_connection, connection_record):
+    del connection_record
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+      cursor.execute(pragma)
+    cursor.close()
+
+
+def _GetPoolArgs(config: datastore_pb2.DataStore,
+                 sized: bool) -> typing.Dict[str, typing.Any]:
+  """Get the create_engine() connection pool arguments of a config.
+
+  Args:
+    config: The datastore config.
+    sized: Whether the backend uses a sized pool. The SQLite backend does not.
+
+  Returns:
+    A map of keyword arguments.
+  """
+  args = {
+    'pool_recycle': config.pool.recycle_seconds,
+    'pool_pre_ping': config.pool.pre_ping,
+  }
+  if sized:
+    args['pool_size'] = config.pool.size
+    args['max_overflow'] = config.pool.max_overflow
+    args['pool_timeout'] = config.pool.timeout_seconds
+  return args
+
+
+def _CreateMySqlDatabase(url_base: str, database: str, create: bool) -> None:
+  """Create a MySQL database if it does not exist.
+
+  Raises:
+    DatabaseDoesNotExist: If the database does not exist and create not set.
+  """
+  engine = sql.create_engine(url_base, poolclass=sql.pool.NullPool)
+  query = engine.execute(
+      sql.text('SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE '
+               'SCHEMA_NAME = :database'), database=database)
+  if not query.first():
+    if create:
+      # We can't use sql.text() escaping here becuase it uses singlequotes
+      # for escaping. MySQL only accepts backticks for quoting database
+      # names.
+      engine.execute(f'CREATE DATABASE `{database}`')
+    else:
+      raise DatabaseDoesNotExist()
+  engine.dispose()
+
+
+def _CreatePostgreSqlDatabase(url_base: str, database: str,
+                              create: bool) -> None:
+  """Create a PostgreSQL database if it does not exist.
+
+  Raises:
+    DatabaseDoesNotExist: If the database does not exist and create not set.
+  """
+  engine = sql.create_engine(f'{url_base}/postgres',
+                             poolclass=sql.pool.NullPool)
+  conn = engine.connect()
+  query = conn.execute(
+      sql.text('SELECT 1 FROM pg_database WHERE datname = :database'),
+      database=database)
+  if not query.first():
+    if create:
+      # PostgreSQL does not let you create databases within a transaction, so
+      # manually complete the transaction before creating the database.
+      conn.execute(sql.text('COMMIT'))
+      # PostgreSQL does not allow single quoting of database names.
+      conn.execute(f'CREATE DATABASE {database}')
+    else:
+      raise DatabaseDoesNotExist()
+  conn.close()
+  engine.dispose()
+
+
 def MakeEngine(config: datastore_pb2.DataStore) -> sql.engine.Engine:
   """Instantiate a database engine.
 
+  The engine's connection pool is configured by config.pool, and its usage is
+  reported by GetPoolMetrics().
+
   Raises:
     InvalidDatabaseConfig: If the config contains illegal or missing values.
     DatabaseDoesNotExist: If the database does not exist and
@@ -243,6 +757,9 @@ def MakeEngine(config: datastore_pb2.DataStore) -> sql.engine.Engine:
   if config.testonly:
     config.create_database_if_not_exist = True
 
+  # A callback which creates the database, called if the database cannot be
+  # connected to.
+  create_database = None
   if config.HasField('sqlite'):
     if config.sqlite.inmemory:
       url = 'sqlite://'
@@ -255,6 +772,7 @@ def MakeEngine(config: datastore_pb2.DataStore) -> sql.engine.Engine:
       abspath = path.absolute()
       url = f'sqlite:///{abspath}'
     public_url = url
+    pool_args = _GetPoolArgs(config, sized=False)
   elif config.HasField('mysql'):
     username = pbutil.RaiseIfNotSet(config.mysql, 'username',
                                     InvalidDatabaseConfig)
@@ -268,23 +786,13 @@ def MakeEngine(config: datastore_pb2.DataStore) -> sql.engine.Engine:
     url_base = f'mysql://{username}:{password}@{hostname}:{port}'
     if '`' in database:
       raise InvalidDatabaseConfig('MySQL database cannot have backtick in name')
-    engine = sql.create_engine(url_base)
-    query = engine.execute(
-        sql.text('SELECT SCHEMA_NAME FROM INFORMATION_SCHEMA.SCHEMATA WHERE '
-                 'SCHEMA_NAME = :database'), database=database)
-    if not query.first():
-      if config.create_database_if_not_exist:
-        # We can't use sql.text() escaping here becuase it uses singlequotes
-        # for escaping. MySQL only accepts backticks for quoting database
-        # names.
-        engine.execute(f'CREATE DATABASE `{database}`')
-      else:
-        raise DatabaseDoesNotExist()
-    engine.dispose()
+    create_database = lambda: _CreateMySqlDatabase(
+        url_base, database, config.create_database_if_not_exist)
     # Use UTF-8 encoding (default is latin-1) when connecting to MySQL.
     # See: https://stackoverflow.com/a/16404147/1318051
     public_url = f'mysql://{username}@{hostname}:{port}/{database}?charset=utf8'
     url = f'{url_base}/{database}?charset=utf8'
+    pool_args = _GetPoolArgs(config, sized=True)
   elif config.HasField('postgresql'):
     username = pbutil.RaiseIfNotSet(config.postgresql, 'username',
                                     InvalidDatabaseConfig)
@@ -300,30 +808,30 @@ def MakeEngine(config: datastore_pb2.DataStore) -> sql.engine.Engine:
       raise InvalidDatabaseConfig(
           'PostgreSQL database name cannot contain single quotes')
     url_base = f'postgresql+psycopg2://{username}:{password}@{hostname}:{port}'
-
-    engine = sql.create_engine(f'{url_base}/postgres')
-    conn = engine.connect()
-    query = conn.execute(
-        sql.text('SELECT 1 FROM pg_database WHERE datname = :database'),
-        database=database)
-    if not query.first():
-      if config.create_database_if_not_exist:
-        # PostgreSQL does not let you create databases within a transaction, so
-        # manually complete the transaction before creating the database.
-        conn.execute(sql.text('COMMIT'))
-        # PostgreSQL does not allow single quoting of database names.
-        conn.execute(f'CREATE DATABASE {database}')
-      else:
-        raise DatabaseDoesNotExist()
-    conn.close()
-    engine.dispose()
+    create_database = lambda: _CreatePostgreSqlDatabase(
+        url_base, database, config.create_database_if_not_exist)
     public_url = f'postgresql://{username}@{hostname}:{port}/{database}'
     url = f'{url_base}/{database}'
+    pool_args = _GetPoolArgs(config, sized=True)
   else:
     raise NotImplementedError(f'unsupported database engine')
 
   logging.info("Database engine: '%s'", public_url)
-  return sql.create_engine(url, encoding='utf-8', echo=FLAGS.sql_echo)
+  engine = sql.create_engine(url, encoding='utf-8', echo=FLAGS.sql_echo,
+                             **pool_args)
+  if config.HasField('sqlite'):
+    _SetSqlitePragmas(engine, config.sqlite)
+  GetPoolMetrics(engine)
+
+  # Check that the database exists by connecting to it, which leaves an open
+  # connection in the pool. Only if that fails do we look for the database
+  # using a separate, unpooled, connection to the server.
+  if create_database:
+    try:
+      engine.connect().close()
+    except sql.exc.OperationalError:
+      create_database()
+  return engine
 
 
 def DestroyTestonlyEngine(config: datastore_pb2.DataStore):
@@ -1,11 +1,16 @@
 """Unit tests for :db."""
+import pathlib
 import sys
+import tempfile
+import threading
 
 import pytest
+import sqlalchemy as sql
 from absl import app
 
 from deeplearning.deepsmith import db
 from deeplearning.deepsmith import toolchain
+from deeplearning.deepsmith.proto import datastore_pb2
 
 
 def HasFieldMock(self, name):
@@ -92,6 +97,106 @@ def test_StringTable_TruncatedString_uninitialized():
   assert len(t.TruncatedString()) == 0
 
 
+def test_InternCache_Get_missing():
+  cache = db.InternCache()
+  assert cache.Get(toolchain.Toolchain, 'cpp') is None
+
+
+def test_InternCache_Put_evicts_least_recently_used():
+  cache = db.InternCache(max_size=2)
+  cache.Put(toolchain.Toolchain, 'a', 1)
+  cache.Put(toolchain.Toolchain, 'b', 2)
+  assert cache.Get(toolchain.Toolchain, 'a') == 1
+  cache.Put(toolchain.Toolchain, 'c', 3)
+  assert len(cache) == 2
+  assert cache.Get(toolchain.Toolchain, 'a') == 1
+  assert cache.Get(toolchain.Toolchain, 'b') is None
+  assert cache.Get(toolchain.Toolchain, 'c') == 3
+
+
+def test_StringTable_GetOrAdd_interned_after_commit(ds):
+  with ds.Session(commit=True) as session:
+    t1 = toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    session.flush()
+    t1_id = t1.id
+    # The new row was not flushed when first added, so it is interned when
+    # it is next requested.
+    assert toolchain.Toolchain.GetOrAdd(session, 'cpp').id == t1_id
+
+  with ds.Session() as session:
+    assert db.GetInternCache(session).Get(toolchain.Toolchain, 'cpp') == t1_id
+    queries = []
+    sql.event.listen(session.get_bind(), 'before_cursor_execute',
+                     lambda *args: queries.append(args))
+    t2 = toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    assert t2.id == t1_id
+    assert not queries
+    # Uncached columns are loaded on demand.
+    assert t2.date_added
+
+
+def test_StringTable_GetOrAdd_rollback_discards_interned(ds):
+  with ds.Session() as session:
+    toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    session.flush()
+    toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    assert db.GetInternedId(session, toolchain.Toolchain, 'cpp')
+    session.rollback()
+    assert db.GetInternedId(session, toolchain.Toolchain, 'cpp') is None
+
+  with ds.Session() as session:
+    assert db.GetInternCache(session).Get(toolchain.Toolchain, 'cpp') is None
+    assert not session.query(toolchain.Toolchain).count()
+
+
+def test_StringTable_GetOrAdd_nested_commit_not_interned(ds):
+  """Test that IDs interned in a savepoint wait for the outer commit."""
+  with ds.Session() as session:
+    session.begin_nested()
+    toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    session.flush()
+    toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    session.commit()
+    assert db.GetInternedId(session, toolchain.Toolchain, 'cpp')
+    assert db.GetInternCache(session).Get(toolchain.Toolchain, 'cpp') is None
+    session.rollback()
+    assert db.GetInternedId(session, toolchain.Toolchain, 'cpp') is None
+
+  with ds.Session() as session:
+    assert db.GetInternCache(session).Get(toolchain.Toolchain, 'cpp') is None
+
+
+def test_InternCache_concurrent_Get_and_Put():
+  """Test that the cache can be used from multiple threads."""
+  cache = db.InternCache(max_size=10)
+  errors = []
+
+  def _Worker(i: int):
+    try:
+      for j in range(2000):
+        cache.Put(toolchain.Toolchain, (i + j) % 20, j)
+        cache.Get(toolchain.Toolchain, (i + j + 1) % 20)
+    except Exception as e:
+      errors.append(e)
+
+  threads = [threading.Thread(target=_Worker, args=(i,)) for i in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert not errors
+  assert len(cache) == 10
+
+
+def test_StringTable_GetOrAddMany(session):
+  t1 = toolchain.Toolchain.GetOrAdd(session, 'cpp')
+  session.flush()
+  ids = toolchain.Toolchain.GetOrAddMany(session, ['cpp', 'opencl', 'cpp'])
+  assert ids['cpp'] == t1.id
+  assert ids['opencl'] != t1.id
+  assert session.query(toolchain.Toolchain).count() == 2
+
+
 def test_MakeEngine_unknown_backend():
   with pytest.raises(NotImplementedError):
     db.MakeEngine(DataStoreProtoMock())
@@ -113,6 +218,38 @@ def test_MakeEngine_postgresql_database_quote():
     db.MakeEngine(config)
 
 
+def test_MakeEngine_sqlite_pragmas():
+  with tempfile.TemporaryDirectory() as d:
+    config = datastore_pb2.DataStore(testonly=True)
+    config.sqlite.path = str(pathlib.Path(d) / 'db.db')
+    config.sqlite.journal_mode = 'wal'
+    config.sqlite.synchronous = 'NORMAL'
+    engine = db.MakeEngine(config)
+    assert engine.execute('PRAGMA journal_mode').scalar() == 'wal'
+    # NORMAL is synchronous level 1.
+    assert engine.execute('PRAGMA synchronous').scalar() == 1
+
+
+def test_MakeEngine_sqlite_invalid_pragma():
+  config = datastore_pb2.DataStore(testonly=True)
+  config.sqlite.inmemory = True
+  config.sqlite.journal_mode = 'invalid'
+  with pytest.raises(db.InvalidDatabaseConfig):
+    db.MakeEngine(config)
+
+
+def test_GetPoolMetrics(ds):
+  metrics = ds.pool_metrics
+  num_checkouts = metrics.num_checkouts
+  with ds.Session() as session:
+    toolchain.Toolchain.GetOrAdd(session, 'cpp')
+    session.flush()
+    assert metrics.num_checked_out == 1
+  assert metrics.num_checkouts == num_checkouts + 1
+  assert metrics.num_checked_out == 0
+  assert metrics.max_checkout_wait_seconds >= 0
+
+
 def main(argv):  # pylint: disable=missing-docstring
   del argv
   sys.exit(pytest.main([__file__, '-v']))
@@ -0,0 +1,50 @@
+"""This file defines the differential test outcome class."""
+import datetime
+
+import sqlalchemy as sql
+from phd.lib.labm8 import labdate
+from sqlalchemy import orm
+from sqlalchemy.dialects import mysql
+
+import deeplearning.deepsmith.result
+from deeplearning.deepsmith import db
+from deeplearning.deepsmith.proto import deepsmith_pb2
+
+
+class DifferentialTestOutcome(db.Table):
+  """The outcome of differential testing a result.
+
+  There is at most one outcome for each result. A result which was part of a
+  differential test that was discarded by a filter has an outcome with the
+  discarded column set.
+  """
+  id_t = deeplearning.deepsmith.result.Result.id_t
+  __tablename__ = 'difftest_outcomes'
+
+  # Columns.
+  result_id: int = sql.Column(id_t, sql.ForeignKey('results.id'),
+                              primary_key=True)
+  date_added: datetime.datetime = sql.Column(
+      sql.DateTime().with_variant(mysql.DATETIME(fsp=3), 'mysql'),
+      nullable=False,
+      default=labdate.GetUtcMillisecondsNow)
+  # The result that this result was compared against.
+  gold_standard_result_id: int = sql.Column(id_t, sql.ForeignKey('results.id'),
+                                            nullable=False)
+  outcome_num: int = sql.Column(sql.Integer, nullable=False)
+  discarded: bool = sql.Column(sql.Boolean, nullable=False)
+
+  # Relationships.
+  result: deeplearning.deepsmith.result.Result = orm.relationship(
+      'Result', foreign_keys=[result_id])
+  gold_standard_result: deeplearning.deepsmith.result.Result = orm.relationship(
+      'Result', foreign_keys=[gold_standard_result_id])
+
+  @property
+  def outcome(self) -> deepsmith_pb2.DifferentialTest.Outcome:
+    """Get the symbolic outcome.
+
+    Returns:
+       An Outcome enum instance.
+    """
+    return deepsmith_pb2.DifferentialTest.Outcome(self.outcome_num)
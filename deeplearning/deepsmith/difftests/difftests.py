@@ -1,4 +1,6 @@
 """This module defines differential tests for results."""
+import difflib
+import hashlib
 import typing
 from absl import flags
 
@@ -24,18 +26,95 @@ class DiffTesterBase(object):
     raise NotImplementedError
 
 
+def GetOutputDigest(result: deepsmith_pb2.Result, output_name: str) -> str:
+  """Get the digest of a result output.
+
+  Results read from a datastore carry the digests of their outputs, which are
+  used in preference to hashing the (possibly truncated) output text.
+
+  Args:
+    result: A result.
+    output_name: The name of the output.
+
+  Returns:
+    The hex MD5 digest of the output.
+
+  Raises:
+    KeyError: If the result has no such output.
+  """
+  if output_name in result.output_md5s:
+    return result.output_md5s[output_name]
+  return hashlib.md5(
+      result.outputs[output_name].encode('utf-8')).hexdigest()
+
+
+def GetOutputNames(result: deepsmith_pb2.Result) -> typing.Set[str]:
+  """Get the names of the outputs of a result."""
+  return set(result.outputs.keys()) | set(result.output_md5s.keys())
+
+
+def GetOutputDiff(gs_result: deepsmith_pb2.Result,
+                  result: deepsmith_pb2.Result, output_name: str) -> str:
+  """Produce a unified diff of the text of an output of two results.
+
+  Args:
+    gs_result: The result to diff against.
+    result: The result to diff.
+    output_name: The name of the output.
+
+  Returns:
+    The diff, which is empty if the outputs are equal.
+  """
+  if (output_name in GetOutputNames(gs_result) and
+      output_name in GetOutputNames(result) and
+      GetOutputDigest(gs_result, output_name) ==
+      GetOutputDigest(result, output_name)):
+    return ''
+  return ''.join(difflib.unified_diff(
+      gs_result.outputs.get(output_name, '').splitlines(keepends=True),
+      result.outputs.get(output_name, '').splitlines(keepends=True),
+      fromfile=f'{gs_result.testbed.name}/{output_name}',
+      tofile=f'{result.testbed.name}/{output_name}'))
+
+
 class OutputsEqualityTest(object):
-  """An object which compares result outputs."""
+  """An object which compares result outputs.
+
+  Outputs are compared by digest. The text of outputs is only compared when a
+  diff is requested.
+  """
 
   def __call__(self, results: typing.List[deepsmith_pb2.Result]) -> bool:
     raise NotImplementedError
 
+  def Diff(self, gs_result: deepsmith_pb2.Result,
+           result: deepsmith_pb2.Result) -> str:
+    """Produce a detailed diff of the compared outputs of two results.
+
+    Args:
+      gs_result: The result to diff against.
+      result: The result to diff.
+
+    Returns:
+      A unified diff of the outputs which differ, which is empty if the
+      outputs are equal.
+    """
+    raise NotImplementedError
+
 
 class OutputsAreEqual(OutputsEqualityTest):
   """An outputs equality test which compares all outputs."""
 
   def __call__(self, results: typing.List[deepsmith_pb2.Result]) -> bool:
-    return len(set(r.outputs for r in results)) == 1
+    return len(set(
+        frozenset((name, GetOutputDigest(r, name)) for name in GetOutputNames(r))
+        for r in results)) == 1
+
+  def Diff(self, gs_result: deepsmith_pb2.Result,
+           result: deepsmith_pb2.Result) -> str:
+    output_names = GetOutputNames(gs_result) | GetOutputNames(result)
+    return ''.join(GetOutputDiff(gs_result, result, name)
+                   for name in sorted(output_names))
 
 
 class NamedOutputIsEqual(OutputsEqualityTest):
@@ -49,7 +128,6 @@ class NamedOutputIsEqual(OutputsEqualityTest):
 
     Args:
       results: A list of results to compare the named output of.
-      output_name: The name of the output in the result's outputs map.
 
     Returns:
       True if all named outputs are equal, else False.
@@ -57,9 +135,13 @@ class NamedOutputIsEqual(OutputsEqualityTest):
     Raises:
       ValueError: if the named output is missing from any of the results.
     """
-    if any(self.output_name not in r.outputs for r in results):
+    if any(self.output_name not in GetOutputNames(r) for r in results):
       raise ValueError(f"'{self.output_name}' missing in one or more results.")
-    return len(set(r.outputs[self.output_name] for r in results)) == 1
+    return len(set(GetOutputDigest(r, self.output_name) for r in results)) == 1
+
+  def Diff(self, gs_result: deepsmith_pb2.Result,
+           result: deepsmith_pb2.Result) -> str:
+    return GetOutputDiff(gs_result, result, self.output_name)
 
 
 class UnaryTester(DiffTesterBase):
@@ -1,4 +1,5 @@
 """Unit tests for //deeplearning/deepsmith/difftests/difftests.py."""
+import hashlib
 import pytest
 import sys
 from absl import app
@@ -268,6 +269,46 @@ def test_GoldStandardDiffTester_DiffTestOne_both_pass_no_stdout():
   assert "'stdout' missing in one or more results." == str(e_ctx.value)
 
 
+def test_NamedOutputIsEqual_digests():
+  """Test that output digests are compared in place of output text."""
+  test = deeplearning.deepsmith.difftests.difftests.NamedOutputIsEqual('stdout')
+  digest = hashlib.md5(b'abc').hexdigest()
+  assert test([Result(outputs={'stdout': 'abc'}),
+               Result(output_md5s={'stdout': digest})])
+  # The digest takes precedence over (possibly truncated) output text.
+  assert not test([Result(outputs={'stdout': 'abc'}),
+                   Result(outputs={'stdout': 'abc'},
+                          output_md5s={'stdout': hashlib.md5(
+                              b'abcd').hexdigest()})])
+
+
+def test_OutputsAreEqual():
+  """Test comparison of all outputs."""
+  test = deeplearning.deepsmith.difftests.difftests.OutputsAreEqual()
+  assert test([Result(outputs={'stdout': 'a', 'stderr': 'b'}),
+               Result(outputs={'stdout': 'a'},
+                      output_md5s={'stderr': hashlib.md5(b'b').hexdigest()})])
+  assert not test([Result(outputs={'stdout': 'a', 'stderr': 'b'}),
+                   Result(outputs={'stdout': 'a', 'stderr': 'c'})])
+  assert not test([Result(outputs={'stdout': 'a', 'stderr': 'b'}),
+                   Result(outputs={'stdout': 'a'})])
+
+
+def test_OutputsEqualityTest_Diff():
+  """Test detailed diffs of outputs."""
+  gs_result = Result(testbed=deepsmith_pb2.Testbed(name='gs'),
+                     outputs={'stdout': 'a\nb\n', 'stderr': ''})
+  result = Result(testbed=deepsmith_pb2.Testbed(name='dut'),
+                  outputs={'stdout': 'a\nc\n', 'stderr': ''})
+  diff = deeplearning.deepsmith.difftests.difftests.NamedOutputIsEqual(
+      'stdout').Diff(gs_result, result)
+  assert diff == '--- gs/stdout\n+++ dut/stdout\n@@ -1,2 +1,2 @@\n a\n-b\n+c\n'
+  assert deeplearning.deepsmith.difftests.difftests.OutputsAreEqual().Diff(
+      gs_result, result) == diff
+  assert not deeplearning.deepsmith.difftests.difftests.NamedOutputIsEqual(
+      'stderr').Diff(gs_result, result)
+
+
 def main(argv):
   """Main entry point."""
   if len(argv) > 1:
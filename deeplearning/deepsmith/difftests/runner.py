@@ -0,0 +1,279 @@
+"""A differential testing engine which runs over the results in a datastore."""
+import binascii
+import itertools
+import typing
+
+import sqlalchemy as sql
+from absl import logging
+
+import deeplearning.deepsmith.difftest
+import deeplearning.deepsmith.result
+import deeplearning.deepsmith.testbed
+import deeplearning.deepsmith.testcase
+from deeplearning.deepsmith import datastore
+from deeplearning.deepsmith import db
+from deeplearning.deepsmith.difftests import difftests
+from deeplearning.deepsmith.proto import deepsmith_pb2
+
+
+# Shorthand for the tables used by the runner.
+_Outcome = deeplearning.deepsmith.difftest.DifferentialTestOutcome
+_Result = deeplearning.deepsmith.result.Result
+_ResultOutput = deeplearning.deepsmith.result.ResultOutput
+_ResultOutputName = deeplearning.deepsmith.result.ResultOutputName
+_ResultOutputSet = deeplearning.deepsmith.result.ResultOutputSet
+_ResultOutputValue = deeplearning.deepsmith.result.ResultOutputValue
+_Testbed = deeplearning.deepsmith.testbed.Testbed
+_Testcase = deeplearning.deepsmith.testcase.Testcase
+
+# The number of rows fetched at a time from the server-side cursor.
+STREAM_CHUNK_SIZE = 1000
+
+
+class DataStoreDiffTester(object):
+  """Differential test the results in a datastore against a gold standard.
+
+  Results are grouped by testcase, and each result is compared against the
+  result of the gold standard testbed for that testcase. Testcases are
+  processed in order of ID, in batches, and the outcomes of each batch are
+  committed before the next is started. A testcase is difftested when any of
+  its results does not yet have an outcome, so an interrupted run may be
+  resumed by running again, and testcases which receive new results are
+  difftested again. Runs over disjoint ranges of testcase IDs may be performed
+  concurrently.
+
+  Outputs are compared by the MD5 digests stored in the database, rather than
+  by their text. The results passed to the outputs equality test and filters
+  carry the digests of all outputs in output_md5s, but only the outputs named
+  in text_output_names have their (possibly truncated) text in outputs, for
+  use by filters.
+  """
+
+  def __init__(self, ds: datastore.DataStore, gold_standard_testbed_id: int,
+               outputs_equality_test: difftests.OutputsEqualityTest,
+               filters: typing.Optional[difftests.FiltersBase] = None,
+               text_output_names: typing.Iterable[str] = ('stderr',),
+               batch_size: int = 100):
+    """Instantiate a difftester.
+
+    Args:
+      ds: The datastore to difftest the results of.
+      gold_standard_testbed_id: The ID of the gold standard testbed. Testcases
+        with no result for this testbed are not difftested.
+      outputs_equality_test: The test used to compare result outputs.
+      filters: Optional filters to apply to difftests before and after the
+        outcomes are determined. Discarded difftests have their outcomes
+        recorded as discarded.
+      text_output_names: The names of outputs to fetch the text of.
+      batch_size: The number of testcases to difftest in each transaction.
+    """
+    self.ds = ds
+    self.gold_standard_testbed_id = gold_standard_testbed_id
+    self.difftester = difftests.GoldStandardDiffTester(outputs_equality_test)
+    self.filters = filters
+    self.text_output_names = list(text_output_names)
+    self.batch_size = batch_size
+    self._testbeds: typing.Dict[int, deepsmith_pb2.Testbed] = {}
+
+  def Run(self, start_testcase_id: int = 0,
+          end_testcase_id: typing.Optional[int] = None) -> int:
+    """Difftest the results of a range of testcases.
+
+    Args:
+      start_testcase_id: The first testcase ID to difftest.
+      end_testcase_id: The testcase ID to stop at, exclusive. If not provided,
+        all testcases from start_testcase_id onwards are difftested.
+
+    Returns:
+      The number of testcases difftested.
+    """
+    num_difftests = 0
+    while True:
+      with self.ds.Session(commit=True) as session:
+        testcase_ids = self.GetPendingTestcaseIds(
+            session, start_testcase_id, end_testcase_id)
+        if not testcase_ids:
+          break
+        rows = []
+        for result_ids, difftest in self.GetDiffTests(session, testcase_ids):
+          rows += self.DiffTest(result_ids, difftest)
+          num_difftests += 1
+        self.AddOutcomes(session, rows)
+      start_testcase_id = testcase_ids[-1] + 1
+      logging.info('Difftested %d testcases, up to testcase %d',
+                   num_difftests, testcase_ids[-1])
+    return num_difftests
+
+  def GetPendingTestcaseIds(self, session: db.session_t,
+                            start_testcase_id: int,
+                            end_testcase_id: typing.Optional[int]
+                            ) -> typing.List[int]:
+    """Get the next batch of testcases which have results to difftest.
+
+    A testcase is pending when it has a gold standard result, at least one
+    other result, and a result without an outcome. Testcases with only a gold
+    standard result have nothing to difftest and are not returned, so they are
+    not revisited by resumed runs.
+
+    Args:
+      session: A database session.
+      start_testcase_id: The lowest testcase ID to return.
+      end_testcase_id: The testcase ID to stop at, exclusive, or None.
+
+    Returns:
+      A sorted list of at most batch_size testcase IDs.
+    """
+    gold_standard_testcase_ids = session.query(_Result.testcase_id).filter(
+        _Result.testbed_id == self.gold_standard_testbed_id)
+    multiple_results_testcase_ids = session.query(_Result.testcase_id) \
+      .filter(_Result.testcase_id >= start_testcase_id)
+    if end_testcase_id is not None:
+      multiple_results_testcase_ids = multiple_results_testcase_ids.filter(
+          _Result.testcase_id < end_testcase_id)
+    multiple_results_testcase_ids = multiple_results_testcase_ids \
+      .group_by(_Result.testcase_id) \
+      .having(sql.func.count(_Result.id) > 1)
+    q = session.query(_Result.testcase_id) \
+      .outerjoin(_Outcome, _Outcome.result_id == _Result.id) \
+      .filter(_Outcome.result_id == None) \
+      .filter(_Result.testcase_id >= start_testcase_id) \
+      .filter(_Result.testcase_id.in_(gold_standard_testcase_ids)) \
+      .filter(_Result.testcase_id.in_(multiple_results_testcase_ids))
+    if end_testcase_id is not None:
+      q = q.filter(_Result.testcase_id < end_testcase_id)
+    q = q.distinct().order_by(_Result.testcase_id).limit(self.batch_size)
+    return [row.testcase_id for row in q]
+
+  def GetDiffTests(self, session: db.session_t,
+                   testcase_ids: typing.List[int]
+                   ) -> typing.Iterator[typing.Tuple[
+                     typing.List[int], deepsmith_pb2.DifferentialTest]]:
+    """Build the difftests for a list of testcases.
+
+    Testcases which do not have a gold standard result and at least one other
+    result are skipped. GetPendingTestcaseIds() does not return such
+    testcases.
+
+    Args:
+      session: A database session.
+      testcase_ids: The testcases to difftest.
+
+    Returns:
+      An iterator of <result_ids, difftest> tuples, where the first result of
+      the difftest is the gold standard.
+    """
+    texts = {}
+    if self.text_output_names:
+      q = session.query(_Result.id, _ResultOutputName.string,
+                        _ResultOutputValue.truncated_value) \
+        .join(_ResultOutputSet, _ResultOutputSet.id == _Result.outputset_id) \
+        .join(_ResultOutput, _ResultOutput.id == _ResultOutputSet.output_id) \
+        .join(_ResultOutputName, _ResultOutputName.id == _ResultOutput.name_id) \
+        .join(_ResultOutputValue,
+              _ResultOutputValue.id == _ResultOutput.value_id) \
+        .filter(_Result.testcase_id.in_(testcase_ids)) \
+        .filter(_ResultOutputName.string.in_(self.text_output_names))
+      texts = {(result_id, name): value for result_id, name, value in q}
+
+    # Stream the results and output digests, ordered by testcase.
+    q = session.query(_Result.testcase_id, _Result.id, _Result.testbed_id,
+                      _Result.returncode, _Result.outcome_num,
+                      _ResultOutputName.string,
+                      _ResultOutputValue.original_md5) \
+      .outerjoin(_ResultOutputSet, _ResultOutputSet.id == _Result.outputset_id) \
+      .outerjoin(_ResultOutput, _ResultOutput.id == _ResultOutputSet.output_id) \
+      .outerjoin(_ResultOutputName,
+                 _ResultOutputName.id == _ResultOutput.name_id) \
+      .outerjoin(_ResultOutputValue,
+                 _ResultOutputValue.id == _ResultOutput.value_id) \
+      .filter(_Result.testcase_id.in_(testcase_ids)) \
+      .order_by(_Result.testcase_id, _Result.id) \
+      .execution_options(stream_results=True) \
+      .yield_per(STREAM_CHUNK_SIZE)
+    # Materialize the batch before yielding, so that the caller may use the
+    # session while iterating.
+    groups = [(testcase_id, list(rows)) for testcase_id, rows in
+              itertools.groupby(q, key=lambda row: row.testcase_id)]
+
+    for testcase_id, rows in groups:
+      results = {}
+      gold_standard_result_id = None
+      for _, result_id, testbed_id, returncode, outcome_num, name, md5 in rows:
+        if result_id not in results:
+          result = deepsmith_pb2.Result(returncode=returncode,
+                                        outcome=outcome_num)
+          result.testbed.CopyFrom(self._GetTestbed(session, testbed_id))
+          results[result_id] = result
+          if testbed_id == self.gold_standard_testbed_id:
+            gold_standard_result_id = result_id
+        if name is not None:
+          results[result_id].output_md5s[name] = binascii.hexlify(
+              md5).decode('utf-8')
+          if (result_id, name) in texts:
+            results[result_id].outputs[name] = texts[(result_id, name)]
+      if gold_standard_result_id is None or len(results) < 2:
+        continue
+
+      result_ids = [gold_standard_result_id] + sorted(
+          result_id for result_id in results
+          if result_id != gold_standard_result_id)
+      difftest = deepsmith_pb2.DifferentialTest()
+      if self.filters:
+        difftest.testcase.CopyFrom(
+            session.query(_Testcase).get(testcase_id).ToProto())
+      for result_id in result_ids:
+        result = difftest.result.add()
+        result.CopyFrom(results[result_id])
+        if self.filters:
+          result.testcase.CopyFrom(difftest.testcase)
+      yield result_ids, difftest
+
+  def DiffTest(self, result_ids: typing.List[int],
+               difftest: deepsmith_pb2.DifferentialTest
+               ) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Difftest the results of a testcase.
+
+    Args:
+      result_ids: The IDs of the difftest results.
+      difftest: The difftest, where the first result is the gold standard.
+
+    Returns:
+      A list of DifferentialTestOutcome rows, one for each result.
+    """
+    discarded = False
+    outcomes = [deepsmith_pb2.DifferentialTest.UNKNOWN] * len(result_ids)
+    if self.filters:
+      discarded = not self.filters.PreDifftest(difftest)
+    if not discarded:
+      outcomes = self.difftester(list(difftest.result))
+      difftest.outcome.extend(outcomes)
+      if self.filters:
+        discarded = not self.filters.PostDifftest(difftest)
+    return [{
+      'result_id': result_id,
+      'gold_standard_result_id': result_ids[0],
+      'outcome_num': outcome,
+      'discarded': discarded,
+    } for result_id, outcome in zip(result_ids, outcomes)]
+
+  def AddOutcomes(self, session: db.session_t,
+                  rows: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    """Record difftest outcomes, replacing any previous outcomes.
+
+    Args:
+      session: A database session.
+      rows: The DifferentialTestOutcome rows to add.
+    """
+    result_ids = [row['result_id'] for row in rows]
+    for i in range(0, len(result_ids), db.BULK_LOOKUP_CHUNK_SIZE):
+      chunk = result_ids[i:i + db.BULK_LOOKUP_CHUNK_SIZE]
+      session.query(_Outcome).filter(_Outcome.result_id.in_(chunk)).delete(
+          synchronize_session=False)
+    db.BulkAdd(session, _Outcome, rows)
+
+  def _GetTestbed(self, session: db.session_t,
+                  testbed_id: int) -> deepsmith_pb2.Testbed:
+    if testbed_id not in self._testbeds:
+      self._testbeds[testbed_id] = session.query(_Testbed).get(
+          testbed_id).ToProto()
+    return self._testbeds[testbed_id]
@@ -0,0 +1,196 @@
+"""Unit tests for //deeplearning/deepsmith/difftests/runner.py."""
+import hashlib
+import sys
+import typing
+
+import pytest
+from absl import app
+from absl import flags
+
+import deeplearning.deepsmith.difftest
+import deeplearning.deepsmith.result
+from deeplearning.deepsmith import datastore
+from deeplearning.deepsmith.difftests import difftests
+from deeplearning.deepsmith.difftests import runner
+from deeplearning.deepsmith.proto import deepsmith_pb2
+
+
+FLAGS = flags.FLAGS
+
+DiffTest = deepsmith_pb2.DifferentialTest
+Outcome = deeplearning.deepsmith.difftest.DifferentialTestOutcome
+
+
+def _ResultProto(testbed: str, src: str, stdout: str, stderr: str = '',
+                 outcome=deepsmith_pb2.Result.PASS) -> deepsmith_pb2.Result:
+  return deepsmith_pb2.Result(
+      testcase=deepsmith_pb2.Testcase(
+          toolchain='cpp',
+          generator=deepsmith_pb2.Generator(name='generator'),
+          harness=deepsmith_pb2.Harness(name='harness'),
+          inputs={'src': src},
+      ),
+      testbed=deepsmith_pb2.Testbed(toolchain='cpp', name=testbed),
+      returncode=0,
+      outputs={'stdout': stdout, 'stderr': stderr},
+      outcome=outcome,
+  )
+
+
+def _AddResults(ds: datastore.DataStore,
+                protos: typing.List[deepsmith_pb2.Result]) -> typing.List[int]:
+  with ds.Session(commit=True) as session:
+    results = [deeplearning.deepsmith.result.Result.GetOrAdd(session, proto)
+               for proto in protos]
+    session.flush()
+    return [result.id for result in results]
+
+
+def _GoldStandardTestbedId(ds: datastore.DataStore) -> int:
+  with ds.Session() as session:
+    return session.query(deeplearning.deepsmith.result.Result).filter(
+        deeplearning.deepsmith.result.Result.id == 1).one().testbed_id
+
+
+def _Outcomes(ds: datastore.DataStore) -> typing.Dict[int, typing.Tuple[
+  int, bool]]:
+  with ds.Session() as session:
+    return {o.result_id: (o.outcome_num, o.discarded)
+            for o in session.query(Outcome)}
+
+
+def _DiffTester(ds: datastore.DataStore, **kwargs) -> runner.DataStoreDiffTester:
+  return runner.DataStoreDiffTester(
+      ds, _GoldStandardTestbedId(ds), difftests.NamedOutputIsEqual('stdout'),
+      **kwargs)
+
+
+class MockFilters(difftests.FiltersBase):
+  """Filters which record difftests and discard those with a given stderr."""
+
+  def __init__(self, stderr: str):
+    self.stderr = stderr
+    self.difftests = []
+
+  def PreDifftest(self, difftest: DiffTest) -> typing.Optional[DiffTest]:
+    self.difftests.append(difftest)
+    return difftest
+
+  def PostDifftest(self, difftest: DiffTest) -> typing.Optional[DiffTest]:
+    if any(r.outputs['stderr'] == self.stderr for r in difftest.result):
+      return None
+    return difftest
+
+
+def test_DataStoreDiffTester_Run_outcomes(ds):
+  """Test outcomes of difftests."""
+  ids = _AddResults(ds, [
+    _ResultProto('gs', 'a', 'Hello'),
+    _ResultProto('dut', 'a', 'Hello'),
+    _ResultProto('gs', 'b', 'Hello'),
+    _ResultProto('dut', 'b', 'Goodbye'),
+  ])
+  assert _DiffTester(ds).Run() == 2
+  assert _Outcomes(ds) == {
+    ids[0]: (DiffTest.PASS, False),
+    ids[1]: (DiffTest.PASS, False),
+    ids[2]: (DiffTest.PASS, False),
+    ids[3]: (DiffTest.ANOMALOUS_WRONG_OUTPUT, False),
+  }
+
+
+def test_DataStoreDiffTester_Run_no_gold_standard(ds):
+  """Test that testcases without a gold standard result are ignored."""
+  _AddResults(ds, [
+    _ResultProto('gs', 'a', 'Hello'),
+    _ResultProto('dut', 'b', 'Hello'),
+    _ResultProto('dut2', 'b', 'Hello'),
+  ])
+  assert _DiffTester(ds).Run() == 0
+  assert _Outcomes(ds) == {}
+
+
+def test_DataStoreDiffTester_GetPendingTestcaseIds_gold_standard_only(ds):
+  """Test that testcases with only a gold standard result are not pending."""
+  _AddResults(ds, [
+    _ResultProto('gs', 'a', 'Hello'),
+    _ResultProto('gs', 'b', 'Hello'),
+    _ResultProto('dut', 'b', 'Hello'),
+    _ResultProto('gs', 'c', 'Hello'),
+  ])
+  difftester = _DiffTester(ds)
+  with ds.Session() as session:
+    testcase_ids = difftester.GetPendingTestcaseIds(session, 0, None)
+    assert len(testcase_ids) == 1
+  assert difftester.Run() == 1
+  with ds.Session() as session:
+    assert difftester.GetPendingTestcaseIds(session, 0, None) == []
+
+
+def test_DataStoreDiffTester_Run_resume(ds):
+  """Test that only testcases with new results are difftested."""
+  _AddResults(ds, [
+    _ResultProto('gs', 'a', 'Hello'),
+    _ResultProto('dut', 'a', 'Hello'),
+    _ResultProto('gs', 'b', 'Hello'),
+    _ResultProto('dut', 'b', 'Hello'),
+  ])
+  difftester = _DiffTester(ds, batch_size=1)
+  assert difftester.Run() == 2
+  assert difftester.Run() == 0
+  ids = _AddResults(ds, [_ResultProto('dut2', 'b', 'Goodbye')])
+  assert difftester.Run() == 1
+  outcomes = _Outcomes(ds)
+  assert len(outcomes) == 5
+  assert outcomes[ids[0]] == (DiffTest.ANOMALOUS_WRONG_OUTPUT, False)
+
+
+def test_DataStoreDiffTester_Run_testcase_id_range(ds):
+  """Test that difftests are restricted to a range of testcases."""
+  _AddResults(ds, [
+    _ResultProto('gs', 'a', 'Hello'),
+    _ResultProto('dut', 'a', 'Hello'),
+    _ResultProto('gs', 'b', 'Hello'),
+    _ResultProto('dut', 'b', 'Hello'),
+    _ResultProto('gs', 'c', 'Hello'),
+    _ResultProto('dut', 'c', 'Hello'),
+  ])
+  difftester = _DiffTester(ds)
+  assert difftester.Run(start_testcase_id=2, end_testcase_id=3) == 1
+  assert difftester.Run(start_testcase_id=2) == 1
+  assert difftester.Run() == 1
+
+
+def test_DataStoreDiffTester_Run_filters(ds):
+  """Test that filters receive output text and discard difftests."""
+  ids = _AddResults(ds, [
+    _ResultProto('gs', 'a', 'Hello'),
+    _ResultProto('dut', 'a', 'Goodbye', stderr='warning'),
+    _ResultProto('gs', 'b', 'Hello'),
+    _ResultProto('dut', 'b', 'Goodbye'),
+  ])
+  filters = MockFilters('warning')
+  assert _DiffTester(ds, filters=filters).Run() == 2
+  assert _Outcomes(ds) == {
+    ids[0]: (DiffTest.PASS, True),
+    ids[1]: (DiffTest.ANOMALOUS_WRONG_OUTPUT, True),
+    ids[2]: (DiffTest.PASS, False),
+    ids[3]: (DiffTest.ANOMALOUS_WRONG_OUTPUT, False),
+  }
+  difftest = filters.difftests[0]
+  assert difftest.testcase.inputs['src'] == 'a'
+  assert difftest.result[0].testbed.name == 'gs'
+  assert difftest.result[1].outputs['stderr'] == 'warning'
+  # Outputs which are not fetched as text are compared by digest.
+  assert 'stdout' not in difftest.result[1].outputs
+  assert (difftest.result[1].output_md5s['stdout'] ==
+          hashlib.md5(b'Goodbye').hexdigest())
+
+
+def main(argv):  # pylint: disable=missing-docstring
+  del argv
+  sys.exit(pytest.main([__file__, '-v']))
+
+
+if __name__ == '__main__':
+  app.run(main)
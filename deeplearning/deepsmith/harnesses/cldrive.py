@@ -1,8 +1,11 @@
+import collections
 import copy
 import grpc
+import multiprocessing
 import pathlib
 import subprocess
 import tempfile
+import threading
 import time
 import typing
 from absl import app
@@ -11,6 +14,7 @@ from absl import logging
 from concurrent import futures
 
 from deeplearning.deepsmith import services
+from deeplearning.deepsmith.harnesses import driver_cache
 from deeplearning.deepsmith.harnesses import harness
 from deeplearning.deepsmith.proto import deepsmith_pb2
 from deeplearning.deepsmith.proto import harness_pb2
@@ -44,6 +48,13 @@ class DriverCompilationError(OSError):
   pass
 
 
+# A driver binary which has been generated and compiled for a testcase.
+# The testcase is annotated by MakeDriver(). If compilation failed, the binary
+# path is None and the error is the DriverCompilationError message.
+PreparedDriver = collections.namedtuple(
+    'PreparedDriver', ['testcase', 'binary_path', 'error', 'profiling_events'])
+
+
 class CldriveHarness(harness.HarnessBase,
                      harness_pb2_grpc.HarnessServiceServicer):
   """A harness for running OpenCL testcases using cldrive."""
@@ -100,6 +111,24 @@ class CldriveHarness(harness.HarnessBase,
     self.envs = envs
     self.testbeds = [OpenClEnvironmentToTestbed(e) for e in envs]
     self.ids = [e.ids() for e in envs]
+    # Testcases are executed serially on each OpenCL device. Environments which
+    # differ only in opencl_opt share a device.
+    self.device_locks = {ids: threading.Lock() for ids in self.ids}
+    if self.config.HasField('driver_cache_dir'):
+      self.driver_cache = driver_cache.DriverCache(
+          pathlib.Path(self.config.driver_cache_dir).expanduser(),
+          self.config.driver_cache_size_mb * 1024 * 1024)
+    else:
+      self.driver_cache = None
+    # Drivers are prepared in a pool of processes which is shared by all
+    # requests. The processes are spawned rather than forked, since forking a
+    # process with running gRPC threads is unsafe.
+    if self.config.driver_lookahead > 0:
+      self.driver_pool = multiprocessing.get_context('spawn').Pool(
+          processes=min(self.config.driver_lookahead,
+                        multiprocessing.cpu_count()))
+    else:
+      self.driver_pool = None
 
     # Logging output.
     for testbed in self.testbeds:
@@ -126,16 +155,95 @@ class CldriveHarness(harness.HarnessBase,
       return response
 
     testbed_idx = self.testbeds.index(request.testbed)
-    for i, testcase in enumerate(request.testcases):
-      result = RunTestcase(
-          self.envs[testbed_idx], self.testbeds[testbed_idx], testcase,
-          self.config.driver_cflag)
-      logging.info('Testcase %d: %s.', i + 1,
-                   deepsmith_pb2.Result.Outcome.Name(result.outcome))
-      response.results.extend([result])
-
+    opencl_environment = self.envs[testbed_idx]
+    testbed = self.testbeds[testbed_idx]
+    with tempfile.TemporaryDirectory(prefix='deepsmith_') as d:
+      prepared_drivers = self.PrepareDrivers(
+          request.testcases, testbed, pathlib.Path(d))
+      for i, (testcase, prepared) in enumerate(
+          zip(request.testcases, prepared_drivers)):
+        # MakeDriver() annotates the testcase in the worker process, so copy
+        # the annotations back to the request.
+        testcase.CopyFrom(prepared.testcase)
+        with self.device_locks[self.ids[testbed_idx]]:
+          result = RunDriver(opencl_environment, testbed, prepared)
+        logging.info('Testcase %d: %s.', i + 1,
+                     deepsmith_pb2.Result.Outcome.Name(result.outcome))
+        response.results.extend([result])
+
+    if self.driver_cache:
+      logging.info('Driver cache: %d hits, %d misses.',
+                   self.driver_cache.hits, self.driver_cache.misses)
     return response
 
+  def PrepareDrivers(self, testcases: typing.List[deepsmith_pb2.Testcase],
+                     testbed: deepsmith_pb2.Testbed,
+                     outdir: pathlib.Path) -> typing.Iterator[PreparedDriver]:
+    """Generate and compile the drivers for a sequence of testcases.
+
+    Up to config.driver_lookahead drivers are prepared in parallel, ahead of
+    the driver which is consumed. If a driver cache is configured, cached
+    drivers are used in place of compiling them, and newly compiled drivers
+    are added to the cache.
+
+    Args:
+      testcases: The testcases to prepare drivers for.
+      testbed: The testbed that the testcases will be run on.
+      outdir: The directory to write driver binaries to.
+
+    Returns:
+      An iterator over PreparedDriver tuples, in the same order as testcases.
+    """
+    platform_id, device_id = self.ids[self.testbeds.index(testbed)]
+    optimizations = testbed.opts['opencl_opt'] == 'enabled'
+    cflags = list(self.config.driver_cflag)
+    args = [(testcase, optimizations, platform_id, device_id, cflags,
+             outdir / f'driver_{i}') for i, testcase in enumerate(testcases)]
+
+    lookahead = self.config.driver_lookahead
+
+    def _Submit(args_) -> typing.Tuple[typing.Optional[str], futures.Future]:
+      """Start preparing a driver, unless it is cached.
+
+      Returns:
+        A tuple of the key to add the driver to the cache with, or None, and a
+        future PreparedDriver.
+      """
+      key = None
+      future = futures.Future()
+      if self.driver_cache:
+        key = self.driver_cache.Key(*args_[:5])
+        driver_type = self.driver_cache.Get(key, args_[5])
+        if driver_type is not None:
+          testcase = deepsmith_pb2.Testcase()
+          testcase.CopyFrom(args_[0])
+          testcase.invariant_opts['driver_type'] = driver_type
+          future.set_result(PreparedDriver(testcase, args_[5], None, []))
+          return None, future
+      if self.driver_pool:
+        self.driver_pool.apply_async(PrepareDriver, args_,
+                                     callback=future.set_result,
+                                     error_callback=future.set_exception)
+      else:
+        future.set_result(PrepareDriver(*args_))
+      return key, future
+
+    def _Result(key: typing.Optional[str],
+                future: futures.Future) -> PreparedDriver:
+      prepared = future.result()
+      if key and prepared.binary_path:
+        self.driver_cache.Put(key, prepared.binary_path,
+                              prepared.testcase.invariant_opts['driver_type'])
+      return prepared
+
+    pending = collections.deque()
+    for args_ in args:
+      pending.append(_Submit(args_))
+      if len(pending) > lookahead:
+        yield _Result(*pending.popleft())
+    while pending:
+      yield _Result(*pending.popleft())
+
 
 def OpenClEnvironmentToTestbed(
     opencl_environment: env.OpenCLEnvironment) -> deepsmith_pb2.Testbed:
@@ -165,47 +273,113 @@ def RunTestcase(opencl_environment: env.OpenCLEnvironment,
                 testcase: deepsmith_pb2.Testcase,
                 cflags: typing.List[str]) -> deepsmith_pb2.Result:
   """Run a testcase."""
-  if testcase.toolchain != 'opencl':
-    raise ValueError(f"Unsupported testcase toolchain: '{testcase.toolchain}'")
-  if testcase.harness.name != 'cldrive':
-    raise ValueError(f"Unsupported testcase harness: '{testcase.harness.name}'")
-  result = deepsmith_pb2.Result()
-  result.testbed.CopyFrom(testbed)
   platform_id, device_id = opencl_environment.ids()
-  driver = MakeDriver(
-      testcase, True if testbed.opts['opencl_opt'] == 'enabled' else False)
-  # MakeDriver() annotates the testcase, so we must only set the testcase field
-  # of the output result after we have called it.
-  result.testcase.CopyFrom(testcase)
   # Get a temporary file to write and run the driver from.
   with tempfile.NamedTemporaryFile(prefix='deepsmith_', delete=False) as f:
     path = pathlib.Path(f.name)
   try:
-    CompileDriver(driver, path, platform_id, device_id, cflags=cflags)
-    timeout = testcase.harness.opts.get('timeout_seconds', '60')
-    cmd = ['timeout', '-s9', timeout, f.name]
-    start_time = labdate.GetUtcMillisecondsNow()
-    proc = opencl_environment.Exec(cmd)
-    end_time = labdate.GetUtcMillisecondsNow()
-    # Build result message.
-    result.returncode = proc.returncode
-    result.outputs['stdout'] = proc.stdout
-    result.outputs['stderr'] = proc.stderr
-    runtime = result.profiling_events.add()
-    runtime.client = system.HOSTNAME
-    runtime.type = 'runtime'
-    runtime.duration_ms = int(round(
-        (end_time - start_time).total_seconds() * 1000))
-    runtime.event_start_epoch_ms = labdate.MillisecondsTimestamp(start_time)
-    result.outcome = GetResultOutcome(result)
-  except DriverCompilationError as e:
-    logging.warning('%s', e)
-    result.outcome = deepsmith_pb2.Result.UNKNOWN
+    prepared = PrepareDriver(
+        testcase, True if testbed.opts['opencl_opt'] == 'enabled' else False,
+        platform_id, device_id, cflags, path)
+    testcase.CopyFrom(prepared.testcase)
+    return RunDriver(opencl_environment, testbed, prepared)
   finally:
     fs.rm(path)
+
+
+def PrepareDriver(testcase: deepsmith_pb2.Testcase, optimizations: bool,
+                  platform_id: int, device_id: int, cflags: typing.List[str],
+                  binary_path: pathlib.Path) -> PreparedDriver:
+  """Generate and compile the driver for a testcase.
+
+  This does not use the OpenCL device, so may be run in a separate process to
+  the one which executes the driver.
+
+  Args:
+    testcase: The testcase to prepare a driver for.
+    optimizations: Whether OpenCL optimizations are enabled.
+    platform_id: The OpenCL platform ID.
+    device_id: The OpenCL device ID.
+    cflags: Additional flags to compile the driver with.
+    binary_path: The path of the driver binary to generate.
+
+  Returns:
+    A PreparedDriver tuple.
+
+  Raises:
+    ValueError: If the testcase is not an OpenCL cldrive testcase.
+  """
+  if testcase.toolchain != 'opencl':
+    raise ValueError(f"Unsupported testcase toolchain: '{testcase.toolchain}'")
+  if testcase.harness.name != 'cldrive':
+    raise ValueError(f"Unsupported testcase harness: '{testcase.harness.name}'")
+  profiling_events = []
+  start_time = labdate.GetUtcMillisecondsNow()
+  src = MakeDriver(testcase, optimizations)
+  profiling_events.append(MakeProfilingEvent('make_driver', start_time))
+  start_time = labdate.GetUtcMillisecondsNow()
+  try:
+    CompileDriver(src, binary_path, platform_id, device_id, cflags=cflags)
+    error = None
+  except DriverCompilationError as e:
+    binary_path, error = None, str(e)
+  profiling_events.append(MakeProfilingEvent('compile_driver', start_time))
+  return PreparedDriver(testcase, binary_path, error, profiling_events)
+
+
+def RunDriver(opencl_environment: env.OpenCLEnvironment,
+              testbed: deepsmith_pb2.Testbed,
+              prepared: PreparedDriver) -> deepsmith_pb2.Result:
+  """Run a prepared driver.
+
+  Args:
+    opencl_environment: The OpenCL environment to run the driver in.
+    testbed: The testbed of the OpenCL environment.
+    prepared: A PreparedDriver tuple.
+
+  Returns:
+    A Result proto.
+  """
+  result = deepsmith_pb2.Result()
+  result.testbed.CopyFrom(testbed)
+  result.testcase.CopyFrom(prepared.testcase)
+  result.profiling_events.extend(prepared.profiling_events)
+  if prepared.error:
+    logging.warning('%s', prepared.error)
+    result.outcome = deepsmith_pb2.Result.UNKNOWN
+    return result
+  timeout = prepared.testcase.harness.opts.get('timeout_seconds', '60')
+  cmd = ['timeout', '-s9', timeout, str(prepared.binary_path)]
+  start_time = labdate.GetUtcMillisecondsNow()
+  proc = opencl_environment.Exec(cmd)
+  # Build result message.
+  result.returncode = proc.returncode
+  result.outputs['stdout'] = proc.stdout
+  result.outputs['stderr'] = proc.stderr
+  result.profiling_events.extend([MakeProfilingEvent('runtime', start_time)])
+  result.outcome = GetResultOutcome(result)
   return result
 
 
+def MakeProfilingEvent(type_: str,
+                       start_time) -> deepsmith_pb2.ProfilingEvent:
+  """Create a profiling event for a timed region which ends now.
+
+  Args:
+    type_: The profiling event type.
+    start_time: The start time of the region, as a datetime.
+
+  Returns:
+    A ProfilingEvent proto.
+  """
+  end_time = labdate.GetUtcMillisecondsNow()
+  return deepsmith_pb2.ProfilingEvent(
+      client=system.HOSTNAME,
+      type=type_,
+      duration_ms=int(round((end_time - start_time).total_seconds() * 1000)),
+      event_start_epoch_ms=labdate.MillisecondsTimestamp(start_time))
+
+
 def MakeDriver(testcase: deepsmith_pb2.Testcase,
                optimizations: bool) -> str:
   """Generate a self-contained C program for the given test case.
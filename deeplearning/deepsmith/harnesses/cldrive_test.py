@@ -13,6 +13,9 @@ from deeplearning.deepsmith.harnesses import cldrive
 from deeplearning.deepsmith.proto import deepsmith_pb2
 from deeplearning.deepsmith.proto import harness_pb2
 from deeplearning.deepsmith.proto import service_pb2
+from gpu.cldrive import cgen
+from gpu.cldrive import data
+from gpu.cldrive import driver
 from gpu.oclgrind import oclgrind
 
 
@@ -255,6 +258,28 @@ def test_MakeDriver_optimizations_off():
       'clBuildProgram(program, 0, NULL, "-cl-opt-disable", NULL, NULL);' in src)
 
 
+def _CompileDataDriver(gsize: int, compact_data: bool) -> None:
+  src = 'kernel void A(global int* a, global float* b) {}'
+  size = max(gsize * 2, 256)
+  inputs = data.MakeData(src, size, data.Generator.ARANGE)
+  c = cgen.emit_c(src, inputs, driver.NDRange(gsize, 1, 1),
+                  driver.NDRange(1, 1, 1), compact_data=compact_data)
+  with tempfile.TemporaryDirectory() as d:
+    cldrive.CompileDriver(c, pathlib.Path(d) / 'exe', 0, 0)
+
+
+@pytest.mark.parametrize('gsize', [1, 1024, 65536])
+def test_benchmark_CompileDriver_compact_data(benchmark, gsize: int):
+  """Benchmark compiling a driver with data initialized by loops."""
+  benchmark(_CompileDataDriver, gsize, True)
+
+
+@pytest.mark.parametrize('gsize', [1, 1024, 65536])
+def test_benchmark_CompileDriver_array_literal_data(benchmark, gsize: int):
+  """Benchmark compiling a driver with data initialized by array literals."""
+  benchmark(_CompileDataDriver, gsize, False)
+
+
 # CldriveHarness() tests.
 
 def test_CldriveHarness_oclgrind_testbed():
@@ -359,6 +384,72 @@ def test_CldriveHarness_RunTestcases_invalid_driver_cflags(
   assert result.outcome == deepsmith_pb2.Result.UNKNOWN
 
 
+def test_CldriveHarness_RunTestcases_driver_lookahead(
+    abc_testcase, abc_harness_config):
+  """Test that results are returned in order when drivers are pipelined."""
+  abc_harness_config.driver_lookahead = 2
+  harness = cldrive.CldriveHarness(abc_harness_config)
+  testcases = []
+  for i in range(4):
+    testcase = deepsmith_pb2.Testcase()
+    testcase.CopyFrom(abc_testcase)
+    testcase.inputs['src'] = (
+      f'kernel void A(global int* a) {{a[get_global_id(0)] = {i};}}')
+    testcases.append(testcase)
+  req = harness_pb2.RunTestcasesRequest(
+      testbed=harness.testbeds[0], testcases=testcases)
+  res = harness.RunTestcases(req, None)
+  assert res.status.returncode == service_pb2.ServiceStatus.SUCCESS
+  assert len(res.results) == 4
+  for i, result in enumerate(res.results):
+    assert result.outcome == deepsmith_pb2.Result.PASS
+    assert result.testcase == req.testcases[i]
+    assert result.outputs['stdout'].startswith(f'global int * a: {i} 1 2 3')
+    assert [e.type for e in result.profiling_events] == [
+      'make_driver', 'compile_driver', 'runtime']
+
+
+def test_CldriveHarness_RunTestcases_driver_pool_reused(
+    abc_harness_config, abc_run_testcases_request):
+  """Test that one pool of driver processes serves every request."""
+  abc_harness_config.driver_lookahead = 2
+  harness = cldrive.CldriveHarness(abc_harness_config)
+  pool = harness.driver_pool
+  for _ in range(2):
+    res = harness.RunTestcases(abc_run_testcases_request, None)
+    assert res.results[0].outcome == deepsmith_pb2.Result.PASS
+  assert harness.driver_pool is pool
+
+
+def test_CldriveHarness_RunTestcases_no_driver_lookahead(
+    abc_harness_config, abc_run_testcases_request):
+  """Test that drivers can be prepared serially."""
+  abc_harness_config.driver_lookahead = 0
+  harness = cldrive.CldriveHarness(abc_harness_config)
+  res = harness.RunTestcases(abc_run_testcases_request, None)
+  assert res.status.returncode == service_pb2.ServiceStatus.SUCCESS
+  assert len(res.results) == 1
+  result = res.results[0]
+  assert result.testcase.invariant_opts['driver_type'] == 'compile_and_run'
+  assert result.outcome == deepsmith_pb2.Result.PASS
+
+
+def test_CldriveHarness_RunTestcases_driver_cache(
+    abc_harness_config, abc_run_testcases_request):
+  """Test that cached drivers are used when a testcase is re-run."""
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    abc_harness_config.driver_cache_dir = d
+    harness = cldrive.CldriveHarness(abc_harness_config)
+    res1 = harness.RunTestcases(abc_run_testcases_request, None)
+    assert harness.driver_cache.misses == 1
+    res2 = harness.RunTestcases(abc_run_testcases_request, None)
+    assert harness.driver_cache.hits == 1
+  assert res1.results[0].outcome == deepsmith_pb2.Result.PASS
+  assert res2.results[0].outcome == deepsmith_pb2.Result.PASS
+  assert res1.results[0].testcase == res2.results[0].testcase
+  assert res1.results[0].outputs == res2.results[0].outputs
+
+
 def main(argv):
   """Main entry point."""
   if len(argv) > 1:
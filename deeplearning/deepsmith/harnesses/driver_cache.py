@@ -0,0 +1,141 @@
+"""A content-addressed cache of compiled cldrive driver binaries."""
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+import typing
+import uuid
+
+from absl import logging
+
+from deeplearning.deepsmith.proto import deepsmith_pb2
+
+
+class DriverCache(object):
+  """An on-disk cache of compiled driver binaries.
+
+  A driver binary depends only on the testcase inputs, whether OpenCL
+  optimizations are enabled, the OpenCL platform and device IDs, and the
+  compiler flags. Entries are keyed by a hash of these values, and evicted in
+  least-recently-used order once the total size of the binaries exceeds a
+  limit.
+
+  The cache may be shared by many processes. Entries are published with an
+  atomic rename, and are hard linked to the caller's path on a hit, so that a
+  concurrent eviction cannot remove a binary which is in use. Note that the
+  key does not include the version of cldrive which generated the driver, so
+  the cache should be emptied when cldrive is changed.
+  """
+
+  def __init__(self, path: pathlib.Path, max_size_bytes: int):
+    """Instantiate a driver cache.
+
+    Args:
+      path: The cache directory. Created if it does not exist.
+      max_size_bytes: The maximum total size of cached binaries.
+    """
+    self.path = path
+    self.max_size_bytes = max_size_bytes
+    self.path.mkdir(parents=True, exist_ok=True)
+    self.hits = 0
+    self.misses = 0
+
+  @staticmethod
+  def Key(testcase: deepsmith_pb2.Testcase, optimizations: bool,
+          platform_id: int, device_id: int, cflags: typing.List[str]) -> str:
+    """Compute the cache key of a driver.
+
+    Args:
+      testcase: The testcase that the driver is for.
+      optimizations: Whether OpenCL optimizations are enabled.
+      platform_id: The OpenCL platform ID.
+      device_id: The OpenCL device ID.
+      cflags: Additional flags that the driver is compiled with.
+
+    Returns:
+      A hex digest.
+    """
+    key = json.dumps([dict(testcase.inputs), optimizations, platform_id,
+                      device_id, list(cflags)], sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+  def Get(self, key: str, binary_path: pathlib.Path) -> typing.Optional[str]:
+    """Fetch a driver binary from the cache.
+
+    Args:
+      key: The cache key of the driver.
+      binary_path: The path to write the driver binary to. Must not exist.
+
+    Returns:
+      The driver type of the cached driver, or None if the driver is not in
+      the cache.
+    """
+    try:
+      driver_type = self._DriverTypePath(key).read_text()
+      _LinkOrCopy(self._BinaryPath(key), binary_path)
+      # Mark the entry as recently used.
+      os.utime(self._BinaryPath(key))
+    except FileNotFoundError:
+      self.misses += 1
+      return None
+    self.hits += 1
+    return driver_type
+
+  def Put(self, key: str, binary_path: pathlib.Path, driver_type: str) -> None:
+    """Add a driver binary to the cache.
+
+    Args:
+      key: The cache key of the driver.
+      binary_path: The path of the driver binary. The binary is not moved.
+      driver_type: The driver type, as annotated by MakeDriver().
+    """
+    # Write the driver type first, so that the entry is only visible once it
+    # is complete.
+    with tempfile.NamedTemporaryFile(
+        'w', dir=self.path, prefix='.tmp_', delete=False) as f:
+      f.write(driver_type)
+    os.replace(f.name, self._DriverTypePath(key))
+    tmp_path = self.path / f'.tmp_{uuid.uuid4().hex}'
+    _LinkOrCopy(binary_path, tmp_path)
+    os.replace(tmp_path, self._BinaryPath(key))
+    self.Evict()
+
+  def Evict(self) -> None:
+    """Evict the least recently used entries until the cache fits in size."""
+    entries = []
+    for path in self.path.glob('*.bin'):
+      try:
+        stat = path.stat()
+      except FileNotFoundError:
+        # Evicted by another process.
+        continue
+      entries.append((stat.st_mtime, stat.st_size, path))
+    size = sum(entry[1] for entry in entries)
+    for _, entry_size, path in sorted(entries):
+      if size <= self.max_size_bytes:
+        break
+      for evicted in [path, path.with_suffix('.driver_type')]:
+        try:
+          evicted.unlink()
+        except FileNotFoundError:
+          pass
+      size -= entry_size
+      logging.debug('Evicted driver %s', path.stem)
+
+  def _BinaryPath(self, key: str) -> pathlib.Path:
+    return self.path / f'{key}.bin'
+
+  def _DriverTypePath(self, key: str) -> pathlib.Path:
+    return self.path / f'{key}.driver_type'
+
+
+def _LinkOrCopy(src: pathlib.Path, dst: pathlib.Path) -> None:
+  """Hard link a file, falling back to a copy across file systems."""
+  try:
+    os.link(src, dst)
+  except FileNotFoundError:
+    raise
+  except OSError:
+    shutil.copy2(src, dst)
@@ -0,0 +1,90 @@
+"""Unit tests for //deeplearning/deepsmith/harnesses:driver_cache."""
+import os
+import pathlib
+import sys
+import tempfile
+
+import pytest
+from absl import app
+
+from deeplearning.deepsmith.harnesses import driver_cache
+from deeplearning.deepsmith.proto import deepsmith_pb2
+
+
+@pytest.fixture(scope='function')
+def tempdir() -> pathlib.Path:
+  """Test fixture which returns a temporary directory."""
+  with tempfile.TemporaryDirectory(prefix='phd_') as d:
+    yield pathlib.Path(d)
+
+
+def _MakeBinary(path: pathlib.Path, size: int) -> pathlib.Path:
+  path.write_bytes(b'\0' * size)
+  return path
+
+
+def test_DriverCache_Key_depends_on_inputs():
+  testcase = deepsmith_pb2.Testcase(inputs={'src': 'kernel void A() {}'})
+  key = driver_cache.DriverCache.Key(testcase, True, 0, 0, [])
+  assert key == driver_cache.DriverCache.Key(testcase, True, 0, 0, [])
+  assert key != driver_cache.DriverCache.Key(testcase, False, 0, 0, [])
+  assert key != driver_cache.DriverCache.Key(testcase, True, 1, 0, [])
+  assert key != driver_cache.DriverCache.Key(testcase, True, 0, 1, [])
+  assert key != driver_cache.DriverCache.Key(testcase, True, 0, 0, ['-O3'])
+  testcase.inputs['gsize'] = '1,1,1'
+  assert key != driver_cache.DriverCache.Key(testcase, True, 0, 0, [])
+
+
+def test_DriverCache_Key_ignores_invariant_opts():
+  testcase = deepsmith_pb2.Testcase(inputs={'src': 'kernel void A() {}'})
+  key = driver_cache.DriverCache.Key(testcase, True, 0, 0, [])
+  testcase.invariant_opts['driver_type'] = 'compile_only'
+  assert key == driver_cache.DriverCache.Key(testcase, True, 0, 0, [])
+
+
+def test_DriverCache_Get_miss(tempdir: pathlib.Path):
+  cache = driver_cache.DriverCache(tempdir / 'cache', 1024)
+  assert cache.Get('key', tempdir / 'driver') is None
+  assert not (tempdir / 'driver').exists()
+  assert cache.hits == 0
+  assert cache.misses == 1
+
+
+def test_DriverCache_Put_Get(tempdir: pathlib.Path):
+  cache = driver_cache.DriverCache(tempdir / 'cache', 1024)
+  _MakeBinary(tempdir / 'a', 10).chmod(0o755)
+  cache.Put('key', tempdir / 'a', 'compile_and_run')
+  assert (tempdir / 'a').is_file()
+  assert cache.Get('key', tempdir / 'b') == 'compile_and_run'
+  assert (tempdir / 'b').read_bytes() == b'\0' * 10
+  assert os.access(tempdir / 'b', os.X_OK)
+  assert cache.hits == 1
+  assert cache.misses == 0
+
+
+def test_DriverCache_Put_evicts_least_recently_used(tempdir: pathlib.Path):
+  cache = driver_cache.DriverCache(tempdir / 'cache', 25)
+  cache.Put('a', _MakeBinary(tempdir / 'a', 10), 'compile_only')
+  cache.Put('b', _MakeBinary(tempdir / 'b', 10), 'compile_only')
+  # Mark 'a' as the least recently used entry.
+  os.utime(tempdir / 'cache' / 'a.bin', (0, 0))
+  cache.Put('c', _MakeBinary(tempdir / 'c', 10), 'compile_only')
+  assert cache.Get('a', tempdir / 'a2') is None
+  assert cache.Get('b', tempdir / 'b2') == 'compile_only'
+  assert cache.Get('c', tempdir / 'c2') == 'compile_only'
+
+
+def test_DriverCache_shared_between_instances(tempdir: pathlib.Path):
+  cache1 = driver_cache.DriverCache(tempdir / 'cache', 1024)
+  cache2 = driver_cache.DriverCache(tempdir / 'cache', 1024)
+  cache1.Put('key', _MakeBinary(tempdir / 'a', 10), 'compile_only')
+  assert cache2.Get('key', tempdir / 'b') == 'compile_only'
+
+
+def main(argv):  # pylint: disable=missing-docstring
+  del argv
+  sys.exit(pytest.main([__file__, '-v']))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -1,5 +1,7 @@
 """This file implements profiling events."""
 import datetime
+import typing
+
 import sqlalchemy as sql
 from phd.lib.labm8 import labdate
 from phd.lib.labm8 import sqlutil
@@ -16,6 +18,38 @@ class ProfilingEventType(db.StringTable):
   __tablename__ = 'proviling_event_types'
 
 
+def _EventRows(session: db.session_t, owner_column: str,
+               events: typing.List[
+                 typing.Tuple[int, deepsmith_pb2.ProfilingEvent]]) -> \
+    typing.List[typing.Dict[str, typing.Any]]:
+  """Build the table rows for a list of profiling events.
+
+  Args:
+    session: A database session.
+    owner_column: The name of the column which references the event owner.
+    events: A list of <owner_id, ProfilingEvent> tuples.
+
+  Returns:
+    A list of rows, with identical events removed.
+  """
+  client_ids = deeplearning.deepsmith.client.Client.GetOrAddMany(
+      session, {event.client for _, event in events})
+  type_ids = ProfilingEventType.GetOrAddMany(
+      session, {event.type for _, event in events})
+  rows = {}
+  for owner_id, event in events:
+    row = {
+      owner_column: owner_id,
+      'client_id': client_ids[event.client],
+      'type_id': type_ids[event.type],
+      'duration_ms': event.duration_ms,
+      'event_start': labdate.DatetimeFromMillisecondsTimestamp(
+          event.event_start_epoch_ms),
+    }
+    rows.setdefault(tuple(sorted(row.items())), row)
+  return list(rows.values())
+
+
 class TestcaseProfilingEvent(db.Table):
   id_t = sql.Integer
   __tablename__ = 'testcase_profiling_events'
@@ -91,6 +125,19 @@ class TestcaseProfilingEvent(db.Table):
         event_start=labdate.DatetimeFromMillisecondsTimestamp(
             proto.event_start_epoch_ms))
 
+  @classmethod
+  def AddMany(cls, session: db.session_t,
+              events: typing.List[
+                typing.Tuple[int, deepsmith_pb2.ProfilingEvent]]) -> None:
+    """Add the profiling events of many new testcases.
+
+    Args:
+      session: A database session.
+      events: A list of <testcase_id, ProfilingEvent> tuples.
+    """
+    if events:
+      db.BulkAdd(session, cls, _EventRows(session, 'testcase_id', events))
+
 
 class ResultProfilingEvent(db.Table):
   id_t = sql.Integer
@@ -166,3 +213,16 @@ class ResultProfilingEvent(db.Table):
         duration_ms=proto.duration_ms,
         event_start=labdate.DatetimeFromMillisecondsTimestamp(
             proto.event_start_epoch_ms))
+
+  @classmethod
+  def AddMany(cls, session: db.session_t,
+              events: typing.List[
+                typing.Tuple[int, deepsmith_pb2.ProfilingEvent]]) -> None:
+    """Add the profiling events of many new results.
+
+    Args:
+      session: A database session.
+      events: A list of <result_id, ProfilingEvent> tuples.
+    """
+    if events:
+      db.BulkAdd(session, cls, _EventRows(session, 'result_id', events))
@@ -92,6 +92,9 @@ class Result(db.Table):
     proto.returncode = self.returncode
     for output in self.outputset:
       proto.outputs[output.name.string] = output.value.truncated_value
+      if output.value.original_md5 is not None:
+        proto.output_md5s[output.name.string] = binascii.hexlify(
+            output.value.original_md5).decode('utf-8')
     for event in self.profiling_events:
       event_proto = proto.profiling_events.add()
       event.SetProto(event_proto)
@@ -169,6 +172,69 @@ class Result(db.Table):
 
     return result
 
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   protos: typing.List[deepsmith_pb2.Result]) -> \
+      typing.List[int]:
+    """Instantiate many Results from protocol buffers.
+
+    This is the bulk equivalent of Result.GetOrAdd(), with the same
+    de-duplication semantics. See Testcase.GetOrAddMany().
+
+    Args:
+      session: A database session.
+      protos: A list of Result messages.
+
+    Returns:
+      A list of result IDs, one for each of the protos.
+    """
+    testcase_ids = deeplearning.deepsmith.testcase.Testcase.GetOrAddMany(
+        session, [proto.testcase for proto in protos])
+    # There are few distinct testbeds in a batch, so these are resolved
+    # individually.
+    testbeds = {}
+    for proto in protos:
+      key = proto.testbed.SerializeToString(deterministic=True)
+      if key not in testbeds:
+        testbeds[key] = deeplearning.deepsmith.testbed.Testbed.GetOrAdd(
+            session, proto.testbed)
+    session.flush()
+
+    # Only add the result if the <testcase, testbed> tuple is unique. This is
+    # to prevent duplicate results where only the output differs.
+    key_columns = ['testcase_id', 'testbed_id']
+    keys = [(testcase_id,
+             testbeds[proto.testbed.SerializeToString(deterministic=True)].id)
+            for proto, testcase_id in zip(protos, testcase_ids)]
+    ids = db.BulkGet(session, cls, key_columns, keys)
+    new_results = {}
+    for key, proto in zip(keys, protos):
+      if key not in ids:
+        new_results.setdefault(key, proto)
+
+    output_ids = ResultOutput.GetOrAddMany(
+        session, {output for proto in new_results.values()
+                  for output in proto.outputs.items()})
+    outputset_ids = {key: db.GetKeyValueSetId(proto.outputs)
+                     for key, proto in new_results.items()}
+    db.BulkGetOrAdd(session, ResultOutputSet, ['id', 'output_id'], [
+      {'id': outputset_ids[key], 'output_id': output_ids[output]}
+      for key, proto in new_results.items()
+      for output in proto.outputs.items()])
+
+    db.BulkAdd(session, cls, [
+      {'testcase_id': key[0], 'testbed_id': key[1],
+       'returncode': proto.returncode, 'outputset_id': outputset_ids[key],
+       'outcome_num': proto.outcome} for key, proto in new_results.items()])
+    ids.update(db.BulkGet(session, cls, key_columns, new_results.keys()))
+
+    # Add profiling events.
+    profiling_event.ResultProfilingEvent.AddMany(
+        session, [(ids[key], event) for key, proto in new_results.items()
+                  for event in proto.profiling_events])
+
+    return [ids[key] for key in keys]
+
   @classmethod
   def ProtoFromFile(cls, path: pathlib.Path) -> deepsmith_pb2.Result:
     """Instantiate a protocol buffer result from file.
@@ -255,6 +321,30 @@ class ResultOutput(db.Table):
   def __repr__(self):
     return f'{self.name}: {self.value}'
 
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   outputs: typing.Iterable[typing.Tuple[str, str]]) -> \
+      typing.Dict[typing.Tuple[str, str], int]:
+    """Resolve the IDs of many ResultOutputs, adding those which are new.
+
+    Args:
+      session: A database session.
+      outputs: The <name, value> pairs of the result outputs.
+
+    Returns:
+      A map from <name, value> pair to ResultOutput ID.
+    """
+    outputs = set(outputs)
+    name_ids = ResultOutputName.GetOrAddMany(
+        session, {name for name, _ in outputs})
+    value_ids = ResultOutputValue.GetOrAddMany(
+        session, {value for _, value in outputs})
+    ids = db.BulkGetOrAdd(session, cls, ['value_id', 'name_id'], [
+      {'value_id': value_ids[value], 'name_id': name_ids[name]}
+      for name, value in outputs])
+    return {(name, value): ids[(value_ids[value], name_ids[name])]
+            for name, value in outputs}
+
 
 class ResultOutputName(db.StringTable):
   """The name of a result output."""
@@ -308,6 +398,50 @@ class ResultOutputValue(db.Table):
     Returns:
       A ResultOutputValue instance.
     """
+    columns = cls._GetColumns(string)
+    instance = db.GetInterned(session, cls, 'original_md5',
+                              columns['original_md5'])
+    if instance is None:
+      instance = phd.lib.labm8.sqlutil.GetOrAdd(session, cls, **columns)
+      db.InternId(session, cls, columns['original_md5'], instance.id)
+    return instance
+
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   strings: typing.Iterable[str]) -> typing.Dict[str, int]:
+    """Resolve the IDs of many ResultOutputValues, adding those which are new.
+
+    Args:
+      session: A database session.
+      strings: The strings.
+
+    Returns:
+      A map from string to ResultOutputValue ID.
+    """
+    rows = {string: cls._GetColumns(string) for string in strings}
+    ids, missing = {}, []
+    for row in rows.values():
+      id_ = db.GetInternedId(session, cls, row['original_md5'])
+      if id_ is None:
+        missing.append(row)
+      else:
+        ids[row['original_md5']] = id_
+    for key, id_ in db.BulkGetOrAdd(session, cls, ['original_md5'],
+                                    missing).items():
+      db.InternId(session, cls, key[0], id_)
+      ids[key[0]] = id_
+    return {string: ids[row['original_md5']] for string, row in rows.items()}
+
+  @classmethod
+  def _GetColumns(cls, string: str) -> typing.Dict[str, typing.Any]:
+    """Compute the column values for a string.
+
+    Args:
+      string: The string.
+
+    Returns:
+      A map of column names to values.
+    """
     original_charcount = len(string)
     original_linecount = string.count('\n')
     md5_ = hashlib.md5()
@@ -327,16 +461,16 @@ class ResultOutputValue(db.Table):
       truncated_md5 = original_md5
       truncated_linecount = original_linecount
       truncated_charcount = original_charcount
-    return phd.lib.labm8.sqlutil.GetOrAdd(
-        session, cls,
-        original_md5=original_md5,
-        original_linecount=original_linecount,
-        original_charcount=original_charcount,
-        truncated=True if original_charcount > cls.max_len else False,
-        truncated_value=truncated,
-        truncated_md5=truncated_md5,
-        truncated_linecount=truncated_linecount,
-        truncated_charcount=truncated_charcount, )
+    return {
+      'original_md5': original_md5,
+      'original_linecount': original_linecount,
+      'original_charcount': original_charcount,
+      'truncated': True if original_charcount > cls.max_len else False,
+      'truncated_value': truncated,
+      'truncated_md5': truncated_md5,
+      'truncated_linecount': truncated_linecount,
+      'truncated_charcount': truncated_charcount,
+    }
 
   def __repr__(self):
     return self.truncated_value[:50] or ''
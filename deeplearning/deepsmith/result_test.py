@@ -1,11 +1,13 @@
 """Tests for //deeplearning/deepsmith:result."""
 import datetime
+import hashlib
 import sys
 
 import pytest
 from absl import app
 
 import deeplearning.deepsmith.client
+import deeplearning.deepsmith.db
 import deeplearning.deepsmith.generator
 import deeplearning.deepsmith.harness
 import deeplearning.deepsmith.profiling_event
@@ -234,6 +236,8 @@ def test_Generator_GetOrAdd_ToProto_equivalence(session):
   # NOTE: We have to flush so that SQLAlchemy resolves all of the object IDs.
   session.flush()
   proto_out = result.ToProto()
+  for name, value in proto_in.outputs.items():
+    proto_in.output_md5s[name] = hashlib.md5(value.encode('utf-8')).hexdigest()
   assert proto_in == proto_out
   proto_out.ClearField('outputs')
   assert proto_in != proto_out  # Sanity check.
@@ -380,6 +384,110 @@ def test_duplicate_results_ignored(session):
   assert r3.profiling_events[1].duration_ms == 100
 
 
+def _ResultProto(src: str, stdout: str) -> deepsmith_pb2.Result:
+  return deepsmith_pb2.Result(
+      testcase=deepsmith_pb2.Testcase(
+          toolchain='cpp',
+          generator=deepsmith_pb2.Generator(name='generator'),
+          harness=deepsmith_pb2.Harness(name='harness'),
+          inputs={'src': src},
+          profiling_events=[
+            deepsmith_pb2.ProfilingEvent(
+                client='localhost',
+                type='generate',
+                duration_ms=100,
+                event_start_epoch_ms=1123123123,
+            ),
+          ]
+      ),
+      testbed=deepsmith_pb2.Testbed(
+          toolchain='cpp',
+          name='clang',
+          opts={'arch': 'x86_64'},
+      ),
+      returncode=0,
+      outputs={'stdout': stdout, 'stderr': ''},
+      profiling_events=[
+        deepsmith_pb2.ProfilingEvent(
+            client='localhost',
+            type='exec',
+            duration_ms=500,
+            event_start_epoch_ms=1123123123,
+        ),
+      ],
+      outcome=deepsmith_pb2.Result.PASS,
+  )
+
+
+def test_Result_GetOrAddMany_ToProto_equivalence(session):
+  protos_in = [_ResultProto('void main() {}', 'Hello, world!'),
+               _ResultProto('void main() { return 1; }', '')]
+  ids = deeplearning.deepsmith.result.Result.GetOrAddMany(session, protos_in)
+
+  assert len(ids) == 2
+  for id_, proto_in in zip(ids, protos_in):
+    result = session.query(deeplearning.deepsmith.result.Result).filter(
+        deeplearning.deepsmith.result.Result.id == id_).one()
+    # Results read from the datastore carry the digests of their outputs.
+    for name, value in proto_in.outputs.items():
+      proto_in.output_md5s[name] = hashlib.md5(
+          value.encode('utf-8')).hexdigest()
+    assert result.ToProto() == proto_in
+
+
+def test_Result_ToProto_output_md5s_truncated(session):
+  """Test that output digests are of the full, untruncated output."""
+  stdout = 'a' * (deeplearning.deepsmith.result.ResultOutputValue.max_len + 1)
+  result = deeplearning.deepsmith.result.Result.GetOrAdd(
+      session, _ResultProto('void main() {}', stdout))
+  session.flush()
+  proto = result.ToProto()
+  assert len(proto.outputs['stdout']) < len(stdout)
+  assert (proto.output_md5s['stdout'] ==
+          hashlib.md5(stdout.encode('utf-8')).hexdigest())
+
+
+def test_Result_GetOrAddMany_duplicate_testcase_testbed_ignored(session):
+  """Test that bulk-added results are ignored if testbed and testcase are not
+  unique."""
+  r1 = deeplearning.deepsmith.result.Result.GetOrAdd(
+      session, _ResultProto('void main() {}', 'Hello, world!'))
+  session.flush()
+
+  # Attempt to add new results which are identical to the first in all fields
+  # except for the outputs.
+  ids = deeplearning.deepsmith.result.Result.GetOrAddMany(
+      session, [_ResultProto('void main() {}', '!'),
+                _ResultProto('void main() {}', '?')])
+
+  # Check that only the first result was added.
+  assert ids == [r1.id, r1.id]
+  assert session.query(deeplearning.deepsmith.result.Result).count() == 1
+  r2 = session.query(deeplearning.deepsmith.result.Result).first()
+  assert r2.outputs['stdout'] == 'Hello, world!'
+
+
+def test_ResultOutputValue_GetOrAddMany_cache_evicted(ds, monkeypatch):
+  """Test that IDs evicted from the intern cache during a lookup are kept."""
+  with ds.Session(commit=True) as session:
+    a_id = deeplearning.deepsmith.result.ResultOutputValue.GetOrAddMany(
+        session, ['a'])['a']
+
+  bulk_get_or_add = deeplearning.deepsmith.db.BulkGetOrAdd
+
+  def _BulkGetOrAdd(session, *args):
+    # Evict the IDs found by the first lookup, as a concurrent session might.
+    deeplearning.deepsmith.db.GetInternCache(session).Clear()
+    return bulk_get_or_add(session, *args)
+
+  monkeypatch.setattr(deeplearning.deepsmith.db, 'BulkGetOrAdd', _BulkGetOrAdd)
+  with ds.Session() as session:
+    ids = deeplearning.deepsmith.result.ResultOutputValue.GetOrAddMany(
+        session, ['a', 'b'])
+  assert ids['a'] == a_id
+  assert ids['b'] not in {None, a_id}
+
+
 def main(argv):  # pylint: disable=missing-docstring
   del argv
   sys.exit(pytest.main([__file__, '-v']))
@@ -211,6 +211,90 @@ class Testcase(db.Table):
 
     return testcase
 
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   protos: typing.List[deepsmith_pb2.Testcase]) -> \
+      typing.List[int]:
+    """Instantiate many Testcases from protocol buffers.
+
+    This is the bulk equivalent of Testcase.GetOrAdd(), with the same
+    de-duplication semantics. Rather than querying for every component of
+    every testcase, the rows of each table are resolved with a single IN (...)
+    lookup, and the missing rows are added with multi-row inserts.
+
+    Args:
+      session: A database session.
+      protos: A list of Testcase messages.
+
+    Returns:
+      A list of testcase IDs, one for each of the protos.
+    """
+    # Flush pending objects so that they are visible to the bulk lookups.
+    session.flush()
+
+    toolchain_ids = deeplearning.deepsmith.toolchain.Toolchain.GetOrAddMany(
+        session, {proto.toolchain for proto in protos})
+    # There are few distinct generators and harnesses in a batch, so these are
+    # resolved individually.
+    generators, harnesses = {}, {}
+    for proto in protos:
+      key = proto.generator.SerializeToString(deterministic=True)
+      if key not in generators:
+        generators[key] = deeplearning.deepsmith.generator.Generator.GetOrAdd(
+            session, proto.generator)
+      key = proto.harness.SerializeToString(deterministic=True)
+      if key not in harnesses:
+        harnesses[key] = deeplearning.deepsmith.harness.Harness.GetOrAdd(
+            session, proto.harness)
+    session.flush()
+
+    input_ids = TestcaseInput.GetOrAddMany(
+        session,
+        {input_ for proto in protos for input_ in proto.inputs.items()})
+    inputset_ids = [db.GetKeyValueSetId(proto.inputs) for proto in protos]
+    db.BulkGetOrAdd(session, TestcaseInputSet, ['id', 'input_id'], [
+      {'id': inputset_id, 'input_id': input_ids[input_]}
+      for proto, inputset_id in zip(protos, inputset_ids)
+      for input_ in proto.inputs.items()])
+
+    invariant_opt_ids = TestcaseInvariantOpt.GetOrAddMany(
+        session,
+        {opt for proto in protos for opt in proto.invariant_opts.items()})
+    invariant_optset_ids = [db.GetKeyValueSetId(proto.invariant_opts)
+                            for proto in protos]
+    db.BulkGetOrAdd(session, TestcaseInvariantOptSet,
+                    ['id', 'invariant_opt_id'], [
+                      {'id': optset_id, 'invariant_opt_id':
+                        invariant_opt_ids[opt]}
+                      for proto, optset_id in zip(protos, invariant_optset_ids)
+                      for opt in proto.invariant_opts.items()])
+
+    # As in GetOrAdd(), a new testcase is created only if everything *except*
+    # the profiling events is unique.
+    key_columns = ['inputset_id', 'invariant_optset_id', 'toolchain_id',
+                   'generator_id', 'harness_id']
+    keys = [(inputset_id, invariant_optset_id, toolchain_ids[proto.toolchain],
+             generators[proto.generator.SerializeToString(
+                 deterministic=True)].id,
+             harnesses[proto.harness.SerializeToString(deterministic=True)].id)
+            for proto, inputset_id, invariant_optset_id in
+            zip(protos, inputset_ids, invariant_optset_ids)]
+    ids = db.BulkGet(session, cls, key_columns, keys)
+    new_testcases = {}
+    for key, proto in zip(keys, protos):
+      if key not in ids:
+        new_testcases.setdefault(key, proto)
+    db.BulkAdd(session, cls, [dict(zip(key_columns, key))
+                              for key in new_testcases])
+    ids.update(db.BulkGet(session, cls, key_columns, new_testcases.keys()))
+
+    # Add profiling events.
+    deeplearning.deepsmith.profiling_event.TestcaseProfilingEvent.AddMany(
+        session, [(ids[key], event) for key, proto in new_testcases.items()
+                  for event in proto.profiling_events])
+
+    return [ids[key] for key in keys]
+
   @classmethod
   def ProtoFromFile(cls, path: pathlib.Path) -> deepsmith_pb2.Testcase:
     """Instantiate a protocol buffer testcase from file.
@@ -320,6 +404,30 @@ class TestcaseInput(db.Table):
                                       value=TestcaseInputValue.GetOrAdd(session,
                                                                         string=value, ), )
 
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   inputs: typing.Iterable[typing.Tuple[str, str]]) -> \
+      typing.Dict[typing.Tuple[str, str], int]:
+    """Resolve the IDs of many TestcaseInputs, adding those which are new.
+
+    Args:
+      session: A database session.
+      inputs: The <name, value> pairs of the testcase inputs.
+
+    Returns:
+      A map from <name, value> pair to TestcaseInput ID.
+    """
+    inputs = set(inputs)
+    name_ids = TestcaseInputName.GetOrAddMany(
+        session, {name for name, _ in inputs})
+    value_ids = TestcaseInputValue.GetOrAddMany(
+        session, {value for _, value in inputs})
+    ids = db.BulkGetOrAdd(session, cls, ['value_id', 'name_id'], [
+      {'value_id': value_ids[value], 'name_id': name_ids[name]}
+      for name, value in inputs])
+    return {(name, value): ids[(value_ids[value], name_ids[name])]
+            for name, value in inputs}
+
 
 class TestcaseInputName(db.StringTable):
   """The name of a testcase input."""
@@ -368,10 +476,42 @@ class TestcaseInputValue(db.Table):
     md5 = hashlib.md5()
     md5.update(string.encode('utf-8'))
 
-    return phd.lib.labm8.sqlutil.GetOrAdd(session, cls, md5=md5.digest(),
-                                      charcount=len(string),
-                                      linecount=string.count('\n'),
-                                      string=string, )
+    instance = db.GetInterned(session, cls, 'md5', md5.digest())
+    if instance is None:
+      instance = phd.lib.labm8.sqlutil.GetOrAdd(session, cls, md5=md5.digest(),
+                                                charcount=len(string),
+                                                linecount=string.count('\n'),
+                                                string=string, )
+      db.InternId(session, cls, md5.digest(), instance.id)
+    return instance
+
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   strings: typing.Iterable[str]) -> typing.Dict[str, int]:
+    """Resolve the IDs of many TestcaseInputValues, adding any new values.
+
+    Args:
+      session: A database session.
+      strings: The strings.
+
+    Returns:
+      A map from string to TestcaseInputValue ID.
+    """
+    md5s, ids, rows = {}, {}, []
+    for string in strings:
+      md5 = hashlib.md5()
+      md5.update(string.encode('utf-8'))
+      md5s[string] = md5.digest()
+      id_ = db.GetInternedId(session, cls, md5s[string])
+      if id_ is None:
+        rows.append({'md5': md5s[string], 'charcount': len(string),
+                     'linecount': string.count('\n'), 'string': string})
+      else:
+        ids[md5s[string]] = id_
+    for key, id_ in db.BulkGetOrAdd(session, cls, ['md5'], rows).items():
+      db.InternId(session, cls, key[0], id_)
+      ids[key[0]] = id_
+    return {string: ids[md5] for string, md5 in md5s.items()}
 
   def __repr__(self):
     return self.string[:50] or ''
@@ -458,6 +598,31 @@ class TestcaseInvariantOpt(db.Table):
                                       value=TestcaseInvariantOptValue.GetOrAdd(
                                           session, string=value, ), )
 
+  @classmethod
+  def GetOrAddMany(cls, session: db.session_t,
+                   opts: typing.Iterable[typing.Tuple[str, str]]) -> \
+      typing.Dict[typing.Tuple[str, str], int]:
+    """Resolve the IDs of many TestcaseInvariantOpts, adding those which are
+    new.
+
+    Args:
+      session: A database session.
+      opts: The <name, value> pairs of the opts.
+
+    Returns:
+      A map from <name, value> pair to TestcaseInvariantOpt ID.
+    """
+    opts = set(opts)
+    name_ids = TestcaseInvariantOptName.GetOrAddMany(
+        session, {name for name, _ in opts})
+    value_ids = TestcaseInvariantOptValue.GetOrAddMany(
+        session, {value for _, value in opts})
+    ids = db.BulkGetOrAdd(session, cls, ['value_id', 'name_id'], [
+      {'value_id': value_ids[value], 'name_id': name_ids[name]}
+      for name, value in opts])
+    return {(name, value): ids[(value_ids[value], name_ids[name])]
+            for name, value in opts}
+
 
 class TestcaseInvariantOptName(db.StringTable):
   """The name of a testcase invariant_opt."""
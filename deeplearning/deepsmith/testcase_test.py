@@ -6,6 +6,7 @@ from absl import app
 from phd.lib.labm8 import labdate
 
 import deeplearning.deepsmith.client
+import deeplearning.deepsmith.db
 import deeplearning.deepsmith.generator
 import deeplearning.deepsmith.harness
 import deeplearning.deepsmith.profiling_event
@@ -217,57 +218,168 @@ def test_duplicate_testcases_ignored(session):
   assert t3.profiling_events[1].duration_ms == 100
 
 
+def test_Testcase_GetOrAddMany_ToProto_equivalence(session):
+  protos_in = [
+    deepsmith_pb2.Testcase(
+        toolchain='cpp',
+        generator=deepsmith_pb2.Generator(name='generator'),
+        harness=deepsmith_pb2.Harness(name='harness'),
+        inputs={'src': 'void main() {}', 'data': '[1,2]'},
+        invariant_opts={'config': 'opt'},
+        profiling_events=[
+          deepsmith_pb2.ProfilingEvent(
+              client='localhost',
+              type='generate',
+              duration_ms=100,
+              event_start_epoch_ms=101231231,
+          ),
+        ]
+    ),
+    deepsmith_pb2.Testcase(
+        toolchain='opencl',
+        generator=deepsmith_pb2.Generator(name='generator'),
+        harness=deepsmith_pb2.Harness(name='harness'),
+        inputs={'src': 'kernel void A() {}', 'data': '[1,2]'},
+        profiling_events=[
+          deepsmith_pb2.ProfilingEvent(
+              client='localhost',
+              type='generate',
+              duration_ms=200,
+              event_start_epoch_ms=101231231,
+          ),
+        ]
+    ),
+  ]
+  ids = deeplearning.deepsmith.testcase.Testcase.GetOrAddMany(
+      session, protos_in)
+
+  assert len(ids) == 2
+  for id_, proto_in in zip(ids, protos_in):
+    testcase = session.query(deeplearning.deepsmith.testcase.Testcase).filter(
+        deeplearning.deepsmith.testcase.Testcase.id == id_).one()
+    assert testcase.ToProto() == proto_in
+
+
+def test_Testcase_GetOrAddMany_duplicate_testcases_ignored(session):
+  """Test that bulk-added testcases are only added if they are unique."""
+  proto = deepsmith_pb2.Testcase(
+      toolchain='cpp',
+      generator=deepsmith_pb2.Generator(name='generator'),
+      harness=deepsmith_pb2.Harness(name='harness'),
+      inputs={'src': 'void main() {}', 'data': '[1,2]'},
+      invariant_opts={'config': 'opt'},
+      profiling_events=[
+        deepsmith_pb2.ProfilingEvent(
+            client='localhost',
+            type='generate',
+            duration_ms=100,
+            event_start_epoch_ms=1021312312,
+        ),
+      ]
+  )
+  t1 = deeplearning.deepsmith.testcase.Testcase.GetOrAdd(session, proto)
+  session.flush()
+
+  # Add the same testcase twice more, differing only in profiling events.
+  proto.profiling_events[0].duration_ms = -1
+  proto2 = deepsmith_pb2.Testcase()
+  proto2.CopyFrom(proto)
+  proto2.profiling_events[0].duration_ms = -2
+  ids = deeplearning.deepsmith.testcase.Testcase.GetOrAddMany(
+      session, [proto, proto2])
+
+  # Check that only the first testcase was added.
+  assert ids == [t1.id, t1.id]
+  assert session.query(deeplearning.deepsmith.testcase.Testcase).count() == 1
+  assert session.query(deeplearning.deepsmith.profiling_event.
+                       TestcaseProfilingEvent).count() == 1
+  t2 = session.query(deeplearning.deepsmith.testcase.Testcase).first()
+  assert t2.profiling_events[0].duration_ms == 100
+
+
 # Benchmarks.
 
 
-def _AddRandomNewTestcase(session):
-  deeplearning.deepsmith.testcase.Testcase.GetOrAdd(
-      session,
-      deepsmith_pb2.Testcase(
-          toolchain=str(random.random()),
-          generator=deepsmith_pb2.Generator(
-              name=str(random.random()),
-              opts={
-                str(random.random()): str(random.random()),
-                str(random.random()): str(random.random()),
-                str(random.random()): str(random.random()),
-              },
-          ),
-          harness=deepsmith_pb2.Harness(
-              name=str(random.random()),
-              opts={
-                str(random.random()): str(random.random()),
-                str(random.random()): str(random.random()),
-                str(random.random()): str(random.random()),
-              },
-          ),
-          inputs={
+def _RandomTestcaseProto() -> deepsmith_pb2.Testcase:
+  return deepsmith_pb2.Testcase(
+      toolchain=str(random.random()),
+      generator=deepsmith_pb2.Generator(
+          name=str(random.random()),
+          opts={
             str(random.random()): str(random.random()),
             str(random.random()): str(random.random()),
             str(random.random()): str(random.random()),
           },
-          invariant_opts={
+      ),
+      harness=deepsmith_pb2.Harness(
+          name=str(random.random()),
+          opts={
             str(random.random()): str(random.random()),
             str(random.random()): str(random.random()),
             str(random.random()): str(random.random()),
           },
-          profiling_events=[
-            deepsmith_pb2.ProfilingEvent(
-                client=str(random.random()),
-                type=str(random.random()),
-                duration_ms=int(random.random() * 1000),
-                event_start_epoch_ms=int(random.random() * 1000000),
-            ),
-          ]
-      )
+      ),
+      inputs={
+        str(random.random()): str(random.random()),
+        str(random.random()): str(random.random()),
+        str(random.random()): str(random.random()),
+      },
+      invariant_opts={
+        str(random.random()): str(random.random()),
+        str(random.random()): str(random.random()),
+        str(random.random()): str(random.random()),
+      },
+      profiling_events=[
+        deepsmith_pb2.ProfilingEvent(
+            client=str(random.random()),
+            type=str(random.random()),
+            duration_ms=int(random.random() * 1000),
+            event_start_epoch_ms=int(random.random() * 1000000),
+        ),
+      ]
   )
+
+
+def _AddRandomNewTestcase(session):
+  deeplearning.deepsmith.testcase.Testcase.GetOrAdd(
+      session, _RandomTestcaseProto())
   session.flush()
 
 
+def test_TestcaseInputValue_GetOrAddMany_cache_evicted(ds, monkeypatch):
+  """Test that IDs evicted from the intern cache during a lookup are kept."""
+  with ds.Session(commit=True) as session:
+    a_id = deeplearning.deepsmith.testcase.TestcaseInputValue.GetOrAddMany(
+        session, ['a'])['a']
+
+  bulk_get_or_add = deeplearning.deepsmith.db.BulkGetOrAdd
+
+  def _BulkGetOrAdd(session, *args):
+    # Evict the IDs found by the first lookup, as a concurrent session might.
+    deeplearning.deepsmith.db.GetInternCache(session).Clear()
+    return bulk_get_or_add(session, *args)
+
+  monkeypatch.setattr(deeplearning.deepsmith.db, 'BulkGetOrAdd', _BulkGetOrAdd)
+  with ds.Session() as session:
+    ids = deeplearning.deepsmith.testcase.TestcaseInputValue.GetOrAddMany(
+        session, ['a', 'b'])
+  assert ids['a'] == a_id
+  assert ids['b'] not in {None, a_id}
+
+
 def test_benchmark_Testcase_GetOrAdd_new(session, benchmark):
   benchmark(_AddRandomNewTestcase, session)
 
 
+def _AddRandomNewTestcases(session):
+  deeplearning.deepsmith.testcase.Testcase.GetOrAddMany(
+      session, [_RandomTestcaseProto() for _ in range(100)])
+
+
+def test_benchmark_Testcase_GetOrAddMany_new(session, benchmark):
+  benchmark(_AddRandomNewTestcases, session)
+
+
 def _AddExistingTestcase(session):
   deeplearning.deepsmith.testcase.Testcase.GetOrAdd(
       session,
@@ -1,6 +1,9 @@
 """OpenCL argument and type handling."""
+import collections
+import hashlib
 import numpy as np
 import re
+import threading
 import typing
 from pycparser.c_ast import FileAST
 from pycparser.c_ast import IdentifierType
@@ -51,9 +54,16 @@ FORMAT_SPECIFIERS = {
   np.dtype("uint8"): "%hd",
 }
 
+# The maximum number of parsed kernels to keep in memory.
+PARSED_KERNEL_CACHE_SIZE = 1024
+
 # Private OpenCL parser instance.
 _OPENCL_PARSER = OpenCLCParser()
 
+# Private cache of parsed kernels, keyed by source hash, in LRU order.
+_PARSED_KERNELS: typing.Dict[bytes, 'ParsedKernel'] = collections.OrderedDict()
+_PARSED_KERNELS_LOCK = threading.Lock()
+
 
 class OpenCLPreprocessError(ValueError):
   """Raised if pre-processor fails.
@@ -176,7 +186,8 @@ Supported types are: {{{supported_types_str}}}""")
       self.vector_width = 1
 
   def __repr__(self):
-    s = self.quals if len(self.quals) else []
+    # Copy the qualifiers, since they are shared with the AST.
+    s = list(self.quals)
     s.append(self.typename)
     if self.is_pointer:
       s.append("*")
@@ -235,6 +246,84 @@ class ArgumentExtractor(NodeVisitor):
     return self._args
 
 
+class ParsedKernel(object):
+  """The name and arguments of an OpenCL kernel, parsed once.
+
+  Errors are stored rather than raised, and are raised when the name or
+  arguments are accessed. This allows a kernel with unsupported argument types
+  to still have a name, as with GetKernelName().
+  """
+
+  def __init__(self, src: str):
+    self._name, self._name_error = None, None
+    self._args, self._args_error = None, None
+    try:
+      ast = ParseSource(src)
+    except OpenCLValueError as e:
+      self._name_error = self._args_error = e
+      return
+
+    visitor = ArgumentExtractor()
+    try:
+      visitor.visit(ast)
+      self._args = visitor.args
+    except MultipleKernelsError as e:
+      self._name_error = self._args_error = e
+      return
+    except (LookupError, ValueError) as e:
+      self._args_error = e
+      # Visit the whole AST to find the kernel name.
+      visitor = ArgumentExtractor(extract_args=False)
+      try:
+        visitor.visit(ast)
+      except MultipleKernelsError as e:
+        self._name_error = e
+        return
+
+    if visitor.name:
+      self._name = visitor.name
+    elif self._name_error is None:
+      self._name_error = NoKernelError('Source contains no kernel definitions')
+
+  @property
+  def name(self) -> str:
+    """Get the kernel name."""
+    if self._name_error:
+      raise self._name_error.with_traceback(None)
+    return self._name
+
+  @property
+  def args(self) -> typing.List[KernelArg]:
+    """Get the kernel arguments."""
+    if self._args_error:
+      raise self._args_error.with_traceback(None)
+    return list(self._args)
+
+
+def ParseKernel(src: str) -> ParsedKernel:
+  """Parse an OpenCL kernel, using a cache of recently parsed kernels.
+
+  Args:
+    src: The OpenCL kernel source.
+
+  Returns:
+    A ParsedKernel instance. Instances are shared between callers, and must not
+    be modified.
+  """
+  key = hashlib.sha1(src.encode('utf-8')).digest()
+  with _PARSED_KERNELS_LOCK:
+    parsed = _PARSED_KERNELS.get(key)
+    if parsed is not None:
+      _PARSED_KERNELS.move_to_end(key)
+      return parsed
+  parsed = ParsedKernel(src)
+  with _PARSED_KERNELS_LOCK:
+    _PARSED_KERNELS[key] = parsed
+    while len(_PARSED_KERNELS) > PARSED_KERNEL_CACHE_SIZE:
+      _PARSED_KERNELS.popitem(last=False)
+  return parsed
+
+
 def ParseSource(src: str) -> FileAST:
   """Parse OpenCL source code.
 
@@ -302,9 +391,7 @@ def GetKernelArguments(src: str) -> typing.List[KernelArg]:
     ...
     NoKernelError
   """
-  visitor = ArgumentExtractor()
-  visitor.visit(ParseSource(src))
-  return visitor.args
+  return ParseKernel(src).args
 
 
 def GetKernelName(src: str) -> str:
@@ -329,9 +416,4 @@ def GetKernelName(src: str) -> str:
     >>> GetKernelName("void kernel A(global float *a, const int b) {}")
     'A'
   """
-  visitor = ArgumentExtractor(extract_args=False)
-  visitor.visit(ParseSource(src))
-  if visitor.name:
-    return visitor.name
-  else:
-    raise NoKernelError('Source contains no kernel definitions')
+  return ParseKernel(src).name
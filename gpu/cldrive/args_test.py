@@ -204,6 +204,46 @@ def test_GetKernelName_syntax_error():
   assert "Syntax error: ':1:1: before: !'" == str(e_ctx.value)
 
 
+# ParseKernel() tests.
+
+def test_ParseKernel_cached():
+  """Test that a source is only parsed once."""
+  src = "kernel void A(global int* a, const float4 b) {}"
+  parsed = args.ParseKernel(src)
+  assert args.ParseKernel(src) is parsed
+  assert parsed.name == 'A'
+  assert [arg.vector_width for arg in parsed.args] == [1, 4]
+
+
+def test_ParseKernel_cache_size(mocker):
+  """Test that the least recently used kernels are evicted."""
+  mocker.patch.object(args, 'PARSED_KERNEL_CACHE_SIZE', 2)
+  a = args.ParseKernel("kernel void A() {}")
+  b = args.ParseKernel("kernel void B() {}")
+  assert args.ParseKernel("kernel void A() {}") is a
+  args.ParseKernel("kernel void C() {}")
+  assert args.ParseKernel("kernel void A() {}") is a
+  assert args.ParseKernel("kernel void B() {}") is not b
+
+
+def test_ParseKernel_unsupported_argument_has_name():
+  """Test that a kernel with unsupported arguments still has a name."""
+  parsed = args.ParseKernel("kernel void A(global struct s* a) {}")
+  assert parsed.name == 'A'
+  with pytest.raises(ValueError):
+    parsed.args
+  # The error is raised on every access.
+  with pytest.raises(ValueError):
+    parsed.args
+
+
+def test_KernelArg_repr_unchanged():
+  """Test that the representation of a shared argument is stable."""
+  arg = args.GetKernelArguments("kernel void A(const global int* a) {}")[0]
+  assert repr(arg) == repr(arg) == 'const global int * a'
+  assert arg.quals == ['const', 'global']
+
+
 def main(argv):  # pylint: disable=missing-docstring
   del argv
   sys.exit(pytest.main(
@@ -21,8 +21,40 @@ def to_array_str(array):
   return f"{{ {array_values} }}"
 
 
+def to_fill_loop_str(name: str, array: np.array) -> typing.Optional[str]:
+  """Return a C loop which fills an array, if one exists.
+
+  Arrays produced by the ARANGE, ZEROS, and ONES data generators can be
+  initialized with a loop, which is much cheaper to compile than the array
+  literal produced by to_array_str().
+
+  Args:
+    name: The name of the C array variable.
+    array: The values to fill the array with.
+
+  Returns:
+    A string of C code, or None if the array values have no closed form.
+  """
+  ctype = _args.OPENCL_TYPES[array.dtype]
+  if not array.size:
+    return None
+  if (array == array[0]).all():
+    value = repr(array[0].item())
+    if array.dtype == np.dtype("bool"):
+      value = "1" if array[0] else "0"
+  elif (array.dtype != np.dtype("bool") and
+        np.array_equal(array, np.arange(array.size).astype(array.dtype))):
+    value = f"({ctype}) j"
+  else:
+    return None
+  return f"""\
+    for (size_t j = 0; j < {array.size}; j++) {{
+        {name}[j] = {value};
+    }}"""
+
+
 def gen_data_blocks(kernel_args: typing.List[_args.KernelArg],
-                    inputs: np.array):
+                    inputs: np.array, compact_data: bool = True):
   setup_c, teardown_c, print_c = [], [], []
   for i, (arg, array) in enumerate(zip(kernel_args, inputs)):
     ctype = _args.OPENCL_TYPES[array.dtype]
@@ -30,7 +62,14 @@ def gen_data_blocks(kernel_args: typing.List[_args.KernelArg],
     format_specifier = _args.FORMAT_SPECIFIERS.get(array.dtype, None)
 
     if arg.is_pointer:
-      array_str = to_array_str(array)
+      fill_loop = to_fill_loop_str(f"host_{i}", array) if compact_data else None
+      if fill_loop:
+        setup_c.append(f"""\
+    {ctype} host_{i}[{array.size}];
+{fill_loop}""")
+      else:
+        setup_c.append(f"""\
+    {ctype} host_{i}[{array.size}] = {to_array_str(array)};""")
 
       flags = "CL_MEM_COPY_HOST_PTR"
       if arg.is_const:
@@ -39,7 +78,6 @@ def gen_data_blocks(kernel_args: typing.List[_args.KernelArg],
         flags += " | CL_MEM_READ_WRITE"
 
       setup_c.append(f"""\
-    {ctype} host_{i}[{array.size}] = {array_str};
     cl_mem dev_{i} = clCreateBuffer(ctx, {flags}, sizeof({ctype}) * {array.size}, &host_{i}, &err);
     check_error("clCreateBuffer", err);
     err = clSetKernelArg(kernel, {i}, sizeof(cl_mem), &dev_{i});
@@ -80,7 +118,7 @@ def emit_c(src: str, inputs: np.array, gsize: typing.Optional[driver.NDRange],
            lsize: typing.Optional[driver.NDRange], timeout: int = -1,
            optimizations: bool = True, profiling: bool = False,
            debug: bool = False, compile_only: bool = False,
-           create_kernel: bool = True) -> np.array:
+           create_kernel: bool = True, compact_data: bool = True) -> np.array:
   """
   Generate C code to drive kernel.
 
@@ -109,6 +147,11 @@ def emit_c(src: str, inputs: np.array, gsize: typing.Optional[driver.NDRange],
       If 'compile_only' parameter is set, this parameter determines whether
       to create a kernel object after compilation. This requires a kernel
       name.
+  compact_data: bool, optional
+      If true, initialize input buffers which have a closed form, such as
+      those produced by the ARANGE, ZEROS, and ONES generators, using a loop
+      rather than an array literal. This greatly reduces the size and compile
+      time of drivers with large global sizes.
 
   Returns
   -------
@@ -388,7 +431,8 @@ int main(int argc, char** argv) {{
 
   if not compile_only:
     args = _args.GetKernelArguments(src)
-    setup_block, teardown_block, print_block = gen_data_blocks(args, inputs)
+    setup_block, teardown_block, print_block = gen_data_blocks(
+        args, inputs, compact_data=compact_data)
     c += f"""
 {setup_block}
 
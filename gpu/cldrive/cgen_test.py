@@ -0,0 +1,63 @@
+"""Unit tests for //gpu/cldrive/cgen.py."""
+import numpy as np
+import pytest
+import sys
+from absl import app
+
+from gpu.cldrive import cgen
+from gpu.cldrive import data
+from gpu.cldrive import driver
+
+
+def test_to_fill_loop_str_arange():
+  """Sequential values are filled using the loop index."""
+  src = cgen.to_fill_loop_str("host_0", np.arange(10).astype(np.int32))
+  assert "j < 10;" in src
+  assert "host_0[j] = (int) j;" in src
+
+
+def test_to_fill_loop_str_zeros():
+  """Constant values are filled using a literal."""
+  src = cgen.to_fill_loop_str("host_0", np.zeros(10, dtype=np.float32))
+  assert "host_0[j] = 0.0;" in src
+
+
+def test_to_fill_loop_str_ones_bool():
+  """Boolean values are filled using integer literals."""
+  src = cgen.to_fill_loop_str("host_0", np.ones(10, dtype=np.dtype("bool")))
+  assert "host_0[j] = 1;" in src
+
+
+def test_to_fill_loop_str_arange_bool():
+  """Booleans do not wrap like integers, so have no closed form."""
+  array = np.arange(10).astype(np.dtype("bool"))
+  assert cgen.to_fill_loop_str("host_0", array) is None
+
+
+def test_to_fill_loop_str_random():
+  """Arbitrary values have no closed form."""
+  assert cgen.to_fill_loop_str(
+      "host_0", np.array([3, 1, 2], dtype=np.int32)) is None
+
+
+@pytest.mark.parametrize("generator", list(data.Generator))
+def test_emit_c_compact_data(generator: data.Generator):
+  """Only random data is emitted as an array literal."""
+  src = "kernel void A(global float* a, const int b) {}"
+  inputs = data.MakeData(src, 4096, generator)
+  c = cgen.emit_c(src, inputs, driver.NDRange(1, 1, 1),
+                  driver.NDRange(1, 1, 1))
+  assert ("float host_0[4096] = {" in c) == (generator == data.Generator.RAND)
+  c = cgen.emit_c(src, inputs, driver.NDRange(1, 1, 1),
+                  driver.NDRange(1, 1, 1), compact_data=False)
+  assert "float host_0[4096] = {" in c
+
+
+def main(argv):
+  """Main entry point."""
+  del argv
+  sys.exit(pytest.main([__file__, "-vv"]))
+
+
+if __name__ == "__main__":
+  app.run(main)
@@ -1,13 +1,14 @@
 import collections
+import multiprocessing
+import multiprocessing.connection
 import numpy as np
+import os
 import pickle
-import re
+import queue
 import sys
 import typing
 from contextlib import suppress
 from signal import Signals
-from subprocess import PIPE, Popen
-from tempfile import NamedTemporaryFile
 
 from gpu.cldrive import args as _args
 from gpu.cldrive import env as _env
@@ -107,6 +108,74 @@ class NDRange(collections.namedtuple('NDRange', ['x', 'y', 'z'])):
     return NDRange(x, y, z)
 
 
+class WorkerPool(object):
+  """A pool of long-running porcelain workers for an OpenCL environment.
+
+  Each worker is a subprocess which creates an OpenCL context and command
+  queue once, and then executes kernels sent to it over a pipe. This avoids
+  paying for interpreter start up and context creation on every kernel run.
+  Input and output arrays are sent as raw buffers. If a kernel exceeds its
+  timeout, the worker is killed and a new one is started for the next job.
+
+  A pool may be shared by multiple threads. Each kernel run blocks until a
+  worker is free.
+  """
+
+  def __init__(self, env: _env.OpenCLEnvironment, num_workers: int = 1):
+    """Instantiate a worker pool.
+
+    Workers are started lazily, on their first job.
+
+    Args:
+      env: The OpenCL environment to run kernels in.
+      num_workers: The number of workers in the pool.
+    """
+    err.assert_or_raise(isinstance(env, _env.OpenCLEnvironment), ValueError,
+                        "env argument is of incorrect type")
+    self.env = env
+    self.workers = [_Worker(env) for _ in range(num_workers)]
+    self._idle = queue.Queue()
+    for worker in self.workers:
+      self._idle.put(worker)
+
+  def __enter__(self) -> 'WorkerPool':
+    return self
+
+  def __exit__(self, *args) -> None:
+    self.Close()
+
+  def Close(self) -> None:
+    """Stop all of the workers in the pool."""
+    for worker in self.workers:
+      worker.Stop()
+
+  def DriveKernel(self, src: str, inputs: np.array,
+                  gsize: typing.Union[typing.Tuple[int, int, int], NDRange],
+                  lsize: typing.Union[typing.Tuple[int, int, int], NDRange],
+                  timeout: int = -1, optimizations: bool = True,
+                  profiling: bool = False, debug: bool = False) -> np.array:
+    """Drive an OpenCL kernel using a worker from the pool.
+
+    See DriveKernel() for a description of the arguments, return value, and
+    exceptions.
+    """
+    job, data = _MakeJob(self.env, src, inputs, gsize, lsize, optimizations,
+                         profiling, debug)
+    worker = self._idle.get()
+    try:
+      outputs, log = worker.Run(job, data, timeout)
+    finally:
+      self._idle.put(worker)
+    if profiling:
+      for line in log:
+        print(line, file=sys.stderr)
+    # Build the array element-wise, since outputs may differ in length.
+    outputs_array = np.empty(len(outputs), dtype=object)
+    for i, output in enumerate(outputs):
+      outputs_array[i] = output
+    return outputs_array
+
+
 def DriveKernel(env: _env.OpenCLEnvironment, src: str, inputs: np.array,
                 gsize: typing.Union[typing.Tuple[int, int, int], NDRange],
                 lsize: typing.Union[typing.Tuple[int, int, int], NDRange],
@@ -115,7 +184,8 @@ def DriveKernel(env: _env.OpenCLEnvironment, src: str, inputs: np.array,
   """Drive an OpenCL kernel.
 
   Executes an OpenCL kernel on the given environment, over the given inputs.
-  Execution is performed in a subprocess.
+  Execution is performed in a subprocess. To run many kernels, use a
+  WorkerPool, which reuses the subprocess and its OpenCL context.
 
   Args:
     env: The OpenCL environment to run the kernel in.
@@ -146,13 +216,23 @@ def DriveKernel(env: _env.OpenCLEnvironment, src: str, inputs: np.array,
     >>> DriveKernel(env, src, inputs, gsize=(5,1,1), lsize=(1,1,1)) # doctest: +SKIP
     array([[ 2,  4,  6,  8, 10]], dtype=int32)
   """
+  with WorkerPool(env) as pool:
+    return pool.DriveKernel(src, inputs, gsize, lsize, timeout=timeout,
+                            optimizations=optimizations, profiling=profiling,
+                            debug=debug)
 
-  def Log(*args, **kwargs):
-    """Log a message to stderr."""
-    if debug:
-      print("[cldrive] ", end="", file=sys.stderr)
-      print(*args, **kwargs, file=sys.stderr)
 
+def _MakeJob(env: _env.OpenCLEnvironment, src: str, inputs: np.array,
+             gsize: typing.Union[typing.Tuple[int, int, int], NDRange],
+             lsize: typing.Union[typing.Tuple[int, int, int], NDRange],
+             optimizations: bool, profiling: bool,
+             debug: bool) -> typing.Tuple[typing.Dict[str, typing.Any],
+                                          typing.List[np.array]]:
+  """Validate the arguments to a kernel run and build a worker job.
+
+  Returns:
+    A tuple of the job description and the list of input arrays.
+  """
   # Assert input types.
   err.assert_or_raise(isinstance(env, _env.OpenCLEnvironment), ValueError,
                       "env argument is of incorrect type")
@@ -177,7 +257,7 @@ def DriveKernel(env: _env.OpenCLEnvironment, src: str, inputs: np.array,
   args = _args.GetKernelArguments(src)
 
   # Check that the number of inputs is correct.
-  args_with_inputs = [i for i, arg in enumerate(args)
+  args_with_inputs = [arg for arg in args
                       if not arg.address_space == 'local']
   err.assert_or_raise(len(args_with_inputs) == len(inputs), ValueError,
                       "Kernel expects {} inputs, but {} were provided".format(
@@ -188,75 +268,201 @@ def DriveKernel(env: _env.OpenCLEnvironment, src: str, inputs: np.array,
     err.assert_or_raise(len(x), ValueError, f"Input {i} has size zero")
 
   # Copy inputs into the expected data types.
-  data = np.array([np.array(d).astype(a.numpy_type)
-                   for d, a in zip(inputs, args)])
+  data = [np.ascontiguousarray(np.array(d).astype(a.numpy_type))
+          for d, a in zip(inputs, args_with_inputs)]
 
   job = {
-    "env": env,
     "src": src,
     "args": args,
-    "data": data,
     "gsize": gsize,
     "lsize": lsize,
     "optimizations": optimizations,
-    "profiling": profiling
+    "profiling": profiling,
+    "debug": debug,
   }
+  return job, data
 
-  with NamedTemporaryFile('rb+', prefix='cldrive-', suffix='.job') as tmp_file:
-    porcelain_job_file = tmp_file.name
 
-    # Write job file.
-    pickle.dump(job, tmp_file)
-    tmp_file.flush()
+class _Worker(object):
+  """The parent process end of a porcelain worker."""
 
-    # Enforce timeout using sigkill.
-    if timeout > 0:
-      cli = ["timeout", "--signal=9", str(int(timeout))]
-    else:
-      cli = []
-    cli += [sys.executable, __file__, porcelain_job_file]
-
-    cli_str = " ".join(cli)
-    Log("Porcelain invocation:", cli_str)
-
-    # Fork and run.
-    process = Popen(cli, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = process.communicate()
-    status = process.returncode
-
-    if debug:
-      print(stdout.decode('utf-8').strip(), file=sys.stderr)
-      print(stderr.decode('utf-8').strip(), file=sys.stderr)
-    elif profiling:
-      # Print profiling output when not in debug mode.
-      for line in stderr.decode('utf-8').split('\n'):
-        if re.match(r'\[cldrive\] .+ time: [0-9]+\.[0-9]+ ms', line):
-          print(line, file=sys.stderr)
-    Log(f"Porcelain return code: {status}")
-
-    # Test for non-zero exit codes. The porcelain subprocess catches exceptions
-    # and completes gracefully, so a non-zero return code is indicative of a
-    # more serious problem.
-    #
-    # FIXME: I'm seeing a number of SIGABRT return codes which I can't explain.
-    # However, ignoring them seems to not cause a problem ...
-    if status != 0 and status != -Signals['SIGABRT'].value:
-      # A negative return code means a signal. Try and convert the value into a
-      # signal name.
+  def __init__(self, env: _env.OpenCLEnvironment,
+               main: typing.Optional[typing.Callable[
+                 [multiprocessing.connection.Connection,
+                  _env.OpenCLEnvironment], None]] = None):
+    """Instantiate a worker.
+
+    Args:
+      env: The OpenCL environment to run kernels in.
+      main: The main loop of the worker process. Defaults to _WorkerMain().
+        Must be a module level function, so that it can be pickled.
+    """
+    self.env = env
+    self.main = main or _WorkerMain
+    self.process = None
+    self.conn = None
+
+  def Start(self) -> None:
+    """Start the worker subprocess."""
+    # Spawn rather than fork, since OpenCL implementations are not fork-safe.
+    context = multiprocessing.get_context('spawn')
+    self.conn, child_conn = context.Pipe()
+    self.process = context.Process(
+        target=self.main, args=(child_conn, self.env), daemon=True)
+    self.process.start()
+    child_conn.close()
+
+  def Stop(self) -> None:
+    """Kill the worker subprocess, if running."""
+    if self.process:
+      self.conn.close()
+      # Process.kill() requires Python >= 3.7.
+      with suppress(ProcessLookupError):
+        os.kill(self.process.pid, Signals.SIGKILL)
+      self.process.join()
+      self.process, self.conn = None, None
+
+  def Run(self, job: typing.Dict[str, typing.Any], data: typing.List[np.array],
+          timeout: int) -> typing.Tuple[typing.List[np.array],
+                                        typing.List[str]]:
+    """Execute a job on the worker.
+
+    Returns:
+      A tuple of the output arrays and the profiling log.
+
+    Raises:
+      TimeoutError: If the job does not complete within timeout seconds.
+      PorcelainError: If the worker process dies.
+    """
+    if not self.process:
+      self.Start()
+    try:
+      self.conn.send(job)
+      _SendArrays(self.conn, data)
+      if not self.conn.poll(timeout if timeout > 0 else None):
+        self.Stop()
+        raise TimeoutError(timeout)
+      return_value = self.conn.recv()
+      outputs = _RecvArrays(self.conn)
+    except (EOFError, BrokenPipeError, ConnectionResetError):
+      # The worker died. A negative exit code means a signal. Try and convert
+      # the value into a signal name.
+      self.process.join()
+      status = self.process.exitcode
+      self.process, self.conn = None, None
       with suppress(ValueError):
         status = Signals(-status).name
+      raise PorcelainError(status)
+    if return_value["err"]:  # Porcelain raised an exception, re-raise it.
+      raise return_value["err"]
+    return outputs, return_value["log"]
+
+
+def _SendArrays(conn: multiprocessing.connection.Connection,
+                arrays: typing.List[np.array]) -> None:
+  """Send a list of arrays as a header and raw buffers."""
+  conn.send([(array.dtype.str, array.shape) for array in arrays])
+  for array in arrays:
+    conn.send_bytes(np.ascontiguousarray(array))
+
+
+def _RecvArrays(
+    conn: multiprocessing.connection.Connection) -> typing.List[np.array]:
+  """Receive a list of arrays sent by _SendArrays()."""
+  arrays = []
+  for dtype, shape in conn.recv():
+    array = np.empty(shape, dtype=dtype)
+    conn.recv_bytes_into(memoryview(array).cast('B'))
+    arrays.append(array)
+  return arrays
+
+
+def _WorkerMain(conn: multiprocessing.connection.Connection,
+                env: _env.OpenCLEnvironment) -> None:
+  """The main loop of a porcelain worker process."""
+  cl, ctx, queue_ = None, None, None
+  while True:
+    try:
+      job = conn.recv()
+    except EOFError:
+      return
+    data = _RecvArrays(conn)
+    outputs, log, error = [], [], None
+    try:
+      if not ctx:
+        import pyopencl as cl
+        platform = cl.get_platforms()[env.platform_id]
+        device = platform.get_devices()[env.device_id]
+        ctx = cl.Context([device])
+        queue_ = cl.CommandQueue(
+            ctx, properties=cl.command_queue_properties.PROFILING_ENABLE)
+      outputs, log = _RunJob(cl, ctx, queue_, job, data)
+    except Exception as e:
+      error = e
+      # Not all OpenCL exceptions can be pickled.
+      try:
+        pickle.dumps(error)
+      except Exception:
+        error = RuntimeError(str(e))
+    conn.send({"err": error, "log": log})
+    _SendArrays(conn, outputs)
+
+
+def _RunJob(cl, ctx, queue_, job: typing.Dict[str, typing.Any],
+            data: typing.List[np.array]) -> typing.Tuple[typing.List[np.array],
+                                                         typing.List[str]]:
+  """Execute a kernel in a porcelain worker.
 
-      if status == "SIGKILL":
-        raise TimeoutError(timeout)
-      else:
-        raise PorcelainError(status)
-
-    # Read result.
-    tmp_file.seek(0)
-    return_value = pickle.load(tmp_file)
-    outputs = return_value["outputs"]
-    error = return_value["err"]
-    if error:  # Porcelain raised an exception, re-raise it.
-      raise error
+  Returns:
+    A tuple of the output arrays and the profiling log.
+  """
+  gsize, lsize = job["gsize"], job["lsize"]
+  build_opts = [] if job["optimizations"] else ["-cl-opt-disable"]
+  if not job["debug"]:
+    build_opts.append("-w")
+  program = cl.Program(ctx, job["src"]).build(build_opts)
+  kernel = program.all_kernels()[0]
+
+  # Local memory is sized to the scalar global size, or the size of the largest
+  # input, whichever is bigger.
+  buf_size = max([gsize.product] + [x.size for x in data])
+  mf = cl.mem_flags
+  data_iter = iter(data)
+  arg_tuples = []
+  for arg in job["args"]:
+    if arg.address_space == "local":
+      nbytes = buf_size * arg.numpy_type.itemsize * arg.vector_width
+      arg_tuples.append(ArgTuple(hostdata=None, devdata=cl.LocalMemory(nbytes)))
+    elif arg.is_pointer:
+      hostdata = next(data_iter)
+      flags = mf.COPY_HOST_PTR | (mf.READ_ONLY if arg.is_const else
+                                  mf.READ_WRITE)
+      arg_tuples.append(ArgTuple(
+          hostdata=hostdata,
+          devdata=cl.Buffer(ctx, flags, hostbuf=hostdata)))
     else:
-      return outputs
+      hostdata = next(data_iter)
+      arg_tuples.append(ArgTuple(hostdata=hostdata, devdata=hostdata))
+  kernel.set_args(*[a.devdata for a in arg_tuples])
+
+  log = []
+
+  def Profile(name: str, event) -> None:
+    if job["profiling"]:
+      elapsed_ms = (event.profile.end - event.profile.start) / 1000000
+      log.append(f"[cldrive] {name} time: {elapsed_ms:.6f} ms")
+
+  event = cl.enqueue_nd_range_kernel(queue_, kernel, gsize, lsize)
+  event.wait()
+  Profile("Kernel", event)
+
+  outputs = []
+  for arg, arg_tuple in zip(job["args"], arg_tuples):
+    if arg.address_space == "local":
+      continue
+    if arg.is_pointer and not arg.is_const:
+      event = cl.enqueue_copy(queue_, arg_tuple.hostdata, arg_tuple.devdata,
+                              is_blocking=True)
+      Profile("Device -> host transfer", event)
+    outputs.append(arg_tuple.hostdata)
+  return outputs, log
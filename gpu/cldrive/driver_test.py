@@ -1,6 +1,8 @@
 """Unit tests for //gpu/cldrive/driver.py."""
+import multiprocessing
 import numpy as np
 import pytest
+import signal
 import sys
 from absl import app
 
@@ -197,6 +199,87 @@ def test_profiling():
   testlib.Assert2DArraysAlmostEqual(outputs, outputs_gs)
 
 
+def test_SendArrays_RecvArrays():
+  """Arrays are sent between processes as raw buffers."""
+  arrays = [np.arange(16).astype(np.int32),
+            np.arange(8).astype(np.float64).reshape(2, 4),
+            np.array([True, False])]
+  parent_conn, child_conn = multiprocessing.Pipe()
+  driver._SendArrays(parent_conn, arrays)
+  received = driver._RecvArrays(child_conn)
+  assert len(received) == len(arrays)
+  for x, y in zip(received, arrays):
+    assert x.dtype == y.dtype
+    np.testing.assert_array_equal(x, y)
+
+
+def test_WorkerPool_invalid_sizes():
+  """Invalid arguments are rejected before a worker is started."""
+  with driver.WorkerPool(env.OclgrindOpenCLEnvironment()) as pool:
+    with pytest.raises(ValueError):
+      pool.DriveKernel("kernel void A() {}", [],
+                       gsize=(4, 1, 1), lsize=(8, 1, 1))
+    assert not pool.workers[0].process
+
+
+@pytest.fixture(scope='function')
+def fake_worker() -> driver._Worker:
+  """A test fixture which yields a worker that does not require OpenCL."""
+  worker = driver._Worker(None, main=testlib.FakeWorkerMain)
+  yield worker
+  worker.Stop()
+
+
+def test_Worker_Run(fake_worker: driver._Worker):
+  """A worker returns its outputs, and is reused for subsequent jobs."""
+  outputs, log = fake_worker.Run({}, [np.arange(4, dtype=np.int32)], -1)
+  assert len(outputs) == 1
+  np.testing.assert_array_equal(outputs[0], [0, 2, 4, 6])
+  assert outputs[0].dtype == np.int32
+  _, log2 = fake_worker.Run({}, [], -1)
+  assert log == log2 == [str(fake_worker.process.pid)]
+
+
+def test_Worker_Run_timeout(fake_worker: driver._Worker):
+  """A worker which times out is killed, and restarted for the next job."""
+  _, log = fake_worker.Run({}, [], -1)
+  process = fake_worker.process
+  with pytest.raises(driver.TimeoutError):
+    fake_worker.Run({'sleep': 60}, [], 1)
+  assert not process.is_alive()
+  assert not fake_worker.process
+  _, log2 = fake_worker.Run({}, [], -1)
+  assert fake_worker.process.is_alive()
+  assert log2 != log
+
+
+def test_Worker_Run_exit(fake_worker: driver._Worker):
+  """A worker which exits raises PorcelainError with its exit status."""
+  with pytest.raises(driver.PorcelainError) as e_info:
+    fake_worker.Run({'exit': 3}, [], -1)
+  assert e_info.value.status == 3
+  # A new worker is started for the next job.
+  outputs, _ = fake_worker.Run({}, [np.ones(2)], -1)
+  np.testing.assert_array_equal(outputs[0], [2, 2])
+
+
+def test_Worker_Run_signal(fake_worker: driver._Worker):
+  """A worker killed by a signal raises PorcelainError with the signal name."""
+  with pytest.raises(driver.PorcelainError) as e_info:
+    fake_worker.Run({'signal': signal.SIGSEGV}, [], -1)
+  assert e_info.value.status == 'SIGSEGV'
+
+
+def test_Worker_Run_error(fake_worker: driver._Worker):
+  """An exception raised in a worker is re-raised, and the worker survives."""
+  fake_worker.Run({}, [], -1)
+  process = fake_worker.process
+  with pytest.raises(ValueError, match='bad kernel'):
+    fake_worker.Run({'error': ValueError('bad kernel')}, [], -1)
+  fake_worker.Run({}, [], -1)
+  assert fake_worker.process is process
+
+
 # TODO: Difftest against cl_launcher from CLSmith for a CLSmith kernel.
 
 @pytest.mark.skip(reason="FIXME(cec)")
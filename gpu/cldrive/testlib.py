@@ -1,8 +1,13 @@
 """Shared testing utilities."""
+import multiprocessing.connection
 import numpy as np
+import os
+import time
 import typing
 from numpy import testing as nptest
 
+from gpu.cldrive import driver
+
 
 def ListOfListsToNumpy(list_of_lists: typing.List[list]) -> np.array:
   """Convert list of lists to 2D numpy array."""
@@ -36,3 +41,30 @@ class DevNullRedirect(object):
   def __exit__(self, *args):
     sys.stdout = self.stdout
     sys.stderr = self.stderr
+
+
+def FakeWorkerMain(conn: multiprocessing.connection.Connection, env) -> None:
+  """A porcelain worker main loop which does not require OpenCL.
+
+  Follows the protocol of driver._WorkerMain(). Each job is a dict. If it has a
+  'sleep' key, the worker sleeps for that many seconds. If it has an 'exit' key,
+  the worker process exits with that status, and if it has a 'signal' key, the
+  worker process sends itself that signal. If it has an 'error' key, that
+  exception is returned. Otherwise the inputs are returned doubled, and the log
+  contains the pid of the worker.
+  """
+  del env
+  while True:
+    try:
+      job = conn.recv()
+    except EOFError:
+      return
+    data = driver._RecvArrays(conn)
+    time.sleep(job.get('sleep', 0))
+    if 'exit' in job:
+      os._exit(job['exit'])
+    if 'signal' in job:
+      os.kill(os.getpid(), job['signal'])
+    error = job.get('error')
+    conn.send({'err': error, 'log': [str(os.getpid())]})
+    driver._SendArrays(conn, [] if error else [x * 2 for x in data])